@@ -3,6 +3,21 @@ import json
 import utime
 import machine
 
+from watchible import urc, payload
+from watchible.sequencer import Sequencer, Step
+from watchible.identity import Identity
+from watchible.outbox import Outbox
+from watchible.samples import Samples
+from watchible.delta import Delta
+from watchible.psm import Schedule
+from watchible.sleepsync import SleepSync
+from watchible.energy import Profiler, command
+from watchible import register
+from watchible.radio import Radio
+from watchible.transcript import Recorder
+from watchible.alarm import Alarm
+from watchible.modem import Modem, MQTTOPENED, MQTTCLOSED, MQTTCONNECTED, MQTTFAILED, delivered
+
 # import _thread
 
 # Create a lock to share states read from the modem
@@ -11,6 +26,27 @@ import machine
 # Use UART2 to talk to the BC66 modem
 modem = machine.UART(1, 115200, timeout=100, timeout_char=100, rxbuf=2*1024)
 
+# The ccid, imei and model kept in flash between wakes
+identity = Identity()
+
+# Reports that couldn't be published, sent on the next connect
+outbox = Outbox()
+
+# Readings taken while the modem sleeps, sent with the next report
+samples = Samples()
+
+# The fields last published, reports only carry what changed with a full one every delta.KEYFRAME
+delta = Delta()
+
+# The PSM timers, picked each round from the battery and the alarms
+schedule = Schedule()
+
+# When the modem leaves PSM by the Pico's clock, learned from its PSM events
+sync = SleepSync()
+
+# The last signal the modem reported, poor coverage puts reports off
+radio = Radio()
+
 # These pins are defined on the Watchible board
 water_alarm = machine.Pin( 2, machine.Pin.IN, machine.Pin.PULL_UP)
 alarm_led   = machine.Pin( 3, machine.Pin.OUT, machine.Pin.PULL_DOWN)
@@ -22,14 +58,14 @@ pico_led    = machine.Pin(25, machine.Pin.OUT)
 APN = "iot.1nce.net"
 #APN = "iot.nb"
 
-MQTTOPENED       = 1
-MQTTNOTOPENED    = 2
-MQTTCLOSED       = 3
-MQTTCONNECTING   = 4
-MQTTCONNECTED    = 5
+PAYLOAD = 'json'        # 'json', or 'packed' for watchible.payload, decode with python/host/decode.py
+SAMPLE_MS = 3600000     # Take a reading this often while asleep, lightsleep can't go past 72 minutes
+PROFILE = False         # Time each phase of a wake, print it and add it to the next report as energy
+WAKE_EARLY = 900        # Seconds the Pico wakes before the modem's PSM sleep ends, until sync has learned it
+RECORD = False          # Keep every modem line in /transcript.log, replay it with python/host/replay.py
 
-alarm_set = False
-last_alarm = None
+# Every modem line with its ticks_us, when RECORD is set
+recorder = Recorder() if RECORD else None
 
 
 def time_str():
@@ -45,28 +81,7 @@ def time_str():
     return s
 
 
-def callback(p):
-    """
-    Alarm interrupt callback, wake up the modem by hitting the reset pin
-    :param p:
-    """
-    global last_alarm, alarm_set
-
-    now = time.time()
-
-    # Check to see it the alarm has gone off already in the last hour
-    if not last_alarm or now - last_alarm > 3600:
-        print(f'Alarm: {water_alarm.value()}')
-        alarm_set = True
-
-        # Trigger the modem to wake up
-        psm_eint.value(0)
-        time.sleep(1)
-        psm_eint.value(1)
-        last_alarm = now
-
-# Set up the interrupt for the alarm
-water_alarm.irq(trigger=machine.Pin.IRQ_FALLING, handler=callback)
+alarm = Alarm(water_alarm, psm_eint)
 
 
 def temperature():
@@ -79,273 +94,102 @@ def temperature():
     return str(27 - (adc_voltage - 0.706) / 0.001721)
 
 
-class BC66:
-    psm = False
-    brom = False
-    registered = False
+def battery():
+    """
+    Read the battery millivolts on VSYS, the Pico has it through a 1/3 divider on ADC 3
+    :return: str: millivolts, as cbc gives them
+    """
+    adc = machine.ADC(3)
+    return str(adc.read_u16() * 3 * 3300 // 65535)
 
-    ccid = None
-    imei = None
-    battery = None
-    ip_address = None
-    last_command = None
-    state = None
-    modem_model = None
 
+@urc.handlers
+class BC66(Modem):
+    """
+    The shared driver with the Watchible report
+    """
     clock = time_str()
 
     def __init__(self):
+        super().__init__(modem, reset, pwr_reset, sync=sync, radio=radio, recorder=recorder)
         self.power_reset()
+        self.ready()
 
-    def power_reset(self):
-        pwr_reset.value(0)
-        time.sleep_ms(500)
-        pwr_reset.value(1)
-        time.sleep_ms(500)
-        pwr_reset.value(0)
-        reset.value(0)
-
-    def reset(self):
-        reset.value(1)
-        time.sleep_ms(100)
-        reset.value(0)
-
-    def report(self):
-        """
-        Report current state
-        :return:
-        """
-        msg = json.dumps({'ccid': self.ccid,
-                          'imei': self.imei,
-                          'alarm': True if water_alarm.value() == 0 else False,
-                          'temperature': temperature(),
-                          'volts': self.battery,
-                          'timestamp': self.clock,
-                          'modem':self.modem_model
-                          })
-        return msg
-
-    def CEREG(self, result):
-        """
-        Result of asking for device registration status eg +CEREG: 1,1\r\n'
-        :param result parameters
-        :return:
-        """
-        result = result.replace('\r\n', '').split(',')
-        try:
-            # If it's an unsolicited response it will be 1 element <stat>
-            if len(result) == 1 and int(result[0]) in (1, 5):
-                self.registered = True
-
-            # If it's a solicited response it will be <n><stat>
-            elif len(result) >= 2:
-                if int(result[1].strip()) in (1, 5):
-                    self.registered = True
-
-        except ValueError as e:
-            print(f"ValueError:{e} for CEREG:{result}")
-
-    def QCCID(self, result):
+    def fields(self):
         """
-        Get the ccid eg +QCCID: 8901240202100251217F\r\n
-        :param result
+        Current state
+        :return: dict
         """
-        self.ccid = result.strip()
-
-    def CGSN(self, result):
+        fields = {'ccid': self.ccid,
+                  'imei': self.imei,
+                  'alarm': True if water_alarm.value() == 0 else False,
+                  'temperature': temperature(),
+                  'volts': self.battery,
+                  'timestamp': self.clock,
+                  'modem':self.modem_model,
+                  'samples': samples.rows,
+                  'rsrp': radio.rsrp,
+                  'snr': radio.snr,
+                  'ecl': radio.ecl
+                  }
+
+        # What the alarm did since the last report, if it went off
+        alarms = alarm.summary()
+        if alarms:
+            fields['alarms'] = alarms
+
+        # Where the time went in the last wake
+        if profiler.last:
+            fields['energy'] = profiler.last
+        return fields
+
+    def report(self, fields=None):
         """
-        Get the imei eg
-        :param result +CGSN: 867997035586592\r\n
+        Report current state, as json or packed as PAYLOAD says
+        :param fields: what to report, all of fields() if None
+        :return: str
         """
-        self.imei = result.strip()
+        if fields is None:
+            fields = self.fields()
 
-    def QMTOPEN(self, result):
-        """
-        Result of opening the MQTT channel eg. +QMTOPEN: 0,0\r\n
-        :param result: parameters returned
-        """
-        result = result.split(',')
-        try:
-            if int(result[1]) == 0:
-                self.state = MQTTOPENED
-            else:
-                self.state = MQTTNOTOPENED
-                print("Failed to open MQTT")
-
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTOPEN:{result}")
-
-    def MQSTAT(self, result):
-        """
-        Indicates an MQTT status change +QMTSTAT: <TCP_connectID>,<err_ code> 1,2,3
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        try:
-            if int(result[1]) > 0:
-                self.state = MQTTCLOSED
-                pico_led.value(0)
-
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTSTAT:{result}")
-
-    def QMTCLOSE(self, result):
-        """
-        Close the MQTT connection (reminder you can't go in PSM with this open)
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        if int(result[1]) == 0:
-            self.state = MQTTCLOSED
+        if PAYLOAD == 'packed':
+            return payload.text(payload.pack(fields, utime.time()))
+        return json.dumps(fields)
 
-    def QMTCONN(self, result):
+    def QMTSTAT(self, result):
         """
-        # +QMTCONN: <TCP_connectID>,<result>[,<ret_code>]
-        :param result:
-        :return:
+        The MQTT connection closed, the led goes off with it
         """
-        result = result.split(',')
-        try:
-            if int(result[1]) == 0:
-                self.state = MQTTCONNECTED
-            elif int(result[1]) == 2:
-                self.state = MQTTCONNECTING
-            else:
-                self.state = MQTTCLOSED
-                print(f"Failed to connect to connect: {result[0]} {result[1]}")
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTCONN:{result}")
-
-    def MQTRECV(self, result):
-        """
-        +QMTRECV: 0,0,"device/status","it works" If PSM sleeping this will not happen
-        :param self:
-        :param result:
-        :return:
-        """
-        try:
-            result = result.split(',')
-            line = result[3]
-            print(line)
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTRECV:{result}")
-
-    def CBC(self, result):
-        """
-        # Get the current battery level eg. +CBC: 0,0,3275 Battery level
-        :param result: str: remaining return
-        :return:
-        """
-        result = result.split(',')
-        try:
-            self.battery = result[2].replace('\r\n', '').strip()
-        except:
-            self.battery  = result[0].replace('\r\n', '').strip()
+        super().QMTSTAT(result)
+        if self.state == MQTTCLOSED:
+            pico_led.value(0)
 
-    def CCLK(self, result):
+    def identify(self):
         """
-        Get the current clock time from the network eg. b'+CCLK: 2023/03/09,14:02:31GMT-5\r\n'
-        """
-        self.clock = result.replace('\r\n', '').strip()
-
-    def QNBIOTEVENT(self, result):
-        """ in command: # Indicate QNBIOT events, show the state of PSM
+        Read the ccid, only ask for the imei and model if the SIM changed or they were never kept
+        :return: None
         """
-        if 'ENTER PSM' in result:
-            self.psm = True
-
-        elif 'EXIT PSM' in result:
-            self.psm = False
+        self.query('qccid')
+        if identity.known(self.ccid):
+            self.imei = identity.imei
+            self.modem_model = identity.model
+            return
 
-    def IP(self, result):
-        """
-        IP status
-        :param self:
-        :param result:
-        :return:
-        """
-        if len(result.split('.')) == 4:
-            self.ip_address = result
+        self.query('cgmm')
+        self.query('cgsn=1')
+        identity.update(self.ccid, self.imei, self.modem_model)
 
-    def CGDCONT(self, result):
-        """
-        # "+CGDCONT: 1,"IPV4V6","iot.nb","30.2.17.172",0,0,0,,,,,,0,,0"
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        try:
-            ip_address = result[3].split('.')
-            if len(ip_address) == 4:
-                self.ip_address = result[3]
-        except IndexError:
-            pass
-
-    def at(self, command):
-        """
-        Send a formatted AT command
-        :param command: the command to send
-        :return: None
-        """
-        if not command.startswith('at'):
-            command = 'at+' + command
-        command = command + '\r\n'
-        # print(f'sending {command}')
-        modem.write(bytes(command, 'utf-8'))
-        self.last_command = command
-
-    def reader(self):
-        """
-        Read anything on the modem port
-        :return:
-        """
-        data = ''
-        if modem.any():
-            while not '\n' in data:
-                data = modem.readline()
-                if not data:
-                    break
-                
-            print(data)
-            try:
-                data = data.decode('utf-8', 'ignore')
-            except Exception as e:
-                print(f"Error:{str(e)} reading data")
-                return None
-
-            # A reboot occurred
-            if 'BROM' in data or 'RDY' in data:
-                self.brom = True
-                return data
-
-            elif 'OK' in data or 'ERROR' in data:
-                self.last_command = None
-            
-            elif 'Quectel' in data:
-                self.modem_model = data.replace('\r\n','')
-
-            elif data.startswith('+'):
-                try:
-                    status, result = data.split(':', 1)
-                except ValueError as e:
-                    print(f"Error:{str(e)} for {data}")
-                    status = data
-                else:
-                    status = status.replace('+', '').strip()
-                    if hasattr(self, status):
-                        func = getattr(self, status)
-                        func(result)
-            return data
-        else:
-            return None
 
-    def wait(self,command):
-        self.at(command)
-        while not self.reader():
-            if self.last_command == command:
-                continue
+# Time each phase of a wake, hooked on the modem so the calls don't change
+profiler = Profiler()
+if PROFILE:
+    waits = {MQTTOPENED: 'open', MQTTCONNECTED: 'connect'}
+    profiler.wrap(BC66, 'at', command)
+    profiler.wrap(BC66, 'wait', command)
+    profiler.wrap(Sequencer, 'begin', lambda step: command(step.sent))
+    profiler.wrap(Sequencer, 'wait', lambda step: waits.get(step.needs, profiler.phase))
+    profiler.wrap(BC66, 'power_reset', lambda: 'reset')
+    profiler.wrap(BC66, 'reset', lambda: 'reset')
 
 
 def power_sleep():
@@ -353,47 +197,66 @@ def power_sleep():
     
 
 def main():
-    global alarm_set, modem, alarm_led
+    global modem, alarm_led
     bc66 = BC66()
     
-    # Ask for the model
-    bc66.wait('cgmm')
+    # Ask for the ccid, the model and imei are asked for only with a new SIM
+    bc66.identify()
  
-    # There are 2 models of Quectel chip
-    if bc66.modem_model == 'Quectel_BC66':
-        commands = [
-            'qsclk=0',                              # Turn off PSM while we send commands
-            'cclk?',                                # Get the time
-            'qccid',                                # Get the ccid
-            'cgsn=1',                               # Get IMEI
-            'cbc',                                  # Get the battery level
-            'qnbiotevent=1,1',                      # Report PSM events
-            'cpsms=1,,,"00100010","00100001"',      # Set PSM 12 hours, 1 min active
-            'qmtopen=0,"54.196.22.131",1883',       # Open the MQTT broker
-            'qmtconn=0,"{}","watchible","w@tch_0ne"',# Connect to MQTT broker
-            'qmtpub=0,0,0,0,"device/state","{}"',   # Publish message
-            'qmtclose=0',                           # Close the connection ( required for PSM mode )
-            'qsclk=1'                               # Turn PSM back on
-        ]
-    else:
-        commands = [
-            'qsclk=0',                              # Turn off PSM while we send commands
-            'qccid',                                # Get the ccid
-            'cgsn=1',                               # Get IMEI
-            'cbc',                                  # Get the battery level
-            'cclk?',                                # Get the time
-            'qledmode=0',                           # Set the netlight
-            'qnbiotevent=1,1',                      # Report PSM events
-            'cpsms=1,,,"00101100","00100001"',      # Set PSM 12 hours, 1 min active
-            'qmtopen=1,"54.196.22.131",1883',       # Open the MQTT broker
-            'qmtconn=1,"{}","watchible","w@tch_0ne"',# Connect to MQTT broker
-            'qmtpub=1,0,0,0,"device/state"',        # Publish message
-            'qmtclose=1',                           # Close the connection ( required for PSM mode )
-            'qsclk=1'                               # Turn PSM back on
-        ]
+    def report(full=False):
+        """
+        The report to publish, the alarm has been reported once it goes out
+        :param full: all the fields, otherwise only what changed since the last one published
+        :return: str
+        """
+        alarm.set = False
+        return bc66.report(delta.changes(bc66.fields(), full))
+
+    # The cpsms command is set each round from schedule
+    psm = Step(schedule.cpsms())
+
+    # There are 2 models of Quectel chip, what differs is in watchible.modem.MODELS. Steps without needs
+    # are sent together on one command line
+    tcp = bc66.capability('tcp')
+    connect = [
+        Step('qsclk=0'),                                    # Turn off PSM while we send commands
+        Step('cclk?'),                                      # Get the time
+        Step('qnbiotevent=1,1'),                            # Report PSM events
+        psm,                                                # Set PSM as schedule picked it
+        Step(f'qmtopen={tcp},"54.196.22.131",1883'),        # Open the MQTT broker
+        Step(lambda: f'qmtconn={tcp},"{bc66.ccid}","watchible","w@tch_0ne"',
+             needs=MQTTOPENED, fails=MQTTFAILED)            # Connect to MQTT broker
+    ]
+    if bc66.capability('ledmode'):
+        connect.insert(3, Step('qledmode=0'))               # Set the netlight
+
+    close = [
+        Step(f'qmtclose={tcp}'),                            # Close the connection ( required for PSM mode )
+        Step('qsclk=1')                                     # Turn PSM back on
+    ]
+
+    def publish(message):
+        """
+        The step that publishes a message once connected. It's only 'ok', and the message taken out of the
+        outbox, once +QMTPUB says the broker has it
+        :param message: str, or a function that returns it when it's sent
+        :return: Step
+        """
+        if not bc66.capability('prompt'):
+            text = message if callable(message) else lambda: message
+            return Step(lambda: f'qmtpub={tcp},0,0,0,"device/state","{text()}"',
+                        needs=MQTTCONNECTED, fails=MQTTFAILED, expect=b'+QMTPUB', check=delivered)
+
+        return Step(f'qmtpub={tcp},0,0,0,"device/state"', data=message, needs=MQTTCONNECTED, fails=MQTTFAILED,
+                    expect=b'+QMTPUB', check=delivered)
 
     # Loop forever
     while True:
+        if PROFILE:
+            if bc66.battery is None:
+                bc66.query('cbc')                             # The first wake hasn't read the battery yet
+            profiler.start(bc66.battery)
+
         '''
         bc66.wait('cfun=0')
         bc66.wait(f'qcgdefcont="IPV4V6","{APN}"')               # If BC660K-GL you set default with this
@@ -403,7 +266,7 @@ def main():
         '''
         bc66.wait('cgdcont?')
 
-        if alarm_set:
+        if alarm.set:
             alarm_led.value(1)
         else:
             alarm_led.value(0)
@@ -411,100 +274,105 @@ def main():
         bc66.wait('cereg=1')                                  # Is the network registered, request <n><stat>
         pico_led.value(1)                                     # Light the led on the pico
 
-        # Wait 60 seconds for the modem to register on the network
-        for _ in range(120):
-            if bc66.registered:
+        # Wait for +CEREG to say the modem registered on the network, asking less often the longer it takes
+        # If things get out of sync, start over. BC66() resets the modem
+        if not register.wait(bc66, modem):
+            pico_led.value(0)
+            if PROFILE:
+                profiler.end(bc66.battery)
+            return
+
+        # How good the signal is where the modem registered, and the battery for picking the PSM timers
+        radio.clear()
+        bc66.query('qeng=0;+cbc')
+
+        # Reports that didn't go out before are published first, then this one. It's full if there were any
+        queued = list(outbox.pending())
+        published = [publish(message) for _, message in queued]
+        latest = publish(lambda: report(full=bool(queued)))
+
+        # Pick the PSM timers from the battery now and how often the alarm went off
+        alarms = alarm.summary()
+        schedule.update(bc66.battery, alarms['count'] if alarms else 0)
+        psm.command = schedule.cpsms()
+        sync.expect((schedule.period - schedule.awake) * 1000)
+
+        # At the edge of coverage every message is repeated, so unless it's an alarm the report goes to the
+        # outbox and only the settings are sent, until radio.DEFER_MAX rounds have been put off
+        steps = connect + published + [latest] + close
+        if radio.defer(alarm.set):
+            print(f"Deferred {radio.deferred}: rsrp {radio.rsrp} snr {radio.snr} ecl {radio.ecl}")
+            queued, published = [], []
+            latest.result = 'deferred'
+            steps = connect[:-2] + close[-1:]
+
+        # Send each command, forget the MQTT state of the last round first
+        bc66.state = None
+        sequence = Sequencer(bc66, modem, steps)
+        done = sequence.run()
+        sequence.report()
+
+        # Take what was published out of the outbox, and keep this report if it didn't go out
+        end = None
+        for step, (offset, _) in zip(published, queued):
+            if step.result != 'ok':
                 break
+            end = offset
 
-            time.sleep(5)
-            bc66.at('cereg?')
-            while bc66.reader():
-                if bc66.brom:
-                    return
+        if end is not None:
+            outbox.sent(end)
 
-        # If things get out of sync, start over
+        if latest.result == 'ok':
+            delta.sent()
         else:
+            outbox.put(report(full=True))
+
+        # The readings and alarms went out with the report or are in the outbox with it
+        samples.clear()
+        alarm.clear()
+
+        if not done:
             pico_led.value(0)
+            if PROFILE:
+                profiler.end(bc66.battery)
             return
 
-        # Send each command
-        index = 0
-        while index < len(commands):
-
-            # Make sure there are no pending commands before sending the next
-            if not bc66.last_command:
-                command = None
-
-                # If this is qmtconnn, make sure we opened first
-                if 'conn' in commands[index]:
-                    if bc66.state == MQTTOPENED:
-                        command = commands[index].format(bc66.ccid)
-
-                    # If you tried to open and it failed, try again
-                    elif bc66.state == MQTTCLOSED:
-                        index += 2
-
-                # If this is a qmtpub(lish), make sure we are connected
-                elif 'pub' in commands[index]:
-                    if bc66.state == MQTTCONNECTED:
-                        command = commands[index].format(bc66.report())
-                        alarm_set = False
-
-                    # If you are not connected, close and wait for the next round
-                    elif bc66.state == MQTTCLOSED:
-                        index += 1
-
-                # Just write the current command
-                else:
-                    command = commands[index]
-
-                if command:
-                    bc66.at(command)
-                    index += 1
-
-            # See what the modem returns after sending commands
-            while data := bc66.reader():
-                if bc66.brom:
-                    pico_led.value(0)
-                    return
-
-                # If you sent the cert command send the cert a line at a time
-                if '>' in data:
-                    if bc66.state == MQTTCONNECTED:
-                        modem.write(bc66.report())
-                    else:
-                        with open('python/certs/mosquitto.org.crt', 'rb') as f:
-                            size = 0
-                            for line in f.readlines():
-                                size += modem.write(line)
-                                time.sleep_ms(100)
-                        # print(f"wrote {size} bytes for cert")
-
-                    modem.write(bytes([26]))
-
         # Done sending commands, wait for the modem to tell its in PSM mode
         bc66.psm = False
         pico_led.value(0)
 
         # Make sure everything has been sent and wait for psm
+        if PROFILE:
+            profiler.switch('psm')
         while not bc66.psm:
             bc66.reader()
 
-        # Wait a little less than the PSM time. Try to sync lightsleep and PSM as close as possible
-        # Sleep for 1 hour. The max you can sleep is 72 minutes
-        # PSM is 12 hours
+        if PROFILE:
+            profiler.end(bc66.battery)
+
+        # Wait a little less than the PSM time, sync has learned when the modem really leaves PSM
+        # Sleep SAMPLE_MS at a clip taking a reading each time. The max you can sleep is 72 minutes
+        # PSM is schedule.period, 12 hours when it's quiet
         # https://github.com/micropython/micropython/commit/b004e7e397577d95404fd31aec68a5c54904a48c
-        now = utime.time() + 42300
-        print("now:{}".format(now))
+        remaining = sync.remaining_ms()
+        if remaining is None:
+            remaining = (schedule.period - WAKE_EARLY) * 1000
+
+        if recorder:
+            recorder.flush()
+
+        wake = time.ticks_add(time.ticks_ms(), remaining)
+        print("wake in {} ms".format(remaining))
         while True:
             print("sleep @{}".format(time_str()))
-            machine.lightsleep(3600000)		# Sleep for an hour at a clip
-            if alarm_set:
+            machine.lightsleep(min(SAMPLE_MS, max(time.ticks_diff(wake, time.ticks_ms()), 1)))
+            samples.add(utime.time(), temperature(), battery(), water_alarm.value() == 0)
+            if alarm.set:
                 print('alarm')
+                sync.forget()
                 break
-            
-            t = utime.time()
-            if t >= now:
+
+            if time.ticks_diff(wake, time.ticks_ms()) <= 0:
                 break
 
         print("wake up @{}".format(time_str()))
@@ -4,6 +4,12 @@ import utime
 import machine
 import uasyncio as asyncio
 
+from watchible import urc, certs, register, inbox
+from watchible.linebuf import LineFramer
+from watchible.alarm import Alarm
+from watchible.radio import Radio
+from watchible.modem import MODELS, DEFAULT, connection
+
 from config import host, port, cacert, clientkey, clientcert
 
 # Use UART2 to talk to the BC66 modem
@@ -29,34 +35,7 @@ MQTTCONNECTED   = 8
 MQTTCONNECTING  = 9
 MQTTDISCONNECT  = 10
 
-
-last_alarm = None
-alarm_set = False
-
-
-def callback(p):
-    """
-    Alarm interrupt callback, wake up the modem by hitting the reset pin
-    :param p:
-    """
-    global last_alarm, alarm_set
-
-    now = time.time()
-
-    # Check to see it the alarm has gone off already in the last hour
-    if not last_alarm or now - last_alarm > 3600:
-        print(f'Alarm: {water_alarm.value()}')
-        alarm_set = True
-
-        # Trigger the modem to wake up from PSM
-        psm_eint.value(0)
-        time.sleep(1)
-        psm_eint.value(1)
-        last_alarm = now
-
-
-# Set up the interrupt for the alarm
-water_alarm.irq(trigger=machine.Pin.IRQ_FALLING, handler=callback)
+alarm = Alarm(water_alarm, psm_eint)
 
 
 def time_str():
@@ -82,30 +61,86 @@ def temperature():
     return str(27 - (adc_voltage - 0.706) / 0.001721)
 
 
+@urc.handlers
 class MQTTClient:
-    tcp_id = 0
+    modem_model = None
     ccid = None
     clock = time_str()
-    state = RESET
     battery = None
     ip_address = ""
+    _state = RESET
     _last_command = None
 
+    # The command waiting on a reply in send()
+    _expect = None
+    _reply = None
+    _ok = False
+
+    # Set to a watchible.transcript.Recorder to keep every line read
+    recorder = None
+
+    # Print each line read to debug, it copies every line out of the LineFramer
+    echo = False
+
     # Defined call back handlers
     _connect_handler = None
-    _subscribe_handler = None
     _disconnect_handler = None
     _publish_handler = None
 
+    # The BC660K-GL keeps messages in its buffers until they're read out, instead of sending them straight away
+    buffered = False
+
     def __init__(self, config):
         """
         """
-        self._subscribe_handler = config.get('on_subscribe')
+        # Messages go to the callbacks for their topic, on_subscribe gets all of them
+        self.router = inbox.Router()
+        if config.get('on_subscribe'):
+            self.router.route('#', config['on_subscribe'])
+
+        self.buffered = config.get('buffered', False)
+        self._stored = 0
+        self._received = asyncio.Event()
+
         self._connect_handler = config.get('on_connect')
         self._disconnect_handler = config.get('on_disconnect')
         self._publish_handler = config.get('on_publish')
 
-    def power_reset(self):
+        self.provisioned = certs.Provisioned()
+        self.radio = Radio()
+
+        self._lock = asyncio.Lock()
+        self._done = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    @property
+    def tcp_id(self):
+        """
+        The MQTT connect id this model uses
+        """
+        return self.capability('tcp')
+
+    def capability(self, name):
+        """
+        What this model does, see watchible.modem.MODELS
+        :param name: e.g. 'tcp'
+        :return: the value for the model, or for DEFAULT if the model isn't known
+        """
+        return MODELS.get(self.modem_model, MODELS[DEFAULT])[name]
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        """
+        Setting the state wakes up anything in wait_for()
+        """
+        self._state = value
+        self._changed.set()
+
+    async def power_reset(self):
         """
         Reset the modem by powering down then up
         """
@@ -135,24 +170,39 @@ class MQTTClient:
         :param psm: POWER SAVING MODE, do not use for MQTT.
         :return: True when done
         """
-        self.at('qccid')
+        # The ccid only changes with the SIM, so it's read once after the modem starts
+        if self.ccid is None:
+            await self.send('qccid', 'QCCID')
+
+        # The model says which connect id to use
+        if self.modem_model is None:
+            await self.send('cgmm')
 
         if not psm:
-            self.at('qsclk=0') 							# Turn off PSM, It must be off for MQTT
-            await asyncio.sleep_ms(100)
-            
-        else:
-            self.at('qnbiotevent=1,1')  				# Report PSM events
-            self.at('cpsms=1,,,"00101100","00100001"')  # Set PSM 12 hours, 1 min active
-            self.at('qsclk=1')
+            await self.send('qsclk=0') 							# Turn off PSM, It must be off for MQTT
 
-        # Wait to read the CEREG value to know we are connected to the network
+        else:
+            await self.send('qnbiotevent=1,1')  				# Report PSM events
+            await self.send('cpsms=1,,,"00101100","00100001"')  # Set PSM 12 hours, 1 min active
+            await self.send('qsclk=1')
+
+        # Wait for +CEREG to say we are connected to the network, asking less often the longer it takes
+        await self.send('cereg=1')
+        poll = register.POLL_MS
+        start = time.ticks_ms()
         while not self.state == REGISTERED:
-            self.at('cereg?')
-            self.at('csq')
-            await asyncio.sleep_ms(2000)
+            if time.ticks_diff(time.ticks_ms(), start) > register.TIMEOUT_MS:
+                print("Not registered, resetting the modem")
+                await self.reset()
+                await self.send('cereg=1')
+                poll = register.POLL_MS
+                start = time.ticks_ms()
+
+            await self.send('cereg?', 'CEREG')
+            if not self.state == REGISTERED:
+                await self.wait_for(REGISTERED, timeout=poll)
+                poll = min(poll * 2, register.LONGEST_MS)
 
-        await asyncio.sleep(1)
         return True
 
     def CEREG(self, result):
@@ -161,22 +211,21 @@ class MQTTClient:
         There are 2 types solicited and unsolicited
         e.g.: +CEREG: 1,5\r\n' solicited
         You can loose a connection for an instance and still retain the MQTT setup if it comes back
-        :param result: the string after :
+        :param result: bytes after the colon
         :return:
         """
-        result = result.replace('\r\n', '').split(',')
         try:
             # If it's an unsolicited response it will be 1 element <stat>
-            if len(result) == 1 and int(result[0]) in (1, 5):
+            if urc.count(result) == 1 and urc.number(result, 0) in (1, 5):
                 self.state = REGISTERED
 
             # If it's a solicited response it will be <n><stat>
-            elif len(result) == 2:
-                if int(result[1]) in (1, 5):
+            elif urc.count(result) == 2:
+                if urc.number(result, 1) in (1, 5):
                     self.state = REGISTERED
 
         except ValueError as e:
-            print(f"ValueError:{e} for CEREG:{result}")
+            print(f"ValueError:{e} for CEREG:{bytes(result)}")
 
     # All capital letter functions are read returns from the modem e.g. +QCCID:
     def QCCID(self, result):
@@ -185,17 +234,16 @@ class MQTTClient:
         :param result:  string of numbers as text for the SIM CCID :
         :return:
         """
-        self.ccid = result.strip()
+        self.ccid = urc.text(result)
 
     def QMTOPEN(self, result):
         """
         Open MQTT host e.g. +QMTOPEN: <tcp connection>, <state>
-        :param result: the string after :
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
         try:
-            if int(result[1]) == 0:
+            if urc.number(result, 1) == 0:
                 self.state = MQTTOPENED
                 print("Opened MQTT")
             else:
@@ -203,95 +251,98 @@ class MQTTClient:
                 print("Failed to open MQTT")
 
         except ValueError as e:
-            print(f"ValueError:{e} for QMTOPEN:{result}")
+            print(f"ValueError:{e} for QMTOPEN:{bytes(result)}")
 
-    def MQTSTAT(self, result):
+    def QMTSTAT(self, result):
         """
         Unsolicited MQTT status change +QMTSTAT: <TCP_connectID>,<err_ code> 1,2,3
-        :param result: the string after :
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
-        print(f"MQTT connection closed {result}")
+        print(f"MQTT connection closed {bytes(result)}")
         try:
-            if int(result[1]) > 0:
+            if urc.number(result, 1) > 0:
                 self.state = MQTTCLOSED
                 print("MQTT connecion closed")
                 if self._disconnect_handler:
-                    self._disconnect_handler(result)
+                    self._disconnect_handler(urc.fields(result))
 
             elif self._connect_handler:
-                self._connect_handler(result)
+                self._connect_handler(urc.fields(result))
 
         except ValueError as e:
-            print(f"ValueError:{e} for QMTSTAT:{result}")
+            print(f"ValueError:{e} for QMTSTAT:{bytes(result)}")
 
     def QMTCLOSE(self, result):
         """
         Close the current MQTT connection.
-        :param result:
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
-        if int(result[1]) == 0:
+        if urc.number(result, 1) == 0:
             self.state = REGISTERED
 
     def QMTCONN(self, result):
         """
-        # +QMTCONN: <TCP_connectID>,<result>[,<ret_code>]
-        :param result: the string after :
+        The result of qmtconn or the state qmtconn? asks for, read like the driver does
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
         try:
-            if int(result[1]) == 3:
+            connected, connecting = connection(result)
+            if connected:
                 self.state = MQTTCONNECTED
                 #print(f"MQTT connected")
                 if self._connect_handler:
-                    self._connect_handler(result)
+                    self._connect_handler(urc.fields(result))
 
-            elif int(result[1]) in (1, 2):
+            elif connecting:
                 self.state = MQTTCONNECTING
                 #print(f"MQTT connecting")
 
         except ValueError as e:
-            print(f"ValueError:{e} for QMTCONN:{result}")
+            print(f"ValueError:{e} for QMTCONN:{bytes(result)}")
     
     def QMTPUB(self, result):
         """
         Result of a publish command e.g. +QMTPUB: 0,0,0\r\n'
         """
-        result = result.split(',')
         if self._publish_handler:
-            self._publish_handler(result)
+            self._publish_handler(urc.fields(result))
 
     def QMTRECV(self, result):
         """
-        +QMTRECV: 0,0,"device/status","it works" If PSM sleeping this will not happen
-        :param result: the string after :
+        A message on a subscribed topic +QMTRECV: 0,0,"device/status","it works" goes to the router. If buffered
+        the modem only says which buffer has it +QMTRECV: 0,2, and receive() reads it out.
+        If PSM sleeping this will not happen
+        :param result: bytes after the colon
         :return:
         """
         try:
-            result = result.split(',')
-            line = result[3]
-            print(line)
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTRECV:{result}")
-
-        if self._subscribe_handler:
-            self._subscribe_handler(result)
+            found, value, topic, payload = inbox.parse(result)
+        except (ValueError, IndexError) as e:
+            print(f"ValueError:{e} for QMTRECV:{bytes(result)}")
+            return
+
+        if found == inbox.MESSAGE:
+            self.router.dispatch(topic, payload)
+            return
+
+        # A buffer, or from qmtrecv? all the buffers, that hold a message
+        self._stored |= 1 << value if found == inbox.STORED else value
+        if self._stored:
+            self._received.set()
     
     def CBC(self, result):
         """
         # Get the current battery level eg. +CBC: 0,0,3275 Battery level
-        :param result: str: remaining return
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
         try:
-            self.battery = result[2].replace('\r\n', '').strip()
+            self.battery = urc.text(result, 2)
         except:
-            self.battery  = result[0].replace('\r\n', '').strip()
+            self.battery  = urc.text(result, 0)
 
     def CCLK(self, result):
         """
@@ -300,36 +351,54 @@ class MQTTClient:
         :param result: What is left after the command
         Get the current clock time from the network eg. b'+CCLK: 2023/03/09,14:02:31GMT-5\r\n'
         """
-        self.clock = result.replace('\r\n', '').strip()
+        self.clock = urc.text(result)
+
+    def CSQ(self, result):
+        """
+        Signal strength eg. +CSQ: 24,99
+        """
+        self.radio.csq(result)
+
+    def CESQ(self, result):
+        """
+        Extended signal quality eg. +CESQ: 99,99,255,255,20,45
+        """
+        self.radio.cesq(result)
+
+    def QENG(self, result):
+        """
+        Serving cell eg. +QENG: 0,2506,2,65,"0D43E68",-67,-4,-63,20,5,"3A98",0,,2
+        """
+        self.radio.qeng(result)
 
     def QNBIOTEVENT(self, result):
         """ Unsolicited QNBIOT events, show the state of PSM
         """
-        if 'ENTER PSM' in result:
+        if urc.contains(result, b'ENTER PSM'):
             self.psm = True
 
-        elif 'EXIT PSM' in result:
+        elif urc.contains(result, b'EXIT PSM'):
             self.psm = False
 
     def IP(self, result):
         """
         IP status
-        :param result:
+        :param result: bytes after the colon
         :return:
         """
-        if len(result.split('.')) == 4:
-            self.ip_address = result
+        ip_address = urc.text(result)
+        if len(ip_address.split('.')) == 4:
+            self.ip_address = ip_address
 
     def CGDCONT(self, result):
         """
         # "+CGDCONT: 1,"IPV4V6","iot.nb","30.2.17.172",0,0,0,,,,,,0,,0"
-        :param result: the string after :
+        :param result: bytes after the colon
         :return:
         """
-        result = result.split(',')
-        ip_address = result[3].split('.')
-        if len(ip_address) == 4:
-            self.ip_address = result[3]
+        ip_address = urc.text(result, 3)
+        if len(ip_address.split('.')) == 4:
+            self.ip_address = ip_address
 
     def at(self, command):
         """
@@ -349,107 +418,187 @@ class MQTTClient:
         """
         This is the main task that reads everything coming from the modem. It changes the state as
         needed, and should run as long as the modem is up. It will call the appropriate function for all
-        command returns beginning with a plus sign
+        command returns beginning with a plus sign.
+        The UART is wrapped in a StreamReader so the task sleeps until the modem sends something, and a
+        line is handled as soon as its new line arrives instead of on the next poll.
         :return: Never
         """
+        stream = asyncio.StreamReader(modem)
+        rx = LineFramer(modem)
         while True:
-            if modem.any():
-                data = modem.readline()
-                print(data)
-                try:
-                    data = data.decode('utf-8', 'ignore')
-                except Exception as e:
-                    print(f"Error:{str(e)} reading data")
-                    continue
-
-                # Response to the last command
-                if 'OK' in data or 'ERROR' in data:
-                    continue
-
-                # On a reboot or press the reset button on the modem will return RDY
-                if 'RDY' in data:
-                    print("Ready")
-                    self.state = READY
-
-                # If the modem is expecting to read some data it will send the prompt >
-                elif '>' in data:
-                    self.state = READING
-
-                # Handle responses both solicited and unsolicited
-                elif data.startswith('+'):
-                    result = ""
-                    try:
-                        status, result = data.split(':', 1)
-                    except ValueError as e:
-                        print(f"Error:{str(e)} for {data}")
-                        status = data
-
-                    status = status.replace('+', '').strip()
-                    if hasattr(self, status):
-                        func = getattr(self, status)
-                        func(result)
-                    
+            # Reading one byte returns as soon as the UART is readable, readline() takes whatever else is there
+            rx.commit(await stream.readinto(rx.space(1)))
+            while (line := rx.readline()) is not None:
+                self.handle_line(line)
+
+    def handle_line(self, data):
+        """
+        Handle one line read from the modem
+        :param data: bytes or memoryview of the line
+        :return: None
+        """
+        if self.echo:
+            print(bytes(data))
+        if self.recorder:
+            self.recorder.record(data)
+
+        # Response to the last command, whole lines only so a payload that has OK or ERROR in it isn't one
+        if urc.error(data):
+            self.resolve(None)
+            return
+
+        # Handle responses both solicited and unsolicited
+        if urc.startswith(data, b'+'):
+            status = urc.dispatch(self, data)
+
+            # Replies to queries come before the OK, results of actions like QMTOPEN come after it
+            if status is not None and status == self._expect:
+                self._reply = urc.text(data[len(status) + 1:])
+                if self._ok:
+                    self.resolve(self._reply)
+
+        elif urc.equals(data, b'OK'):
+            self._ok = True
+            if self._expect == b'OK':
+                self.resolve('OK')
+            elif self._reply is not None:
+                self.resolve(self._reply)
+
+        # On a reboot or press the reset button on the modem will return RDY
+        elif urc.equals(data, b'RDY'):
+            print("Ready")
+            self.ccid = None
+            self.state = READY
+
+        # If the modem is expecting to read some data it will send the prompt >
+        elif urc.startswith(data, b'>'):
+            self.state = READING
+            if self._expect == b'>':
+                self.resolve('>')
+
+        # The answer to cgmm
+        elif urc.contains(data, b'Quectel'):
+            self.modem_model = urc.text(data)
+
+    def resolve(self, reply):
+        """
+        Finish the command waiting in send()
+        :param reply: what send() returns
+        :return: None
+        """
+        if self._expect:
+            self._reply = reply
+            self._expect = None
+            self._done.set()
+
+    async def send(self, command, expect=None, timeout=5000):
+        """
+        Send a command and wait for the modem to answer it. Only one command is outstanding at a time,
+        anyone else calling send() waits their turn.
+        :param command: command string to send to modem, or bytes to write as is e.g. Cntrl Z after data
+        :param expect: the reply to wait for e.g. 'QMTOPEN' or '>' for the prompt, None waits for OK
+        :param timeout: milliseconds to wait for the reply
+        :return: str: what followed the colon of the expected reply, 'OK' or '>'. None on ERROR or timeout
+        """
+        async with self._lock:
+            if expect is None:
+                self._expect = b'OK'
+            elif expect == '>':
+                self._expect = b'>'
             else:
-                await asyncio.sleep_ms(1000)
+                self._expect = b'+' + expect.encode()
+            self._reply = None
+            self._ok = expect == '>'
+            self._done.clear()
+
+            if isinstance(command, bytes):
+                modem.write(command)
+            else:
+                self.at(command)
+
+            try:
+                await asyncio.wait_for_ms(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Timeout waiting for {expect or 'OK'} after {command}")
+                self._expect = None
+                self._reply = None
+
+            return self._reply
 
     async def wait_for(self, state, query=None, timeout=None):
         """
         Wait for a particular state
         :param state: The state you need to wait for
         :param query: optional at query command to get the current state
-        :param timeout: optional timeout
-        :return: True when state happens (note, could add a timeout )
+        :param timeout: optional timeout in milliseconds
+        :return: True when state happens, False if it timed out
         """
+        start = time.ticks_ms()
         while True:
             if self.state == state:
                 return True
 
+            wait = 2000
+            if timeout is not None:
+                wait = min(wait, timeout - time.ticks_diff(time.ticks_ms(), start))
+                if wait <= 0:
+                    return False
+
             # You can force the query of a state by sending commands to return a state e.g. AT+CEREG?
+            # It goes through send() so its OK can't finish another command waiting there
             if query:
-                self.at(query)
-                # await asyncio.sleep(2)      # Give up to CPU so it can be read
+                await self.send(query)
+                if self.state == state:
+                    return True
 
-            await asyncio.sleep_ms(2000)
+            # Wake up as soon as the state changes, query again if it does not
+            self._changed.clear()
+            try:
+                await asyncio.wait_for_ms(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
 
     async def send_cert(self, current_state, cert_file):
         """
         Send the cert to the modem
         :param: current_state: current statue to restore
         :param cert_file: the file to open read and send to modem
-        :return: None
+        :return: True if the modem took it, False if it didn't give the prompt
         """
-        await self.wait_for(READING)
-        with open(cert_file, 'rb') as f:
-            size = 0
-            for line in f.readlines():
-                size += modem.write(line)
-                time.sleep_ms(100)
-        print(f"wrote {size} bytes for cert")
+        if not await self.wait_for(READING, timeout=5000):
+            self.state = current_state
+            return False
 
-        # Cntrl Z indicates to the modem that we are done writing data
-        modem.write(bytes([26]))
+        await certs.upload(modem, cert_file)
 
         # Restore the previous state
         self.state = current_state
 
+        # Cntrl Z indicates to the modem that we are done writing data
+        return await self.send(bytes([26])) is not None
+
     async def ssl(self):
         """
         Set up the ssl parameters to connect to AWS
         :return: True
         """
-        self.at('qsslcfg=0,0,"sslversion",4')
-        self.at('qsslcfg=0,0,"seclevel",2')  # Set security to client cert (1 server cert required)
+        current_state = self.state
+        await self.send('qsslcfg=0,0,"sslversion",4')
+        await self.send('qsslcfg=0,0,"seclevel",2')  # Set security to client cert (1 server cert required)
 
-        self.at('qsslcfg=0,0,"cacert"')  # Send a root cert
-        await self.send_cert(self.state, cacert)
+        # Send the root cert, client cert and client key, unless the modem already has them
+        for slot, cert_file in (('cacert', cacert), ('clientcert', clientcert), ('clientkey', clientkey)):
+            if not self.provisioned.needed(slot, cert_file):
+                continue
 
-        self.at('qsslcfg=0,0,"clientcert"')  # Send a client cert
-        await self.send_cert(self.state, clientcert)
+            # No prompt, the cert is sent again next time
+            if await self.send(f'qsslcfg=0,0,"{slot}"', '>') is None:
+                continue
 
-        self.at('qsslcfg=0,0,"clientkey"')  # Send a client key
-        await self.send_cert(self.state, clientkey)
+            if await self.send_cert(current_state, cert_file):
+                self.provisioned.sent(slot, cert_file)
 
-        self.at('qmtcfg="ssl",0,1,0,0')  # Turn on SSL for MQTT
+        await self.send('qmtcfg="ssl",0,1,0,0')  # Turn on SSL for MQTT
         return True
 
     async def open(self):
@@ -457,9 +606,16 @@ class MQTTClient:
         Open a connection to the host MQTT server
         :return:
         """
+        if self.buffered:
+            await self.send(f'qmtcfg="recv/mode",{self.tcp_id},1')  # Keep messages until they're read out
+
         command = f'qmtopen={self.tcp_id},"{host}",{port}'  # Open the MQTT broker
-        self.at(command)
-        await self.wait_for(MQTTOPENED)
+        await self.send(command, 'QMTOPEN', 75000)
+
+        # The modem may have lost the certs, send them again next time
+        if not self.state == MQTTOPENED:
+            self.provisioned.forget()
+        return self.state == MQTTOPENED
 
     async def connect(self):
         """
@@ -470,11 +626,11 @@ class MQTTClient:
             await self.open()
 
         command = f'qmtconn={self.tcp_id},"{self.ccid}"'  # Connect to MQTT broker
-        self.at(command)
+        await self.send(command, 'QMTCONN', 10000)
         await self.wait_for(MQTTCONNECTED, 'qmtconn?')
         return True
 
-    def publish(self, topic, message):
+    async def publish(self, topic, message):
         """
         Publish a message to a topic
         :param topic: topic string
@@ -482,47 +638,69 @@ class MQTTClient:
         :return:
         """
         current_state = self.state
-        command = f'qmtpub=0,0,0,0,"{topic}"'  # Publish message
-        self.at(command)
-
-        await self.wait_for(READING)
+        command = f'qmtpub={self.tcp_id},0,0,0,"{topic}"'  # Publish message
+        await self.send(command, '>')
         modem.write(message)
-        time.sleep_ms(100)
-
-        # Cntrl Z indicates that it's done writing
-        modem.write(bytes([26]))
 
         # Restore the previous state
         self.state = current_state
 
+        # Cntrl Z indicates that it's done writing
+        return await self.send(bytes([26]), 'QMTPUB', 15000)
+
+    async def signal(self):
+        """
+        Read the serving cell's signal into self.radio
+        :return: self.radio
+        """
+        self.radio.clear()
+        await self.send('qeng=0', 'QENG')
+        return self.radio
+
     async def report(self):
         """
         Report current state
         :return:
         """
-        self.at('cbc')  # Get the battery level
-        self.at('cclk?')
-        
-        while not self.battery:
-            await asyncio.sleep_ms(100)
-            
+        await self.send('cbc', 'CBC')  # Get the battery level
+        await self.send('cclk?', 'CCLK')
+
         msg = json.dumps({'ccid': self.ccid,
                           'alarm': True if water_alarm.value() == 0 else False,
                           'temperature': temperature(),
                           'volts': self.battery,
                           'timestamp': time_str(),
+                          'rsrp': self.radio.rsrp,
+                          'snr': self.radio.snr
                           })
         return msg
 
-    async def subscribe(self, topic):
+    async def subscribe(self, topic, callback=None):
         """
         Subscribe to a specific topic
-        :param topic: topic string
+        :param topic: topic string, with + and # wildcards
+        :param callback: function(topic, payload) for its messages, memoryviews only good during the call
         :return:
         """
+        if callback:
+            self.router.route(topic, callback)
+
         command = f'qmtsub={self.tcp_id},1,"{topic}",0'
-        self.at(command)
-        await asyncio.sleep_ms(100)
+        return await self.send(command, 'QMTSUB', 15000)
+
+    async def receive(self):
+        """
+        Read out the messages the modem buffered, run as a task next to reader() if buffered
+        The message comes back as a +QMTRECV before the OK and goes to the router like any other.
+        :return: Never
+        """
+        while True:
+            await self._received.wait()
+            self._received.clear()
+            for recv_id in range(inbox.BUFFERS):
+                if self._stored & (1 << recv_id):
+                    self._stored &= ~(1 << recv_id)
+                    await self.send(f'qmtrecv={self.tcp_id},{recv_id}')
 
     async def close(self):
         """
@@ -530,8 +708,7 @@ class MQTTClient:
         :return:
         """
         command = f'qmtclose={self.tcp_id}'
-        self.at(command)
-        await asyncio.sleep_ms(1000)
+        return await self.send(command, 'QMTCLOSE')
 
     @staticmethod
     def alarm_set():
@@ -1,12 +1,16 @@
 
 import uasyncio as asyncio
 
-from bc66 import MQTTClient
+from bc66 import MQTTClient, READY, REGISTERED, MQTTCONNECTED
+from watchible.energy import Profiler, command
+from watchible.transcript import Recorder
+
+RECORD = False          # Keep every modem line in /transcript.log, replay it with python/host/replay.py
 
 connected = False
 
-def on_subscribe(msg):
-    print(f"Recieved:{msg}")
+def on_subscribe(topic, payload):
+    print(f"Recieved:{bytes(topic)} {bytes(payload)}")
 
 
 def on_connect(*result):
@@ -17,6 +21,12 @@ def on_disconnect(*result):
     print(f"Disconnect:{result}")
     connected = False
 
+# Time each phase, hooked on the client so the calls don't change. A wait for any other state stays in the phase
+profiler = Profiler()
+phases = {READY: 'reset', REGISTERED: 'register', MQTTCONNECTED: 'connect'}
+profiler.wrap_async(MQTTClient, 'send', command)
+profiler.wrap_async(MQTTClient, 'wait_for', lambda state, *args, **kwargs: phases.get(state, profiler.phase))
+
 
 async def main(client):
     """
@@ -26,6 +36,8 @@ async def main(client):
     """
     global connected
     task = asyncio.create_task(client.reader())		# Start reading from the modem			
+    if client.buffered:
+        asyncio.create_task(client.receive())       # Read out the messages the modem buffered
     await client.reset() 							# Reset the modem so we are in a known space
 
     await client.network()							# Connect to the cellular network
@@ -35,8 +47,20 @@ async def main(client):
 
     while True:
         await asyncio.sleep(30)
+        profiler.start(client.battery)
+
+        # Unless it's an alarm, wait for a better signal at the edge of coverage
+        await client.signal()
+        if client.radio.defer(client.alarm_set()):
+            print(f"Deferred {client.radio.deferred}: rsrp {client.radio.rsrp} snr {client.radio.snr}")
+            profiler.end(client.battery)
+            continue
+
         message = await client.report()
         await client.publish('device/update', message)
+        profiler.end(client.battery)
+        if client.recorder:
+            client.recorder.flush()
 
 
 config = {'on_subscribe' : on_subscribe,
@@ -44,6 +68,8 @@ config = {'on_subscribe' : on_subscribe,
           'on_disconnect': on_disconnect}
 
 client = MQTTClient(config)
+if RECORD:
+    client.recorder = Recorder()
 
 try:
     asyncio.run(main(client))
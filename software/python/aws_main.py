@@ -3,7 +3,12 @@ import json
 import utime
 import machine
 
-from async.config  import host, cacert, clientkey, clientcert
+from watchible import urc, certs
+from watchible.alarm import Alarm
+from watchible.sleepsync import SleepSync
+from watchible.modem import Modem, RESET, MQTTOPENED, MQTTNOTOPENED, MQTTCONNECTED
+
+from config import host, cacert, clientkey, clientcert
 
 # import _thread
 
@@ -23,15 +28,6 @@ psm_eint 	= machine.Pin(15, machine.Pin.OUT, machine.Pin.PULL_UP)
 
 
 
-RESTART = 1
-RESET = 2
-REGISTERED = 3
-MQTTOPENED = 4
-MQTTNOTOPENED = 5
-MQTTCLOSED = 6
-MQTTCONNECTED = 7
-MQTTCONNECTING = 8
-MQTTNOTCONNECTED = 9
 SLEEP = 1
 
 
@@ -48,33 +44,19 @@ def time_str():
     return s
 
 
-alarm_set = False
-last_alarm = None
-
 
-def callback(p):
-    """
-    Alarm interrupt callback, wake up the modem by hitting the reset pin
-    :param p:
-    """
-    global last_alarm, alarm_set
+# The cert for each qsslcfg command, they are only sent when the modem doesn't have them already
+certificates = {'qsslcfg=0,0,"cacert"':     ('cacert', cacert),
+                'qsslcfg=0,0,"clientcert"': ('clientcert', clientcert),
+                'qsslcfg=0,0,"clientkey"':  ('clientkey', clientkey)}
+provisioned = certs.Provisioned()
 
-    now = time.time()
 
-    # Check to see it the alarm has gone off already in the last hour
-    if not last_alarm or now - last_alarm > 3600:
-        print(f'Alarm: {water_alarm.value()}')
-        alarm_set = True
+alarm = Alarm(water_alarm, psm_eint)
 
-        # Trigger the modem to wake up
-        psm_eint.value(0)
-        time.sleep(1)
-        psm_eint.value(1)
-        last_alarm = now
-
-
-# Set up the interrupt for the alarm
-water_alarm.irq(trigger=machine.Pin.IRQ_FALLING, handler=callback)
+# When the modem leaves PSM by the Pico's clock, 5 min. of PSM less 1 min. active to start with
+sync = SleepSync()
+sync.expect(240000)
 
 
 def temperature():
@@ -87,33 +69,17 @@ def temperature():
     return str(27 - (adc_voltage - 0.706) / 0.001721)
 
 
-class BC66:
-    psm = False
-    brom = False
-    ccid = None
-    imei = None
+@urc.handlers
+class BC66(Modem):
+    """
+    The shared driver with this main's report, a failed open has the certs sent again
+    """
     clock = time_str()
-    state = None
-    battery = None
-    ip_address = None
-    last_command = None
 
     def __init__(self):
+        super().__init__(modem, reset, pwr_reset, sync=sync)
         self.power_reset()
-
-    def power_reset(self):
-        pwr_reset.value(0)
-        time.sleep_ms(500)
-        pwr_reset.value(1)
-        time.sleep_ms(500)
-        pwr_reset.value(0)
-        reset.value(0)
-        self.state = RESET
-
-    def reset(self):
-        reset.value(1)
-        time.sleep_ms(100)
-        reset.value(0)
+        self.ready()
 
     def report(self):
         """
@@ -129,210 +95,28 @@ class BC66:
                           })
         return msg
 
-    def CEREG(self, result):
-        result = result.replace('\r\n', '').split(',')
-        try:
-            # If it's an unsolicited response it will be 1 element <stat>
-            if len(result) == 1 and int(result[0]) in (1, 5):
-                self.state = REGISTERED
-
-            # If it's a solicited response it will be <n><stat>
-            elif len(result) == 2:
-                if int(result[1]) in (1, 5):
-                    self.state = REGISTERED
-
-        except ValueError as e:
-            print(f"ValueError:{e} for CEREG:{result}")
-
-    def QCCID(self, result):
-        """
-        Get the ccid
-        :param result:
-        :return:
-        """
-        self.ccid = result.strip()
-
-    def QCGSN(self, result):
-        """
-        Get the imei
-        :param result:
-        :return:
-        """
-        self.imei = result.strip()
-
     def QMTOPEN(self, result):
         """
-        Open MQTT host
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        try:
-            if int(result[1]) == 0:
-                self.state = MQTTOPENED
-                print("Opened MQTT")
-            else:
-                self.state = MQTTNOTOPENED
-                print("Failed to open MQTT")
-
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTOPEN:{result}")
-
-    def MQTSTAT(self, result):
-        """
-        +QMTSTAT: <TCP_connectID>,<err_ code> 1,2,3
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        print(f"MQTT connecion closed {result}")
-        try:
-            if int(result[1]) > 0:
-                self.state = MQTTCLOSED
-                print("MQTT connecion closed")
-
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTSTAT:{result}")
-
-    def QMTCLOSE(self, result):
-        result = result.split(',')
-        if int(result[1]) == 0:
-            self.state = REGISTERED
-
-    def QMTCONN(self, result):
-        """
-        # +QMTCONN: <TCP_connectID>,<result>[,<ret_code>]
-        :param result:
-        :return:
-        """
-        result = result.split(',')
-        try:
-            if int(result[1]) == 3:
-                self.state = MQTTCONNECTED
-                print(f"MQTT connected")
-                
-            elif int(result[1]) in (1,2):
-                self.state = MQTTCONNECTING
-                print(f"MQTT connecting")
-            
-            else:
-                self.state = MQTTNOTCONNECTED
-                print(f"MQTT disconnected")
-        
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTCONN:{result}")
-
-    def MQTRECV(self, result):
-        """
-        +QMTRECV: 0,0,"device/status","it works" If PSM sleeping this will not happen
-        :param self:
-        :param result:
-        :return:
-        """
-        try:
-            result = result.split(',')
-            line = result[3]
-            print(line)
-        except ValueError as e:
-            print(f"ValueError:{e} for QMTRECV:{result}")
-
-    def CBC(self, result):
-        """
-        # Get the current battery level eg. +CBC: 0,0,3275 Battery level
-        :param result: str: remaining return
-        :return:
-        """
-        result = result.split(',')
-        try:
-            self.battery = result[2].replace('\r\n', '').strip()
-        except:
-            self.battery  = result[0].replace('\r\n', '').strip()
-
-
-    def CCLK(self, result):
-        """
-        :param result: What is left after the command
-        Get the current clock time from the network eg. b'+CCLK: 2023/03/09,14:02:31GMT-5\r\n'
-        """
-        self.clock = result.replace('\r\n', '').strip()
-
-    def QNBIOTEVENT(self, result):
-        """ in command: # Indicate QNBIOT events, show the state of PSM
-        """
-        if 'ENTER PSM' in result:
-            self.psm = True
-
-        elif 'EXIT PSM' in result:
-            self.psm = False
-
-    def IP(self, result):
-        """
-        IP status
-        :param result:
+        Open MQTT host, if it failed the modem may have lost the certs, send them again next time
+        :param result: bytes after the colon
         :return:
         """
-        if len(result.split('.')) == 4:
-            self.ip_address = result
+        super().QMTOPEN(result)
+        if self.state == MQTTNOTOPENED:
+            provisioned.forget()
 
-    def CGDCONT(self, result):
+    def wait_registered(self):
         """
-        # "+CGDCONT: 1,"IPV4V6","iot.nb","30.2.17.172",0,0,0,,,,,,0,,0"
-        :param result:
+        Wait to be registered on the network, what wait_state() did with the REGISTERED state
         :return:
         """
-        result = result.split(',')
-        ip_address = result[3].split('.')
-        if len(ip_address) == 4:
-            self.ip_address = result[3]
+        while not self.registered:
+            self.at('cereg?')
+            time.sleep(2)
 
-    def at(self, command):
-        """
-        send the command and preceed with +AT and end with cr nl
-        :param command:
-        :return:
-        """
-        if not command.startswith('at'):
-            command = 'at+' + command
-        command = command + '\r\n'
-
-        # print(f'sending {command}')
-        modem.write(bytes(command, 'utf-8'))
-        self.last_command = command
-
-    def reader(self):
-        if modem.any():
-            data = modem.readline()
-            print(data)
-            try:
-                data = data.decode('utf-8', 'ignore')
-            except Exception as e:
-                print(f"Error:{str(e)} reading data")
-                return None
-
-            # BROM come if the modem reboots
-            if 'BROM' in data:
-                self.state = RESTART
-                self.brom = True
-
-            elif 'OK' in data or 'ERROR' in data:
-                self.last_command = None
-
-            # Handle responses both solicited and unsolicited
-            elif data.startswith('+'):
-                try:
-                    status, result = data.split(':', 1)
-                except ValueError as e:
-                    print(f"Error:{str(e)} for {data}")
-                    status = data
-
-                status = status.replace('+', '').strip()
-                if hasattr(self, status):
-                    func = getattr(self, status)
-                    func(result)
-
-            return data
-        else:
-            return None
+            while self.reader():
+                pass
+        return True
 
     def wait_state(self, state, query):
         """
@@ -353,9 +137,8 @@ class BC66:
                 pass
 
 
-
 def main():
-    global alarm_set, modem
+    global modem
     bc66 = BC66()
     commands = ['qsclk=0',                              # Turn off PSM while we send commands
                 'cclk?',                                # Get the time
@@ -386,7 +169,7 @@ def main():
         pico_led.value(1)
 
         # Wait 60 seconds for the modem to register on the network
-        bc66.wait_state(REGISTERED, 'cereg?')
+        bc66.wait_registered()
         bc66.at('qccid')
 
         # Indicates we are talking to the modem ( this goes fast ) Don't use if measuring power
@@ -394,6 +177,7 @@ def main():
 
         # Send each command
         index = 0
+        uploading = None                                # The (slot, cert file) waiting on the OK
         while index < len(commands):
 
             # Make sure there are no pending commands before sending the next
@@ -419,6 +203,10 @@ def main():
                     bc66.wait_state(MQTTCONNECTED,'qmtconn?')
                     command = commands[index]
 
+                # Skip a cert the modem already has
+                elif commands[index] in certificates and not provisioned.needed(*certificates[commands[index]]):
+                    index += 1
+
                 # Just write the current command
                 else:
                     command = commands[index]
@@ -431,37 +219,25 @@ def main():
             while data := bc66.reader():
 
                 # If you sent the cert command send the cert a line at a time
-                if '>' in data:
+                if urc.startswith(data, b'>'):
                     if bc66.state == MQTTCONNECTED:
                         modem.write(bc66.report())
                     else:
-                        if 'cacert' in command:
-                            with open(cacert,'rb') as f:
-                                size = 0
-                                for line in f.readlines():
-                                    size += modem.write(line)
-                                    time.sleep_ms(100)
-                            print(f"wrote {size} bytes for cert")
-
-                        elif 'clientcert' in command:
-                            with open(clientcert,'rb') as f:
-                                size = 0
-                                for line in f.readlines():
-                                    size += modem.write(line)
-                                    time.sleep_ms(100)
-                            print(f"wrote {size} bytes for clientkey")
-
-                        elif 'clientkey' in command:
-                            with open(clientkey,'rb') as f:
-                                size = 0
-                                for line in f.readlines():
-                                    size += modem.write(line)
-                                    time.sleep_ms(100)
-                            print(f"wrote {size} bytes for clientkey")
+                        if command in certificates:
+                            uploading = certificates[command]
+                            certs.send_file(modem, uploading[1])
 
                     # Cntrl Z indicates that its done writing
                     modem.write(bytes([26]))
 
+                # The modem has the cert once it says OK to it, after an error it's sent again next time
+                elif uploading and urc.error(data):
+                    uploading = None
+
+                elif uploading and urc.equals(data, b'OK'):
+                    provisioned.sent(*uploading)
+                    uploading = None
+
         # Done sending commands, wait for the modem to tell its in PSM mode
         bc66.psm = False
         alarm_led.value(0)
@@ -471,9 +247,13 @@ def main():
         while not bc66.psm:
             bc66.reader()
 
-        # Wait a little less than the PSM time. Try to sync lightsleep and PSM as close as possible
-        machine.lightsleep(240000)  # In this case the sleep is 4 min. 30 secs. PSM is 5 min.
+        # Wait a little less than the PSM time, sync has learned when the modem really leaves PSM
+        remaining = sync.remaining_ms()
+        machine.lightsleep(240000 if remaining is None else remaining)     # PSM is 5 min. 1 min. of it active
+        if alarm.set:
+            sync.forget()
         bc66.state = RESET
+        bc66.registered = False
 
 
 if __name__ == '__main__':
@@ -9,6 +9,10 @@ import utime
 import machine
 import _thread
 
+from watchible import urc, certs
+from watchible.alarm import Alarm
+from watchible.modem import Modem, RESTART, MQTTOPENED, MQTTNOTOPENED, MQTTCONNECTED, MQTTNOTCONNECTED
+
 
 # Create a lock to share states read from the modem
 lock = _thread.allocate_lock()
@@ -25,10 +29,7 @@ pwr_reset   = machine.Pin(14, machine.Pin.OUT, machine.Pin.PULL_DOWN)
 psm_eint    = machine.Pin(15, machine.Pin.OUT, machine.Pin.PULL_UP)
 
 # Shared state varibles
-alarm_set = False
-last_alarm = None
 
-battery = None
 done = False
 
 
@@ -46,29 +47,7 @@ def time_str():
     return s
 
 
-def callback(p):
-    """
-    Alarm interrupt callback, wake up the modem by hitting the reset pin
-    :param p:
-    """
-    global last_alarm, alarm_set
-
-    now = time.time()
-
-    # Check to see it the alarm has gone off already in the last hour
-    if not last_alarm or now - last_alarm > 3600:
-        print('Alarm')
-        alarm_set = True
-
-        # Trigger the modem to wake up
-        psm_eint.value(0)
-        time.sleep(1)
-        psm_eint.value(1)
-        last_alarm = now
-
-
-# Set up the interrupt for the alarm
-water_alarm.irq(trigger=machine.Pin.IRQ_FALLING, handler=callback)
+alarm = Alarm(water_alarm, psm_eint)
 
 
 def temperature():
@@ -81,49 +60,15 @@ def temperature():
     return str(27 - (adc_voltage - 0.706)/0.001721)
 
 
-"""
-States the board is in
-"""
-STARTED          = 1
-RESET            = 2
-REGISTERED       = 3
-MQTTOPENED       = 4
-MQTTNOTOPENED    = 5
-MQTTCLOSED       = 6
-MQTTCONNECTED    = 7
-MQTTNOTCONNECTED = 8
-
-
-class BC66:
+class BC66(Modem):
     """
-    Basic functions of the BC66 modem to get it working
+    The shared driver, read by a separate thread
     """
-    ip         = None
-    psm        = False
-    ccid       = None
-    alarm      = None
-    status     = None
-    registered = False
+    alarm = None
 
     def __init__(self):
-        self.read = _thread.start_new_thread(self.reader, ())
-
-    def power_reset(self):
-        """
-        # Toggle the reset pin to get the modem going
-        :return:
-        """
-        # Toggle the reset pin to get the modem going
-        with lock:
-            done = False
-
-        pwr_reset.value(0)
-        time.sleep(.5)
-        pwr_reset.value(1)
-        time.sleep(.5)
-        pwr_reset.value(0)
-        reset.value(0)
-        self.state = STARTED
+        super().__init__(modem, reset, pwr_reset)
+        self.read = _thread.start_new_thread(self.listen, ())
 
     def network_ready(self, timeout=None):
         """
@@ -143,156 +88,30 @@ class BC66:
             time.sleep(1)
         return True
 
-    def reader(self):
+    def listen(self):
         """
-        Use a separate process thread to read messages from the modem
+        Use a separate process thread to read messages from the modem, the driver's reader handles them
         :return: Never
         """
         global done
         while True:
 
             # Look for anything coming from the modem
-            if modem.any():
-                try:
-                    line = modem.readline()
-                except Exception as e:
-                    print("Error reading uart {}".format(str(e)))
-                    continue
-
-                print(f'"{line}"')
-                try:
-                    line = line.decode('utf-8','ignore')
-                except Exception as e:
-                    print("Error:{} decoding line {}".format(str(e),line))
-                    continue
-
-                # If we got a line of code process it
-                if line:
-                    # State changes from the modem start with +
-                    if line.startswith('+'):
-                        self.handle_state(line)
-
-                    # if BROM in message, it means the modem reset, This will happen after leaving PSM mode
-                    elif 'BROM' in line:
-                        with lock:
-                            done = True
-                            self.state = RESET
-
-                    # All commands will either come back with OK, ERROR
-                    elif 'OK' in line or 'ERROR' in line:
-                        with lock:
-                            done = True
-
-                    elif '>' in line:
-                        with lock:
-                            done = True
-            else:
-                time.sleep(.5)
-
-    def handle_state(self, line):
-        """
-        Manage new states from the modem
-        :param line:
-        :return:
-        """
-        global battery
-
-        line = line.replace('\r', '').replace('\n', '')
-
-        try:
-            command, result = line.split(':', 1)
-        except ValueError as e:
-            print(f"ValueError {str(e)} in {line}")
-            return
-
-        # +CEREG can come unsolicited as states change, especially if using PSM mode
-        if "+CEREG" in command:
-            result = result.split(',')
-            try:
-                # If its greater than 2 its an unsolicited response
-                if not len(result) > 2:
-                    if int(result[1]) in (1, 5):
-                        with lock:
-                            self.registered = True
-
-            except ValueError as e:
-                print(f"ValueError:{e} for CEREG:{result}")
-
-        # +QCCID: Get the ccid on the SIM
-        elif "QCCID" in command:
-            self.ccid = result.strip()
-
-        # +QMTOPEN: <TCP_connectID>,<result>
-        elif "QMTOPEN" in command:
-            result = result.split(',')
-            try:
-                if int(result[1]) == 0:
-                    self.state = MQTTOPENED
-                else:
-                    self.state = MQTTNOTOPENED
-                    print("Failed to open MQTT")
-
-            except ValueError as e:
-                print(f"ValueError:{e} for QMTOPEN:{result}")
-
-        # +QMTSTAT: <TCP_connectID>,<err_ code> 1,2,3
-        elif "QMTSTAT" in command:
-            result = result.split(',')
             try:
-                if int(result[1]) > 0:
-                    self.state = MQTTCLOSED
+                line = self.reader()
+            except Exception as e:
+                print("Error reading uart {}".format(str(e)))
+                continue
 
-            except ValueError as e:
-                print(f"ValueError:{e} for QMTSTAT:{result}")
+            if line is None:
+                time.sleep(.5)
+                continue
 
-        # +QMTCONN: <TCP_connectID>,<result>[,<ret_code>]
-        elif "QMTCONN" in command:
-            result = result.split(',')
-            try:
-                if int(result[1]) == 0:
-                    self.state = MQTTCONNECTED
-                else:
-                    self.state = MQTTNOTCONNECTED
-                    print(f"Failed to connect to connect: {result[2]} {result[3]}")
-            except ValueError as e:
-                print(f"ValueError:{e} for QMTCONN:{result}")
-
-        # +QMTRECV: 0,0,"device/status","it works" If PSM sleeping this will not happen
-        elif "QMTRECV" in command:
-            try:
-                result = result.split(',')
-                line = result[3]
-                print(line)
-            except ValueError as e:
-                print(f"ValueError:{e} for QMTRECV:{result}")
-
-        elif "+QNBIOTEVENT" in command:
-            if "ENTER PSM" in result:
-                self.psm = True
-            else:
-                self.psm = False
-
-        # +CBC: 0,0,3275 Battery level
-        elif "CBC" in command:
-            result = result.split(',')
-            battery = result[2]
-
-        elif "QNBIOT" in command: # Indicate QNBIOT events, show the state of PSM
-            pass
-
-        elif "QCFG" in command:
-            pass
-
-        elif "+IP" in command:
-            if len(result.split('.')) == 4:
-                self.ip = result
-
-        # "+CGDCONT: 1,"IPV4V6","iot.nb","30.2.17.172",0,0,0,,,,,,0,,0"
-        elif 'CGDCONT' in command:
-            result = result.split(',')
-            ip_address = result[3].split('.')
-            if len(ip_address) == 4:
-                self.ip = result[3]
+            # If BROM or RDY, the modem reset. All commands will either come back with OK, ERROR or >
+            if self.brom or urc.equals(line, b'OK') or urc.error(line) or urc.startswith(line, b'>'):
+                with lock:
+                    done = True
+                    self.brom = False
 
     def send_at(self, command, timeout=None):
         """
@@ -318,22 +137,12 @@ class BC66:
         while not done:
             time.sleep(.1)
 
-    @property
-    def state(self):
-        return self.status
-
-    @state.setter
-    def state(self, value):
-        self.status = value
-
     def mqtt(self, host, port, client=None, password=None):
         """
         Set up the MQTT connection
         :return:
         """
 
-        global alarm_set, battery
-
         # Configure security level
         self.send_at('AT+QMTCFG="ssl",0,1,1,5')
         self.send_at('AT+QSSLCFG=1,5,"seclevel",1')
@@ -343,11 +152,7 @@ class BC66:
         # Send the cert
         self.send_at('AT+QSSLCFG=1,5,"cacert"')
         #with open('mosquitto.org.crt','rb') as f:
-        with open('isrgrootx1.pem','rb') as f:
-            size = 0
-            for l in f.readlines():
-                size += modem.write(l)
-                time.sleep(.1)
+        size, rate = certs.send_file(modem, 'isrgrootx1.pem')
 
         modem.write(bytes([26]))
         print(f'size:{size}')
@@ -378,9 +183,9 @@ class BC66:
             temp = temperature()
 
             msg = json.dumps({'ccid': self.ccid,
-                              'alarm': alarm_set,
+                              'alarm': alarm.set,
                               'temperature': temperature(),
-                              'volts': battery,
+                              'volts': self.battery,
                               'timestamp': time_str()})
 
             self.send_at('AT+QMTPUB=0,0,0,0,"device/state","{}"'.format(msg))
@@ -393,7 +198,6 @@ class BC66:
         Set up the MQTT connection
         :return:
         """
-        global alarm_set, battery
 
         # Open the MQTT broker
         self.send_at(f'AT+QMTOPEN=0,"{host}",1883')
@@ -410,9 +214,9 @@ class BC66:
             temp = temperature()
 
             msg = json.dumps({'ccid': self.ccid,
-                              'alarm': alarm_set,
+                              'alarm': alarm.set,
                               'temperature':temperature(),
-                              'volts':battery,
+                              'volts':self.battery,
                               'timestamp': time_str()})
             self.send_at('AT+QMTPUB=0,0,0,0,"device/state","{}"'.format(msg))
 
@@ -448,7 +252,7 @@ def main():
                   password="The0ldM@n")
         #bc66.mqtt()
 
-        while not bc66.state == RESET:
+        while not bc66.state == RESTART:
             time.sleep(2)
 
 
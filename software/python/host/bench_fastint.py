@@ -0,0 +1,88 @@
+"""
+Time the urc parsers with and without the viper code in watchible/_fastint.py, and check they agree.
+Run it on the MicroPython unix port, where _fastint imports,
+
+    micropython python/host/bench_fastint.py [rounds]
+
+On CPython only the Python versions are timed.
+"""
+import sys
+import time
+
+HERE = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+sys.path.insert(0, HERE + '/..')
+
+from watchible import urc
+
+try:
+    ticks_us, ticks_diff = time.ticks_us, time.ticks_diff
+except AttributeError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+# What comes after the colon in the lines the handlers take numbers from, and which fields are numbers
+LINES = [(b' 1,5\r\n', (0, 1)),                                                         # CEREG
+         (b' 5\r\n', (0,)),                                                             # CEREG
+         (b' 0,0\r\n', (0, 1)),                                                         # QMTOPEN
+         (b' 0,0,0\r\n', (0, 1, 2)),                                                    # QMTCONN
+         (b' 0,3\r\n', (0, 1)),                                                         # QMTCONN
+         (b' 0,1\r\n', (0, 1)),                                                         # QMTSTAT
+         (b' 0,0,3275\r\n', (0, 1, 2)),                                                 # CBC
+         (b' 24,99\r\n', (0, 1)),                                                       # CSQ
+         (b' 99,99,255,255,20,45\r\n', (0, 1, 2, 3, 4, 5)),                             # CESQ
+         (b' 0,2506,2,65,"0D43E68",-67,-4,-63,20,5,"3A98",0,,2\r\n', (1, 2, 3, 5, 6, 7, 8, 9, 11))]  # QENG
+
+
+def parse(lines):
+    """
+    What the handlers do with a line, count the fields and read the numbers
+    :return: list of the numbers
+    """
+    numbers = []
+    for line, wanted in lines:
+        urc.count(line)
+        for n in wanted:
+            numbers.append(urc.number(line, n))
+    return numbers
+
+
+def measure(lines, rounds):
+    """
+    :return: microseconds per line
+    """
+    start = ticks_us()
+    for _ in range(rounds):
+        parse(lines)
+    return ticks_diff(ticks_us(), start) / (rounds * len(lines))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # memoryviews, as LineFramer hands them out
+    lines = [(memoryview(line), wanted) for line, wanted in LINES]
+
+    fast = urc._fastint
+    urc._fastint = None
+    expected = parse(lines)
+    python = measure(lines, rounds)
+    print("python {:8.2f} us/line".format(python))
+
+    if fast is None:
+        print("viper  not available, run this on MicroPython")
+        return
+
+    urc._fastint = fast
+    if parse(lines) != expected:
+        print("viper  FAIL: the numbers differ from the Python parser")
+        sys.exit(1)
+
+    viper = measure(lines, rounds)
+    print("viper  {:8.2f} us/line {:5.1f}x".format(viper, python / viper))
+
+
+if __name__ == '__main__':
+    main()
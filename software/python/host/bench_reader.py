@@ -0,0 +1,68 @@
+"""
+Measure how long a URC takes to get from the UART to its handler in the async MQTTClient.
+Runs on the PC against the fake UART in machine.py, compares the StreamReader based reader()
+with the old loop that polled modem.any() once a second.
+
+    python bench_reader.py [samples]
+"""
+import io
+import os
+import sys
+import random
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'async'))
+
+import utime
+import uasyncio as asyncio
+
+import bc66
+from bc66 import MQTTClient, REGISTERED, RESET
+
+
+class PollingClient(MQTTClient):
+    """
+    The reader as it was: check the UART and sleep a second when there is nothing to read
+    """
+    async def reader(self):
+        while True:
+            if bc66.modem.any():
+                self.handle_line(bc66.modem.readline())
+            else:
+                await asyncio.sleep_ms(1000)
+
+
+async def latency(client, samples):
+    """
+    Inject +CEREG at random moments and time how long until the handler has run
+    :param client: the client under test
+    :param samples: how many URCs to send
+    :return: list of latencies in ms
+    """
+    task = asyncio.create_task(client.reader())
+    results = []
+    for _ in range(samples):
+        client.state = RESET
+        await asyncio.sleep(random.random())
+
+        start = utime.ticks_us()
+        bc66.modem.inject(b'+CEREG: 1\r\n')
+        while client.state != REGISTERED:
+            await asyncio.sleep(0)
+        results.append(utime.ticks_diff(utime.ticks_us(), start) / 1000)
+
+    task.cancel()
+    return results
+
+
+def main(samples=5):
+    for name, cls in (('polling', PollingClient), ('stream', MQTTClient)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(latency(cls({}), samples))
+        print(f"{name:8} mean {sum(results) / len(results):8.2f} ms  max {max(results):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
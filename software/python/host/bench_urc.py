@@ -0,0 +1,171 @@
+"""
+Feed a recorded modem transcript through the URC handlers of main.py's BC66 and compare the
+dispatch table with the old split()/hasattr()/getattr() reader.
+
+The transcripts are the serial console output of the firmware, one b'...' line per modem line, or
+what watchible.transcript.Recorder writes. python/host/replay.py times the whole readers.
+
+    python bench_urc.py [transcript ...]
+"""
+import os
+import ast
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+
+import io
+import contextlib
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+
+from watchible import urc
+
+
+def load(path, stamps=False):
+    """
+    Read a console capture
+    :param path: file name
+    :param stamps: also return the ticks_us of each line
+    :return: list of bytes, one per modem line, or of (ticks_us or None, bytes) with stamps
+    """
+    lines = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+
+            # Lines from watchible.transcript have the ticks_us first
+            stamp, _, text = line.partition(' ')
+            if stamp.isdigit():
+                line = text
+            else:
+                stamp = None
+
+            if line.startswith("b'") or line.startswith('b"'):
+                data = ast.literal_eval(line)
+                lines.append((None if stamp is None else int(stamp), data) if stamps else data)
+    return lines
+
+
+class Legacy:
+    """
+    The handlers and dispatch as they were before the table, on decoded strings
+    """
+    registered = False
+    state = None
+
+    def dispatch(self, data):
+        data = data.decode('utf-8', 'ignore')
+        if data.startswith('+'):
+            try:
+                status, result = data.split(':', 1)
+            except ValueError:
+                status = data
+            status = status.replace('+', '').strip()
+            if hasattr(self, status):
+                func = getattr(self, status)
+                func(result)
+
+    def CEREG(self, result):
+        result = result.replace('\r\n', '').split(',')
+        if len(result) == 1 and int(result[0]) in (1, 5):
+            self.registered = True
+        elif len(result) >= 2:
+            if int(result[1].strip()) in (1, 5):
+                self.registered = True
+
+    def QCCID(self, result):
+        self.ccid = result.strip()
+
+    def CGSN(self, result):
+        self.imei = result.strip()
+
+    def QMTOPEN(self, result):
+        result = result.split(',')
+        self.state = main.MQTTOPENED if int(result[1]) == 0 else main.MQTTNOTOPENED
+
+    def QMTCLOSE(self, result):
+        result = result.split(',')
+        if int(result[1]) == 0:
+            self.state = main.MQTTCLOSED
+
+    def QMTCONN(self, result):
+        result = result.split(',')
+        if int(result[1]) == 0:
+            self.state = main.MQTTCONNECTED
+
+    def CBC(self, result):
+        result = result.split(',')
+        self.battery = result[2].replace('\r\n', '').strip()
+
+    def CCLK(self, result):
+        self.clock = result.replace('\r\n', '').strip()
+
+    def QNBIOTEVENT(self, result):
+        if 'ENTER PSM' in result:
+            self.psm = True
+        elif 'EXIT PSM' in result:
+            self.psm = False
+
+    def IP(self, result):
+        if len(result.split('.')) == 4:
+            self.ip_address = result
+
+    def CGDCONT(self, result):
+        result = result.split(',')
+        ip_address = result[3].split('.')
+        if len(ip_address) == 4:
+            self.ip_address = result[3]
+
+
+def measure(handle, lines, rounds=2000):
+    """
+    Time the handler over the transcript and find the peak memory used while handling a line
+    :param handle: function(line)
+    :param lines: the transcript
+    :param rounds: times to go through it
+    :return: lines per second, mean peak bytes per line
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            handle(line)
+    rate = rounds * len(lines) / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    peak = 0
+    for line in lines:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handle(line)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return rate, peak / len(lines)
+
+
+def run(lines):
+    legacy = Legacy()
+    bc66 = main.BC66.__new__(main.BC66)
+    main.Modem.__init__(bc66, main.modem, main.reset, main.pwr_reset, sync=main.sync, radio=main.radio)
+
+    def table(line):
+        if line.startswith(b'+'):
+            urc.dispatch(bc66, line)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = (('legacy', measure(legacy.dispatch, lines)), ('table', measure(table, lines)))
+    for name, (rate, peak) in results:
+        print(f"  {name:8} {rate:10.0f} lines/s  {peak:7.1f} bytes/line peak")
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or [os.path.join(HERE, 'transcripts', name)
+                             for name in sorted(os.listdir(os.path.join(HERE, 'transcripts')))]
+    for path in paths:
+        lines = load(path)
+        print(f"{os.path.basename(path)}: {len(lines)} lines")
+        run(lines)
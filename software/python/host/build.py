@@ -0,0 +1,237 @@
+"""
+Build the firmware as .mpy bytecode or frozen into MicroPython, and time the imports each way.
+
+Compiling main.py and watchible on the Pico at each cold boot takes RAM for the compiler and a few hundred
+milliseconds, so they can be cross compiled on the PC with mpy-cross, or frozen into the firmware image.
+
+    python build.py mpy [--app ../main.py] [--out ../../build]       # app.mpy, lib/watchible/*.mpy, main.py
+    python build.py manifest --port rp2 [--out ../../build]         # manifest.py for FROZEN_MANIFEST=
+    python build.py bench [--micropython micropython] [--frozen ./micropython-frozen] [--rounds 20]
+
+mpy writes a main.py that only imports app, so what runs on the Pico is already compiled. Copy the out folder
+to the root of the Pico with mpremote. The .mpy version has to match the firmware, use the mpy-cross that came
+with it, or `pip install mpy-cross==<firmware version>`.
+
+manifest writes a manifest that freezes the same app and watchible on top of the port's own, e.g.
+
+    make -C micropython/ports/rp2 BOARD=RPI_PICO FROZEN_MANIFEST=$PWD/build/manifest.py
+
+then only the main.py it writes goes on the flash, with no /lib/watchible left there to shadow the frozen one.
+
+bench runs the MicroPython unix port and imports watchible from source, from .mpy, and frozen if --frozen is a
+unix port built with `build.py manifest --port unix`. It prints the milliseconds, the bytes allocated while
+importing and the bytes still held after a gc, the median of --rounds runs each. main.py needs the Pico's
+machine.UART, so only watchible is timed.
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON = os.path.normpath(os.path.join(HERE, '..'))
+SOFTWARE = os.path.normpath(os.path.join(HERE, '..', '..'))
+
+# What's built by default, and where
+APP = os.path.join(SOFTWARE, 'main.py')
+PACKAGE = os.path.join(PYTHON, 'watchible')
+OUT = os.path.join(SOFTWARE, 'build')
+
+# The RP2040 is a Cortex-M0+, only needed for native and viper code but harmless otherwise
+MARCH = 'armv6m'
+
+# The unix port for bench, watchible/_fastint.py is viper
+HOST_MARCH = 'x64'
+
+# main.py on the Pico once the app is compiled
+STUB = """import app
+
+while True:
+    app.main()
+"""
+
+# The part of a manifest that brings in what the port freezes itself, so asyncio etc. are still there
+PORT_MANIFESTS = {'rp2': '$(PORT_DIR)/boards/manifest.py',
+                  'unix': '$(PORT_DIR)/variants/manifest.py'}
+
+# Runs on the unix port, imports the modules and prints microseconds, bytes allocated and bytes held
+IMPORTS = """import gc
+import time
+gc.collect()
+before = gc.mem_alloc()
+start = time.ticks_us()
+for name in {modules!r}:
+    try:
+        __import__(name)
+    except ImportError as e:
+        print('skipped', name, e)
+took = time.ticks_diff(time.ticks_us(), start)
+allocated = gc.mem_alloc() - before
+gc.collect()
+print(took, allocated, gc.mem_alloc() - before)
+"""
+
+
+def mpy_cross():
+    """
+    The mpy-cross command, from the PATH or the mpy-cross package
+    :return: list, the command to run
+    """
+    path = shutil.which('mpy-cross')
+    if path:
+        return [path]
+    if importlib.util.find_spec('mpy_cross'):
+        return [sys.executable, '-m', 'mpy_cross']
+    sys.exit("mpy-cross isn't installed, pip install mpy-cross or build it from micropython/mpy-cross")
+
+
+def modules(package=PACKAGE):
+    """
+    The modules of the package, as imported
+    :return: list of (dotted name, source file)
+    """
+    name = os.path.basename(package)
+    found = []
+    for file in sorted(os.listdir(package)):
+        if file.endswith('.py'):
+            module = name if file == '__init__.py' else f"{name}.{file[:-3]}"
+            found.append((module, os.path.join(package, file)))
+    return found
+
+
+def compile_mpy(source, target, march=MARCH):
+    """
+    Cross compile one file
+    :param source: .py file
+    :param target: .mpy file to write
+    :param march: architecture for native code, or None
+    :return: None
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    command = mpy_cross() + ['-o', target, '-s', os.path.basename(source)]
+    if march:
+        command.append(f'-march={march}')
+    subprocess.run(command + [source], check=True)
+
+
+def build_mpy(app=APP, package=PACKAGE, out=OUT, march=MARCH):
+    """
+    app.mpy, lib/<package>/*.mpy and a main.py that imports app
+    :return: list of files written
+    """
+    written = []
+    for name, source in modules(package):
+        target = os.path.join(out, 'lib', *name.split('.'))
+        if source.endswith('__init__.py'):
+            target = os.path.join(target, '__init__')
+        compile_mpy(source, target + '.mpy', march)
+        written.append(target + '.mpy')
+
+    if app:
+        compile_mpy(app, os.path.join(out, 'app.mpy'), march)
+        with open(os.path.join(out, 'main.py'), 'w') as f:
+            f.write(STUB)
+        written += [os.path.join(out, 'app.mpy'), os.path.join(out, 'main.py')]
+    return written
+
+
+def manifest(port, app=APP, package=PACKAGE, out=OUT):
+    """
+    Write a manifest that freezes the app as app.py and the package, on top of the port's manifest, and the
+    main.py that imports app for the flash
+    :param port: 'rp2' or 'unix'
+    :return: the manifest file
+    """
+    lines = [f'include("{PORT_MANIFESTS[port]}")',
+             f'package("{os.path.basename(package)}", base_path="{os.path.dirname(package)}")']
+    if app:
+        lines.append(f'module("app.py", base_path="{out}")')
+        os.makedirs(out, exist_ok=True)
+        shutil.copyfile(app, os.path.join(out, 'app.py'))
+        with open(os.path.join(out, 'main.py'), 'w') as f:
+            f.write(STUB)
+
+    path = os.path.join(out, 'manifest.py')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def run_imports(micropython, path, names):
+    """
+    Import the modules once in a new unix port process
+    :param micropython: the unix port
+    :param path: MICROPYPATH, where the modules are found
+    :param names: modules to import
+    :return: (microseconds, bytes allocated, bytes held)
+    """
+    env = dict(os.environ, MICROPYPATH=path)
+    with tempfile.TemporaryDirectory() as empty:
+        result = subprocess.run([micropython, '-c', IMPORTS.format(modules=names)], cwd=empty, env=env,
+                                capture_output=True, text=True, check=True)
+
+    lines = result.stdout.strip().splitlines()
+    for line in lines[:-1]:
+        print(f"    {line}")
+    return tuple(int(value) for value in lines[-1].split())
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def bench(micropython, frozen=None, rounds=20, package=PACKAGE, march=HOST_MARCH):
+    """
+    Time importing the package from source, .mpy and frozen on the unix port
+    :return: {way: (microseconds, bytes allocated, bytes held)}
+    """
+    names = [name for name, _ in modules(package)]
+    results = {}
+    with tempfile.TemporaryDirectory() as out:
+        build_mpy(app=None, package=package, out=out, march=march)
+
+        ways = [('source', micropython, os.path.dirname(package)),
+                ('mpy', micropython, os.path.join(out, 'lib'))]
+        if frozen:
+            ways.append(('frozen', frozen, '.frozen'))
+
+        for way, binary, path in ways:
+            runs = [run_imports(binary, path, names) for _ in range(rounds)]
+            results[way] = tuple(median(column) for column in zip(*runs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the firmware as .mpy or frozen, and time the imports')
+    parser.add_argument('what', choices=('mpy', 'manifest', 'bench'))
+    parser.add_argument('--app', default=APP, help='the main to build, run on the Pico as app')
+    parser.add_argument('--out', default=OUT)
+    parser.add_argument('--march', default=MARCH, help='mpy-cross -march')
+    parser.add_argument('--host-march', default=HOST_MARCH, help='mpy-cross -march for the unix port')
+    parser.add_argument('--port', default='rp2', choices=sorted(PORT_MANIFESTS))
+    parser.add_argument('--micropython', default='micropython', help='the unix port')
+    parser.add_argument('--frozen', help='a unix port with the manifest from --port unix frozen in')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.what == 'mpy':
+        for path in build_mpy(args.app, PACKAGE, args.out, args.march):
+            print(f"{os.path.relpath(path, args.out):30} {os.path.getsize(path):6d} bytes")
+
+    elif args.what == 'manifest':
+        print(manifest(args.port, args.app, PACKAGE, args.out))
+
+    else:
+        results = bench(args.micropython, args.frozen, args.rounds, PACKAGE, args.host_march)
+        source = results['source'][0]
+        for way, (took, allocated, held) in results.items():
+            print(f"{way:8} {took / 1000:8.1f} ms {source / max(took, 1):5.1f}x  "
+                  f"{allocated:7d} bytes allocated  {held:7d} bytes held")
+
+
+if __name__ == '__main__':
+    main()
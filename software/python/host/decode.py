@@ -0,0 +1,58 @@
+"""
+Turn packed reports, the base64 text published when main.py's PAYLOAD is 'packed', back into json.
+
+The timestamp is printed as the modem clock, and each sample and alarm gets the time it happened.
+
+    python decode.py Af8UiQEkAgIQAlEhfw+GeZcDVYZZ...
+    mosquitto_sub -t device/state | python decode.py
+"""
+import os
+import sys
+import json
+import struct
+import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from watchible import payload
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+def decode(message):
+    """
+    Unpack a report and put the times in text
+    :param message: the base64 text
+    :return: dict
+    """
+    fields = payload.parse(message)
+    if 'timestamp' in fields:
+        clock = EPOCH + datetime.timedelta(seconds=fields['timestamp'])
+        fields['timestamp'] = clock.isoformat(' ')
+
+        for sample in fields.get('samples', []):
+            sample[0] = (clock - datetime.timedelta(minutes=sample[0])).isoformat(' ')
+
+        alarms = fields.get('alarms', {})
+        for name in ('first', 'last'):
+            if alarms.get(name) is not None:
+                alarms[name] = (clock - datetime.timedelta(minutes=alarms[name])).isoformat(' ')
+    return fields
+
+
+def main():
+    messages = sys.argv[1:] or sys.stdin
+    for message in messages:
+        message = message.strip()
+        if not message:
+            continue
+
+        try:
+            print(json.dumps(decode(message)))
+        except (ValueError, IndexError, struct.error) as e:
+            print(f"Error:{e} for {message}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""
+A Quectel BC66 or BC660K-GL on the PC, so the firmware can run and be timed without the board.
+
+It reads what the firmware writes to a fake machine.UART and answers the AT subset the Watchible code
+uses: cereg, qccid, cgsn, cgmm, cbc, cclk, csq, cesq, qeng, cgdcont, qsclk, cpsms, qnbiotevent, the
+qmtopen/conn/pub/sub/close MQTT commands and qsslcfg certs after the > prompt, ended by Cntrl Z.
+Commands on one line, at+a;+b, get one OK like the modem. It starts with RDY, and again when the
+firmware pulses the reset or power pin, crash() sends BROM.
+
+Answers come LATENCY milliseconds later, on the utime virtual clock if there is one, otherwise in the
+running asyncio loop or on a thread. drop is the chance an MQTT result from the network is lost. After
+qsclk=1 it says ENTER PSM once T3324 is up and EXIT PSM when T3412 is, and doesn't answer in between
+unless PSM_EINT is pulsed.
+
+    clock = utime.virtual()
+    import main
+    modem = Emulator(main.modem, 'Quectel_BC660K-GL', pins=(main.pwr_reset, main.reset), wake=main.psm_eint)
+    main.main()
+"""
+import asyncio
+import random
+import threading
+
+import utime
+
+from watchible import psm
+
+# Milliseconds until each answer
+LATENCY = {'boot': 2000,        # RDY after a reset
+           'line': 30,          # Each command line
+           'command': 10,       # Each command on the line
+           'register': 8000,    # +CEREG: 5 after boot
+           'network': 1500}     # +QMTOPEN, +QMTCONN, +QMTPUB, ...
+
+# What each model answers differently
+MODELS = {'Quectel_BC66':      {'cbc': '+CBC: 0,0,{mv}',
+                                'cclk': '+CCLK: {y:04}/{mo:02}/{d:02},{h:02}:{mi:02}:{s:02}GMT-5'},
+          'Quectel_BC660K-GL': {'cbc': '+CBC: {mv}',
+                                'cclk': '+CCLK: "{yy:02}/{mo:02}/{d:02},{h:02}:{mi:02}:{s:02}-20"'}}
+
+# The serving cell, as +QENG gives it
+SIGNAL = {'rsrp': -85, 'rsrq': -9, 'rssi': -75, 'snr': 12, 'ecl': 0}
+
+CTRL_Z = 26
+
+
+class Emulator:
+    """
+    The modem on the other end of a fake UART
+    """
+
+    def __init__(self, uart, model='Quectel_BC66', latency=None, drop=0.0, seed=0, pins=(), wake=None,
+                 ccid='8988228066602759536', imei='867997035586592', battery=3300, signal=None):
+        """
+        :param uart: host machine.UART the firmware uses
+        :param model: a key of MODELS
+        :param latency: dict to change some of LATENCY
+        :param drop: 0 to 1, chance an MQTT result is lost
+        :param seed: for the drops, the same seed drops the same ones
+        :param pins: host machine.Pins, pulsing any of them reboots the modem
+        :param wake: PSM_EINT pin, pulsing it wakes the modem from PSM
+        :param ccid: SIM
+        :param imei: modem
+        :param battery: millivolts cbc says
+        :param signal: dict to change some of SIGNAL
+        """
+        self.uart = uart
+        self.model = model
+        self.answers = MODELS[model]
+        self.latency = dict(LATENCY, **(latency or {}))
+        self.drop = drop
+        self.random = random.Random(seed)
+        self.ccid = ccid
+        self.imei = imei
+        self.battery = battery
+        self.signal = dict(SIGNAL, **(signal or {}))
+
+        self.log = []               # (ms, 'in' or 'out', bytes)
+        self.counts = {}            # command: times sent
+        self.dropped = 0
+        self.typed = bytearray()
+        self.prompt = None          # What the data after > is for
+
+        uart.on_write(self.write)
+        for pin in pins:
+            pin.on_change(self.pulse)
+        if wake:
+            wake.on_change(self.eint)
+
+        self.epoch = 0
+        self.boot()
+
+    # Time
+    def after(self, ms, function):
+        """
+        Call function ms from now, as long as the modem hasn't rebooted since
+        """
+        epoch = self.epoch
+
+        def due():
+            if epoch == self.epoch:
+                function()
+
+        if utime.clock:
+            utime.clock.after(ms, due)
+            return
+
+        try:
+            asyncio.get_running_loop().call_later(ms / 1000, due)
+        except RuntimeError:
+            timer = threading.Timer(ms / 1000, due)
+            timer.daemon = True
+            timer.start()
+
+    def send(self, *lines):
+        """
+        Lines to the firmware now
+        """
+        for line in lines:
+            data = line if isinstance(line, bytes) else line.encode() + b'\r\n'
+            self.log.append((utime.ticks_ms(), 'out', data))
+            self.uart.inject(data)
+
+    def later(self, ms, *lines):
+        self.after(ms, lambda: self.send(*lines))
+
+    def lost(self):
+        """
+        Is this network result lost
+        """
+        if self.drop and self.random.random() < self.drop:
+            self.dropped += 1
+            return True
+        return False
+
+    # Power
+    def boot(self):
+        """
+        Start over as from power on, RDY comes after the boot latency
+        """
+        self.epoch += 1
+        self.typed = bytearray()
+        self.prompt = None
+        self.ready = False
+        self.cereg = 0
+        self.stat = 2
+        self.sleep = False
+        self.psm = False
+        self.events = False
+        self.t3412 = None
+        self.t3324 = None
+        self.mqtt = {}
+        self.after(self.latency['boot'], self.started)
+
+    def started(self):
+        self.ready = True
+        self.send(b'\r\n', 'RDY')
+        self.after(self.latency['register'], lambda: self.registered(5))
+
+    def registered(self, stat):
+        self.stat = stat
+        if self.cereg:
+            self.send(f'+CEREG: {stat}')
+
+    def crash(self):
+        """
+        What the modem does when it falls over
+        """
+        self.send('BROM')
+        self.boot()
+
+    def pulse(self, pin, level):
+        if level == 0:
+            self.boot()
+
+    def eint(self, pin, level):
+        if level == 0 and self.psm:
+            self.exit_psm()
+
+    def enter_psm(self):
+        if self.psm:
+            return
+        self.psm = True
+        if self.events:
+            self.send('+QNBIOTEVENT: "ENTER PSM"')
+        if self.t3412:
+            self.after((self.t3412 - self.t3324) * 1000, self.exit_psm)
+
+    def exit_psm(self):
+        if not self.psm:
+            return
+        self.psm = False
+        if self.events:
+            self.send('+QNBIOTEVENT: "EXIT PSM"')
+
+    # From the firmware
+    def write(self, data):
+        self.log.append((utime.ticks_ms(), 'in', bytes(data)))
+        if not self.ready or self.psm:
+            return
+
+        self.typed.extend(data)
+        if self.prompt:
+            end = self.typed.find(bytes([CTRL_Z]))
+            if end >= 0:
+                data = bytes(self.typed[:end])
+                del self.typed[:end + 1]
+                self.written(data)
+            return
+
+        while True:
+            end = self.typed.find(b'\r')
+            if end < 0:
+                break
+            line = bytes(self.typed[:end]).strip().decode('utf-8', 'ignore')
+            del self.typed[:end + 1]
+            if line:
+                self.line(line)
+
+    def line(self, line):
+        """
+        Answer one command line, each command on it in turn
+        """
+        if not line.lower().startswith('at'):
+            return
+
+        ms = self.latency['line']
+        lines = []
+        commands = line[2:].lstrip('+').split(';+') if line[2:] else []
+        for command in commands:
+            ms += self.latency['command']
+            name = command.split('=')[0].split('?')[0].lower()
+            self.counts[name] = self.counts.get(name, 0) + 1
+            answer = getattr(self, 'at_' + name, None)
+            result = answer(command[len(name):]) if answer else None
+            if result is None:
+                self.later(ms, *lines, 'ERROR')
+                return
+
+            if result == '>':
+                self.later(ms, *lines, b'> ')
+                return
+            lines += result
+
+        self.later(ms, *lines, 'OK')
+
+    def written(self, data):
+        """
+        The data after the > prompt came
+        """
+        prompt, self.prompt = self.prompt, None
+        lines = prompt(data)
+        if lines is None:
+            self.later(self.latency['command'], 'ERROR')
+        else:
+            self.later(self.latency['command'], *lines, 'OK')
+
+    @staticmethod
+    def args(text):
+        """
+        The arguments of a command, quotes taken off
+        """
+        return [arg.strip('"') for arg in text.lstrip('=').split(',')] if text.startswith('=') else []
+
+    # The commands, each returns the lines before OK, '>' for the prompt or None for ERROR
+    def at_(self, text):
+        return []
+
+    def at_e0(self, text):
+        return []
+
+    def at_cereg(self, text):
+        if text == '?':
+            return [f'+CEREG: {self.cereg},{self.stat}']
+        self.cereg = int(self.args(text)[0])
+        return []
+
+    def at_qccid(self, text):
+        return [f'+QCCID: {self.ccid}']
+
+    def at_cgsn(self, text):
+        return [f'+CGSN: {self.imei}']
+
+    def at_cgmm(self, text):
+        return [self.model]
+
+    def at_cbc(self, text):
+        return [self.answers['cbc'].format(mv=self.battery)]
+
+    def at_cclk(self, text):
+        y, mo, d, h, mi, s = utime.localtime(utime.time())[:6]
+        return [self.answers['cclk'].format(y=y, yy=y % 100, mo=mo, d=d, h=h, mi=mi, s=s)]
+
+    def at_csq(self, text):
+        return [f'+CSQ: {max(min((self.signal["rssi"] + 113) // 2, 31), 0)},99']
+
+    def at_cesq(self, text):
+        return [f'+CESQ: 99,99,255,255,{(self.signal["rsrq"] + 20) * 2},{self.signal["rsrp"] + 141}']
+
+    def at_qeng(self, text):
+        s = self.signal
+        return [f'+QENG: 0,2506,2,65,"0D43E68",{s["rsrp"]},{s["rsrq"]},{s["rssi"]},{s["snr"]},5,"3A98",{s["ecl"]},,2']
+
+    def at_cgdcont(self, text):
+        if text == '?':
+            return ['+CGDCONT: 1,"IP","iot.1nce.net","10.214.117.36",0,0,0,,,,,,0,,0']
+        return []
+
+    def at_qcgdefcont(self, text):
+        return []
+
+    def at_cfun(self, text):
+        return []
+
+    def at_qledmode(self, text):
+        return []
+
+    def at_qnbiotevent(self, text):
+        self.events = self.args(text)[:1] == ['1']
+        return []
+
+    def at_cpsms(self, text):
+        args = self.args(text)
+        if len(args) >= 5 and args[0] == '1':
+            self.t3412 = psm.decode(args[3], psm.T3412)
+            self.t3324 = psm.decode(args[4], psm.T3324)
+        return []
+
+    def at_qsclk(self, text):
+        self.sleep = self.args(text)[:1] == ['1']
+        if self.sleep and self.t3324 is not None and not self.mqtt:
+            self.after(self.t3324 * 1000, lambda: self.sleep and self.enter_psm())
+        return []
+
+    def at_qmtcfg(self, text):
+        return []
+
+    def at_qsslcfg(self, text):
+        args = self.args(text)
+        if len(args) == 3 and args[2] in ('cacert', 'clientcert', 'clientkey'):
+            self.prompt = lambda data: [] if data else None
+            return '>'
+        return []
+
+    def at_qmtopen(self, text):
+        if text == '?':
+            return [f'+QMTOPEN: {tcp},"{self.host}",{self.port}' for tcp in self.mqtt]
+
+        tcp, self.host, self.port = self.args(text)[:3]
+        tcp = int(tcp)
+        self.mqtt[tcp] = 'opening'
+
+        def opened():
+            self.mqtt[tcp] = 'opened'
+            self.send(f'+QMTOPEN: {tcp},0')
+
+        if not self.lost():
+            self.after(self.latency['network'], opened)
+        return []
+
+    def at_qmtconn(self, text):
+        if text == '?':
+            states = {'opened': 1, 'connecting': 2, 'connected': 3}
+            return [f'+QMTCONN: {tcp},{states[state]}' for tcp, state in self.mqtt.items() if state in states]
+
+        tcp = int(self.args(text)[0])
+        if self.mqtt.get(tcp) != 'opened':
+            return None
+
+        def connected():
+            self.mqtt[tcp] = 'connected'
+            self.send(f'+QMTCONN: {tcp},0,0')
+
+        self.mqtt[tcp] = 'connecting'
+        if not self.lost():
+            self.after(self.latency['network'], connected)
+        return []
+
+    def at_qmtpub(self, text):
+        args = text.lstrip('=').split(',', 5)
+        tcp = int(args[0])
+        if self.mqtt.get(tcp) != 'connected':
+            return None
+
+        def published(data=None):
+            if not self.lost():
+                self.later(self.latency['network'], f'+QMTPUB: {tcp},{args[1]},0')
+            return []
+
+        if len(args) < 6:
+            self.prompt = published
+            return '>'
+        return published()
+
+    def at_qmtsub(self, text):
+        args = self.args(text)
+        tcp = int(args[0])
+        if self.mqtt.get(tcp) != 'connected':
+            return None
+
+        if not self.lost():
+            self.later(self.latency['network'], f'+QMTSUB: {tcp},{args[1]},0,0')
+        return []
+
+    def at_qmtclose(self, text):
+        tcp = int(self.args(text)[0])
+        if tcp not in self.mqtt:
+            return None
+
+        def closed():
+            self.mqtt.pop(tcp, None)
+            self.send(f'+QMTCLOSE: {tcp},0')
+            if self.sleep and self.t3324 is not None and not self.mqtt:
+                self.after(self.t3324 * 1000, lambda: self.sleep and not self.mqtt and self.enter_psm())
+
+        self.after(self.latency['network'], closed)
+        return []
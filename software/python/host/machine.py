@@ -0,0 +1,197 @@
+"""
+CPython stand-in for the MicroPython machine module so the firmware can run on a PC.
+Only the parts the Watchible code uses are here. The UART is fed from the host side with inject()
+and everything the firmware writes is collected in UART.written
+
+With utime.virtual() the Timer, lightsleep() and polling an empty UART move the virtual clock instead of
+waiting, see host/emulator.py
+"""
+import threading
+
+import utime
+
+# Milliseconds a look at an empty UART costs on the virtual clock, so polling loops move on
+IDLE_MS = 1
+
+
+class UART:
+    """
+    Fake UART. Bytes handed to inject() show up on the receive side, just like the modem sending them.
+    """
+    def __init__(self, id=1, baudrate=115200, timeout=0, timeout_char=0, rxbuf=256, txbuf=256, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.rxbuf = rxbuf
+        self.rx = bytearray()
+        self.written = bytearray()
+        self.listeners = []
+        self.waiters = []
+
+    # Host side
+    def inject(self, data):
+        """
+        Make data available to read, as if the modem sent it
+        :param data: bytes
+        :return: None
+        """
+        self.rx.extend(data)
+        for waiter in self.waiters:
+            waiter.set()
+
+    def on_write(self, listener):
+        """
+        Call listener(data) for every write from the firmware, used by the modem emulator
+        :param listener: function
+        :return: None
+        """
+        self.listeners.append(listener)
+
+    # Firmware side
+    def any(self):
+        if not self.rx and utime.clock:
+            utime.clock.idle(IDLE_MS)
+        return len(self.rx)
+
+    def read(self, nbytes=-1):
+        if not self.rx:
+            return None
+        if nbytes < 0 or nbytes > len(self.rx):
+            nbytes = len(self.rx)
+        data = bytes(self.rx[:nbytes])
+        del self.rx[:nbytes]
+        return data
+
+    def readinto(self, buf, nbytes=-1):
+        if nbytes < 0 or nbytes > len(buf):
+            nbytes = len(buf)
+        data = self.read(nbytes)
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        if not self.rx:
+            return None
+        end = self.rx.find(b'\n')
+        return self.read(len(self.rx) if end < 0 else end + 1)
+
+    def write(self, data):
+        data = data.encode() if isinstance(data, str) else bytes(data)
+        self.written.extend(data)
+        for listener in self.listeners:
+            listener(data)
+        return len(data)
+
+    def txdone(self):
+        return True
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self.level = 1 if pull == Pin.PULL_UP else 0
+        self.handler = None
+        self.trigger = 0
+        self.listeners = []
+
+    def value(self, level=None):
+        if level is None:
+            return self.level
+        changed = level != self.level
+        self.level = level
+        if changed:
+            for listener in self.listeners:
+                listener(self, level)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self.handler = handler
+        self.trigger = trigger
+
+    # Host side
+    def on_change(self, listener):
+        """
+        Call listener(pin, level) when the firmware changes an output, used by the modem emulator
+        :param listener: function
+        :return: None
+        """
+        self.listeners.append(listener)
+
+    def drive(self, level):
+        """
+        Change the input level and fire the irq handler like the hardware would
+        :param level: 0 or 1
+        :return: None
+        """
+        edge = Pin.IRQ_FALLING if level < self.level else Pin.IRQ_RISING if level > self.level else 0
+        self.level = level
+        if self.handler and edge & self.trigger:
+            self.handler(self)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.thread = None
+        self.event = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+
+        def fire():
+            callback(self)
+            if mode == Timer.PERIODIC:
+                self.init(mode=mode, period=period, callback=callback)
+
+        if utime.clock:
+            self.event = utime.clock.after(period, fire)
+            return
+
+        self.thread = threading.Timer(period / 1000, fire)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def deinit(self):
+        if self.thread:
+            self.thread.cancel()
+            self.thread = None
+        if self.event:
+            utime.clock.cancel(self.event)
+            self.event = None
+
+
+class ADC:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def read_u16(self):
+        # 3.3 V on VSYS through its 1/3 divider
+        if self.channel == 3:
+            return 21845
+
+        # About 22 C on the rp2040 temperature sensor
+        return 14000
+
+
+def lightsleep(ms=None):
+    if ms:
+        utime.sleep_ms(ms)
+
+
+def reset():
+    raise SystemExit("machine.reset()")
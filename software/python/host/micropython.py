@@ -0,0 +1,12 @@
+"""
+CPython stand-in for the MicroPython micropython module.
+schedule() runs the function straight away, there is no IRQ to wait to return from.
+"""
+
+
+def const(value):
+    return value
+
+
+def schedule(function, arg):
+    function(arg)
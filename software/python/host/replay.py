@@ -0,0 +1,126 @@
+"""
+Replay recorded modem transcripts through the readers of main.py and async/bc66.py at full speed.
+
+The transcripts are what watchible.transcript.Recorder writes, ticks_us then the line, or the serial
+console output of the firmware with only the b'...' lines. For each reader it prints lines a second,
+the peak bytes allocated handling a line, and how long each kind of line takes to handle, so a change to
+the parsers can be measured against field captures.
+
+    python replay.py [--rounds 2000] [transcript ...]
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'async'))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+sys.path.insert(0, HERE)
+
+from bench_urc import load, measure
+
+# ticks_us() on the Pico wraps at this
+TICKS_PERIOD = 1 << 30
+
+
+def span(lines):
+    """
+    Microseconds from the first line to the last, allowing for ticks_us() wrapping. A gap longer
+    than the wrap, e.g. a PSM sleep, can't be told from a shorter one and counts as less
+    :param lines: from load()
+    :return: int, or None if the lines have no times
+    """
+    total = 0
+    last = None
+    for stamp, _ in lines:
+        if stamp is None:
+            return None
+        if last is not None:
+            total += (stamp - last) % TICKS_PERIOD
+        last = stamp
+    return total
+
+
+def kind(line):
+    """
+    What a line is for the latency table, e.g. '+CEREG', 'OK'
+    """
+    if line.startswith(b'+'):
+        return line.split(b':')[0].decode()
+    return line.strip().decode('utf-8', 'ignore')[:12] or 'blank'
+
+
+def readers():
+    """
+    The reader of each firmware, as function(line), with its printing turned off
+    :return: list of (name, function)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        import bc66
+        from watchible import modem as modem_driver
+
+    main.print = modem_driver.print = bc66.print = lambda *args, **kwargs: None
+
+    # Only the driver, without the power reset BC66() does
+    firmware = main.BC66.__new__(main.BC66)
+    main.Modem.__init__(firmware, main.modem, main.reset, main.pwr_reset, sync=main.sync, radio=main.radio)
+
+    def reader(line):
+        main.modem.inject(line)
+        firmware.reader()
+
+    client = bc66.MQTTClient({})
+    return [('main.BC66.reader', reader), ('bc66.MQTTClient.handle_line', client.handle_line)]
+
+
+def latency(handle, lines, rounds):
+    """
+    Time each kind of line through a reader
+    :param handle: function(line)
+    :param lines: list of bytes
+    :param rounds: times to go through it
+    :return: {kind: [count, total ns, most ns]}
+    """
+    kinds = {}
+    for _ in range(rounds):
+        for line in lines:
+            start = time.perf_counter_ns()
+            handle(line)
+            ns = time.perf_counter_ns() - start
+            stats = kinds.setdefault(kind(line), [0, 0, 0])
+            stats[0] += 1
+            stats[1] += ns
+            stats[2] = max(stats[2], ns)
+    return kinds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay modem transcripts through the readers')
+    parser.add_argument('transcripts', nargs='*')
+    parser.add_argument('--rounds', type=int, default=2000, help='times through each transcript')
+    args = parser.parse_args()
+
+    paths = args.transcripts or [os.path.join(HERE, 'transcripts', name)
+                                 for name in sorted(os.listdir(os.path.join(HERE, 'transcripts')))]
+    for path in paths:
+        recorded = load(path, stamps=True)
+        lines = [line for _, line in recorded]
+        took = span(recorded)
+        print(f"{os.path.basename(path)}: {len(lines)} lines" +
+              (f" over {took / 1000000:.1f} s" if took is not None else ""))
+
+        for name, handle in readers():
+            rate, peak = measure(handle, lines, args.rounds)
+            kinds = latency(handle, lines, max(args.rounds // 10, 1))
+            print(f"  {name:30} {rate:10.0f} lines/s  {peak:7.1f} bytes/line peak")
+            for line_kind, (count, ns, most) in sorted(kinds.items(), key=lambda item: -item[1][1]):
+                print(f"    {line_kind:16} {ns / count / 1000:8.2f} us mean  {most / 1000:8.2f} us max")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Run the firmware against the modem emulator and time each round.
+
+main.py runs on the virtual clock, so rounds of 12 hour PSM sleeps take a second or so and the same
+seed gives the same timings every time. Each round is timed from the modem leaving PSM, or booting,
+to it going back in. async/bc66.py runs on the real clock with the latencies scaled down, through
+reset, network, open, connect, publish and close.
+
+    python sim.py [--model Quectel_BC660K-GL] [--rounds 3] [--drop 0.1] [--seed 1] [--budget 20000]
+    python sim.py --async [--scale 0.01]
+    python sim.py --record transcripts/emulated.log      # Then python replay.py transcripts/emulated.log
+
+It exits 1 if a round took more than --budget milliseconds or nothing was published, for timing
+regression tests.
+"""
+import os
+import io
+import sys
+import argparse
+import tempfile
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'async'))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+sys.path.insert(0, HERE)
+
+import utime
+import machine
+
+from emulator import Emulator, LATENCY
+from watchible.transcript import Recorder
+
+
+class Done(Exception):
+    pass
+
+
+def rounds(modem):
+    """
+    Time each round from the emulator log
+    :param modem: Emulator
+    :return: list of (start ms, awake ms)
+    """
+    timings = []
+    start = 0
+    for ms, way, data in modem.log:
+        if way != 'out':
+            continue
+        if b'EXIT PSM' in data or b'RDY' in data:
+            start = ms
+        elif b'ENTER PSM' in data:
+            timings.append((start, ms - start))
+    return timings
+
+
+def stores(main, folder):
+    """
+    Keep the flash files of main.py in folder, not the root of the PC
+    """
+    main.identity.store = os.path.join(folder, 'identity.json')
+    main.outbox.path = os.path.join(folder, 'outbox.txt')
+    main.outbox.mark = os.path.join(folder, 'outbox.pos')
+    main.delta.store = os.path.join(folder, 'delta.json')
+
+
+def run_main(args):
+    """
+    main.py on the virtual clock
+    :return: (list of round timings, Emulator)
+    """
+    utime.virtual()
+    with contextlib.redirect_stdout(io.StringIO()) as console:
+        import main
+
+    modem = Emulator(main.modem, args.model, drop=args.drop, seed=args.seed,
+                     pins=(main.pwr_reset, main.reset), wake=main.psm_eint)
+
+    # Stop once the modem has gone into PSM enough times, the Pico sleeps after each round
+    lightsleep = machine.lightsleep
+
+    def counted(ms=None):
+        if len(rounds(modem)) >= args.rounds:
+            raise Done()
+        lightsleep(ms)
+
+    machine.lightsleep = counted
+
+    if args.record:
+        main.recorder = Recorder(args.record)
+
+    main.Modem.echo = args.verbose
+    with tempfile.TemporaryDirectory() as folder:
+        stores(main, folder)
+        with contextlib.redirect_stdout(console if not args.verbose else sys.stdout):
+            try:
+                while True:
+                    main.main()
+            except Done:
+                pass
+
+    if main.recorder:
+        main.recorder.flush()
+    return rounds(modem), modem
+
+
+def run_async(args):
+    """
+    async/bc66.py on the real clock, one publish
+    :return: (list of round timings, Emulator)
+    """
+    import uasyncio as asyncio
+    with contextlib.redirect_stdout(io.StringIO()) as console:
+        import bc66
+
+    latency = {name: ms * args.scale for name, ms in LATENCY.items()}
+    modem = Emulator(bc66.modem, args.model, latency=latency, drop=args.drop, seed=args.seed,
+                     pins=(bc66.pwr_reset, bc66.reset), wake=bc66.psm_eint)
+    client = bc66.MQTTClient({})
+    client.echo = args.verbose
+
+    async def once():
+        task = asyncio.create_task(client.reader())
+        start = utime.ticks_ms()
+        await client.reset()
+        await client.network()
+        if await client.open():
+            await client.connect()
+            await client.publish('device/update', await client.report())
+            await client.close()
+        task.cancel()
+        return utime.ticks_diff(utime.ticks_ms(), start)
+
+    with contextlib.redirect_stdout(console if not args.verbose else sys.stdout):
+        ms = asyncio.run(once())
+    return [(0, ms)], modem
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the firmware against the modem emulator')
+    parser.add_argument('--model', default='Quectel_BC66')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--drop', type=float, default=0.0, help='chance an MQTT result is lost')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=int, help='most milliseconds a round may be awake')
+    parser.add_argument('--async', dest='asyn', action='store_true', help='run async/bc66.py instead')
+    parser.add_argument('--scale', type=float, default=0.01, help='latencies for --async')
+    parser.add_argument('--verbose', action='store_true', help='show the firmware console')
+    parser.add_argument('--record', help='keep the modem lines main.py reads in this transcript')
+    args = parser.parse_args()
+
+    timings, modem = run_async(args) if args.asyn else run_main(args)
+
+    for number, (start, awake) in enumerate(timings):
+        print(f"round {number}: at {start / 1000:10.1f} s awake {awake:6d} ms")
+
+    published = sum(1 for _, way, data in modem.log if way == 'out' and data.startswith(b'+QMTPUB'))
+    lines = sum(1 for _, way, _ in modem.log if way == 'in')
+    print(f"{modem.model}: {published} published, {modem.dropped} dropped, {lines} writes, "
+          f"commands {dict(sorted(modem.counts.items()))}")
+
+    slow = [awake for _, awake in timings if args.budget and awake > args.budget]
+    if slow or not published:
+        print(f"FAIL: {len(slow)} rounds over {args.budget} ms, {published} published")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
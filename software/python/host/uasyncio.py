@@ -0,0 +1,41 @@
+"""
+CPython stand-in for MicroPython's uasyncio. It is the standard asyncio plus the MicroPython
+extras the firmware uses, with a StreamReader that wraps a fake machine.UART
+"""
+from asyncio import *
+import asyncio as _asyncio
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(aw, timeout):
+    return await _asyncio.wait_for(aw, timeout / 1000)
+
+
+class StreamReader:
+    """
+    uasyncio.StreamReader(uart): read() and readinto() suspend until the UART has data
+    """
+    def __init__(self, stream):
+        self.s = stream
+        self.ready = _asyncio.Event()
+        stream.waiters.append(self.ready)
+
+    async def wait(self):
+        while not self.s.any():
+            self.ready.clear()
+            await self.ready.wait()
+
+    async def read(self, n=-1):
+        await self.wait()
+        return self.s.read(n)
+
+    async def readinto(self, buf):
+        await self.wait()
+        return self.s.readinto(buf)
+
+    async def readline(self):
+        await self.wait()
+        return self.s.readline()
@@ -0,0 +1,57 @@
+"""
+CPython stand-in for MicroPython's uselect. poll() works on the fake machine.UART, which has no
+file descriptor, and waits on the virtual clock when utime has one
+"""
+from select import POLLIN, POLLOUT, POLLERR, POLLHUP
+
+import utime
+
+# Milliseconds between looks at the UARTs on the real clock
+STEP_MS = 1
+
+
+class poll:
+    def __init__(self):
+        self.streams = {}
+
+    def register(self, stream, eventmask=POLLIN | POLLOUT):
+        self.streams[stream] = eventmask
+
+    def modify(self, stream, eventmask):
+        self.streams[stream] = eventmask
+
+    def unregister(self, stream):
+        self.streams.pop(stream, None)
+
+    def ready(self):
+        events = []
+        for stream, mask in self.streams.items():
+            event = mask & POLLOUT
+            if mask & POLLIN and stream.rx:
+                event |= POLLIN
+            if event:
+                events.append((stream, event))
+        return events
+
+    def poll(self, timeout=-1):
+        """
+        :param timeout: milliseconds, -1 waits for ever
+        :return: list of (stream, event)
+        """
+        start = utime.ticks_ms()
+        while True:
+            events = self.ready()
+            if events or timeout == 0:
+                return events
+
+            left = STEP_MS if timeout < 0 else timeout - utime.ticks_diff(utime.ticks_ms(), start)
+            if left <= 0:
+                return []
+
+            if utime.clock:
+                utime.clock.idle(left)
+            else:
+                utime.sleep_ms(min(left, STEP_MS))
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
@@ -0,0 +1,125 @@
+"""
+CPython stand-in for MicroPython's utime. Importing it also adds the MicroPython only helpers
+(sleep_ms, ticks_ms, ...) to the standard time module, since the firmware uses both
+
+virtual() swaps the clock for one that only moves when something waits, sleep_ms(), lightsleep() or
+polling an empty UART, and then jumps straight to the next thing due. A 12 hour PSM round takes
+no time and runs the same every time, for timing the firmware against host/emulator.py.
+"""
+import time as _time
+import heapq as _heapq
+from time import *
+
+_start = _time.monotonic_ns()
+
+# The virtual clock when there is one
+clock = None
+
+
+class Clock:
+    """
+    Virtual time in microseconds, with callbacks due at set times
+    """
+    def __init__(self, epoch=None):
+        """
+        :param epoch: what time() says at the start, seconds, now if None
+        """
+        self.us = 0
+        self.epoch = int(_time.time()) if epoch is None else epoch
+        self.events = []
+        self.count = 0
+
+    def after(self, ms, function):
+        """
+        Call function when ms have gone by
+        :param ms: milliseconds from now
+        :param function: called with no arguments
+        :return: the event, to pass to cancel()
+        """
+        self.count += 1
+        event = [self.us + int(ms * 1000), self.count, function]
+        _heapq.heappush(self.events, event)
+        return event
+
+    @staticmethod
+    def cancel(event):
+        event[2] = None
+
+    def advance(self, ms):
+        """
+        Move the time on, calling everything that comes due on the way
+        :param ms: milliseconds
+        :return: None
+        """
+        until = self.us + int(ms * 1000)
+        while self.events and self.events[0][0] <= until:
+            when, _, function = _heapq.heappop(self.events)
+            self.us = max(self.us, when)
+            if function:
+                function()
+        self.us = max(self.us, until)
+
+    def idle(self, ms):
+        """
+        Wait up to ms, stopping at the next event
+        :param ms: milliseconds
+        :return: None
+        """
+        if self.events:
+            ms = min(ms, max((self.events[0][0] - self.us) / 1000, 0))
+        self.advance(ms)
+
+
+def virtual(epoch=None):
+    """
+    Run on a virtual clock from now on
+    :param epoch: what time() says at the start
+    :return: Clock
+    """
+    global clock
+    clock = Clock(epoch)
+    return clock
+
+
+def sleep_ms(ms):
+    if clock:
+        clock.advance(ms)
+    else:
+        _time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    if clock:
+        clock.advance(us / 1000)
+    else:
+        _time.sleep(us / 1000000)
+
+
+def ticks_us():
+    if clock:
+        return clock.us
+    return (_time.monotonic_ns() - _start) // 1000
+
+
+def ticks_ms():
+    if clock:
+        return clock.us // 1000
+    return (_time.monotonic_ns() - _start) // 1000000
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(end, start):
+    return end - start
+
+
+def time():
+    if clock:
+        return clock.epoch + clock.us // 1000000
+    return int(_time.time())
+
+
+for _name in ('sleep_ms', 'sleep_us', 'ticks_us', 'ticks_ms', 'ticks_add', 'ticks_diff'):
+    setattr(_time, _name, globals()[_name])
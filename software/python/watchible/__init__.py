@@ -0,0 +1,3 @@
+"""
+Code shared by the Watchible examples. Copy this directory to /lib/watchible on the Pico.
+"""
@@ -0,0 +1,115 @@
+"""
+Viper versions of the loops in urc that scan a line byte by byte. They run as machine code on the Pico, and
+urc uses them when they import. Anywhere but MicroPython this raises ImportError and urc stays in Python.
+
+Fields are found the way urc.bounds() finds them: commas in quotes don't split, and spaces, quotes and the
+line end around a field are trimmed. Numbers are machine words, so only fields that fit in 32 bits.
+"""
+import sys
+
+if sys.implementation.name != 'micropython':
+    raise ImportError("viper needs MicroPython")
+
+import micropython
+from micropython import const
+
+# What number() returns
+FOUND = const(0)
+NO_FIELD = const(1)
+NOT_NUMBER = const(2)
+
+
+@micropython.viper
+def find(buf, char: int, start: int) -> int:
+    """
+    Index of a byte in a buffer
+    :param buf: bytes, bytearray or memoryview
+    :param char: the byte to look for
+    :param start: where to start looking
+    :return: the index or -1
+    """
+    p = ptr8(buf)
+    end = int(len(buf))
+    i = start
+    while i < end:
+        if int(p[i]) == char:
+            return i
+        i += 1
+    return -1
+
+
+@micropython.viper
+def count(buf) -> int:
+    """
+    Number of comma separated fields
+    :param buf: bytes after the colon
+    :return: int
+    """
+    p = ptr8(buf)
+    end = int(len(buf))
+    n = 1
+    quoted = 0
+    i = 0
+    while i < end:
+        c = int(p[i])
+        if c == 34:
+            quoted = 1 - quoted
+        elif c == 44 and quoted == 0:
+            n += 1
+        i += 1
+    return n
+
+
+@micropython.viper
+def number(buf, n: int, out) -> int:
+    """
+    Parse the nth field into out[0]
+    :param buf: bytes after the colon
+    :param n: field index
+    :param out: preallocated array('i', [0])
+    :return: FOUND, NO_FIELD or NOT_NUMBER
+    """
+    p = ptr8(buf)
+    end = int(len(buf))
+    start = 0
+    field = 0
+    quoted = 0
+    i = 0
+    while i < end:
+        c = int(p[i])
+        if c == 34:
+            quoted = 1 - quoted
+        elif c == 44 and quoted == 0:
+            if field == n:
+                break
+            field += 1
+            start = i + 1
+        i += 1
+
+    if field != n:
+        return NO_FIELD
+
+    while start < i and (int(p[start]) <= 32 or int(p[start]) == 34):
+        start += 1
+    while i > start and (int(p[i - 1]) <= 32 or int(p[i - 1]) == 34):
+        i -= 1
+
+    sign = 1
+    if start < i and int(p[start]) == 45:
+        sign = -1
+        start += 1
+
+    if start == i:
+        return NOT_NUMBER
+
+    value = 0
+    while start < i:
+        digit = int(p[start]) - 48
+        if digit < 0 or digit > 9:
+            return NOT_NUMBER
+        value = value * 10 + digit
+        start += 1
+
+    result = ptr32(out)
+    result[0] = sign * value
+    return FOUND
@@ -0,0 +1,206 @@
+"""
+The water alarm interrupt, kept short enough to run as a hard IRQ.
+
+The handler only records the edge and schedules wake() with micropython.schedule. wake() runs as soon as
+the IRQ returns: it times the alarm and pulls PSM_EINT low, and a one-shot Timer lets it go PULSE_MS
+later. Nothing in the IRQ prints, allocates or sleeps, so the pulse starts at the same time after every edge.
+
+Both edges go into a ring of EVENTS preallocated slots, an edge within DEBOUNCE_MS of the last one kept is
+the sensor bouncing and is dropped. The pin is read again once DEBOUNCE_MS has passed, so the level it
+settles on is kept even when the edge that got it there was dropped. summary() sums them up for the next
+report.
+
+    alarm = Alarm(water_alarm, psm_eint)
+    ...
+    if alarm.set:
+        ... report alarm.summary() ...
+        alarm.set = False
+        alarm.clear()
+"""
+import time
+import machine
+import micropython
+from array import array
+
+# How long PSM_EINT is held low to wake the modem
+PULSE_MS = 1000
+
+# Seconds before another alarm wakes the modem again
+HOLDOFF = 3600
+
+# Edges closer together than this are the sensor bouncing
+DEBOUNCE_MS = 50
+
+# Edges kept between reports, the oldest are written over after that
+EVENTS = 32
+
+
+class Alarm:
+    """
+    Wakes the modem when the water alarm goes off
+    """
+
+    def __init__(self, pin, psm_eint, pulse_ms=PULSE_MS, holdoff=HOLDOFF, debounce_ms=DEBOUNCE_MS, events=EVENTS):
+        """
+        :param pin: the water alarm input, low when wet
+        :param psm_eint: the modem PSM_EINT output, pulsed low to wake it
+        :param pulse_ms: how long to hold PSM_EINT low
+        :param holdoff: seconds an alarm doesn't wake the modem after the last one
+        :param debounce_ms: edges closer than this to the last one are dropped
+        :param events: edges to keep between reports
+        """
+        self.pin = pin
+        self.psm_eint = psm_eint
+        self.pulse_ms = pulse_ms
+        self.holdoff = holdoff
+        self.debounce_ms = debounce_ms
+
+        self.set = False            # An alarm is waiting to be reported
+        self.last = None            # time.time() of the last alarm that woke the modem
+        self.scheduled = False      # wake() is waiting to run
+        self.settling = False       # The pin is read again after a dropped edge
+
+        # The edge ring, written from the IRQ so it's all made here
+        self.ticks = array('i', [0] * events)   # time.ticks_ms() of each edge
+        self.levels = bytearray(events)          # pin level after each edge, 0 is wet
+        self.level = pin.value()                 # level after the last edge kept
+        self.edge = time.ticks_ms()              # when that was
+        self.clear()
+
+        # Bound methods are made once here, making one in the IRQ would allocate
+        self._wake = self.wake
+        self._release = self.release
+        self._settle = self.settle
+        self._settled = self.settled
+        self.timer = machine.Timer()
+        self.debouncer = machine.Timer()
+
+        pin.irq(trigger=machine.Pin.IRQ_FALLING | machine.Pin.IRQ_RISING, handler=self.irq, hard=True)
+
+    def clear(self):
+        """
+        Start the ring again, the last one was reported
+        :return: None
+        """
+        self.head = 0                           # Edges since clear(), the slot is head % events
+        self.wets = 0                           # Times it went wet since clear()
+        self.opened = time.ticks_ms()
+        self.wet = self.level == 0              # Wet when cleared
+
+    def irq(self, pin):
+        """
+        Pin interrupt, no allocation allowed
+        """
+        now = time.ticks_ms()
+        level = pin.value()
+        if level == self.level:
+            return
+
+        # Bouncing, see where it ends up once it stops
+        if time.ticks_diff(now, self.edge) < self.debounce_ms:
+            if not self.settling:
+                self.settling = True
+                try:
+                    micropython.schedule(self._settle, None)
+                except RuntimeError:
+                    self.settling = False
+            return
+
+        self.record(level, now)
+
+    def record(self, level, now):
+        """
+        Keep an edge, from the IRQ so no allocation allowed
+        :param level: pin level after it, 0 is wet
+        :param now: time.ticks_ms() of it
+        :return: None
+        """
+        self.level = level
+        self.edge = now
+        index = self.head % len(self.levels)
+        self.ticks[index] = now
+        self.levels[index] = level
+        self.head += 1
+        if level:
+            return
+
+        self.wets += 1
+        if not self.scheduled:
+            self.scheduled = True
+            try:
+                micropython.schedule(self._wake, None)
+            except RuntimeError:
+                self.scheduled = False      # The schedule queue is full, the next edge tries again
+
+    def settle(self, _):
+        """
+        Scheduled by irq() after a dropped edge, read the pin once it has had DEBOUNCE_MS to settle
+        """
+        self.debouncer.init(mode=machine.Timer.ONE_SHOT, period=self.debounce_ms, callback=self._settled)
+
+    def settled(self, _):
+        """
+        Timer callback, keep the level the pin settled on if the last edge kept says otherwise
+        """
+        self.settling = False
+        level = self.pin.value()
+        if level != self.level:
+            self.record(level, time.ticks_ms())
+
+    def wake(self, _):
+        """
+        Scheduled by irq(), start the PSM_EINT pulse
+        """
+        self.scheduled = False
+        now = time.time()
+
+        # Check to see it the alarm has gone off already in the last hour
+        if self.last is None or now - self.last > self.holdoff:
+            self.set = True
+            self.last = now
+            self.psm_eint.value(0)
+            self.timer.init(mode=machine.Timer.ONE_SHOT, period=self.pulse_ms, callback=self._release)
+            print(f'Alarm: {self.pin.value()}')
+
+    def release(self, _):
+        """
+        Timer callback, end the pulse
+        """
+        self.psm_eint.value(1)
+
+    def summary(self):
+        """
+        What the alarm did since clear(). An edge lost to bouncing is made up by reading the pin now
+        :return: dict of the times it went wet, the time.time() of the first and last wet edge kept,
+                 and the seconds it was wet. None if it stayed dry
+        """
+        head = self.head
+        now = time.ticks_ms()
+        clock = time.time()
+
+        size = len(self.levels)
+        start = max(0, head - size)
+        since = self.opened if self.wet and not start else None
+        first = last = None
+        wet_ms = 0
+        for i in range(start, head):
+            index = i % size
+            ticks = self.ticks[index]
+            if self.levels[index] == 0:
+                first = ticks if first is None else first
+                last = ticks
+                since = ticks
+            elif since is not None:
+                wet_ms += time.ticks_diff(ticks, since)
+                since = None
+
+        if since is not None and self.pin.value() == 0:
+            wet_ms += time.ticks_diff(now, since)
+
+        if not self.wets and not wet_ms:
+            return None
+
+        def when(ticks):
+            return None if ticks is None else clock - time.ticks_diff(now, ticks) // 1000
+
+        return {'count': self.wets, 'first': when(first), 'last': when(last), 'wet': wet_ms // 1000}
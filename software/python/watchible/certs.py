@@ -0,0 +1,180 @@
+"""
+Send certificate files to the modem after the > prompt of AT+QSSLCFG=<ctx>,<id>,"cacert" and friends.
+The file is read and written in fixed size blocks and each block goes as soon as the UART has sent the
+last one, instead of a line at a time with a sleep after each.
+The modem keeps certs in its own file system, so Provisioned remembers what was sent and they are
+only sent again when the file changes.
+"""
+import json
+import time
+import hashlib
+import binascii
+
+# Bytes read from the file and written at a time
+CHUNK = 256
+
+# Optional limit in bytes per second, if the modem can't keep up with the UART. None to go flat out
+RATE = None
+
+# Flash file with the digest of each cert last sent to the modem
+STORE = '/certs.json'
+
+
+def pause(size, start, rate):
+    """
+    How long to wait so the bytes sent so far don't go faster than rate
+    :param size: bytes sent
+    :param start: ticks_ms when sending started
+    :param rate: bytes per second or None
+    :return: int: milliseconds
+    """
+    if not rate:
+        return 0
+    return size * 1000 // rate - time.ticks_diff(time.ticks_ms(), start)
+
+
+def speed(size, start):
+    """
+    Bytes per second since start
+    :param size: bytes sent
+    :param start: ticks_ms when sending started
+    :return: int
+    """
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    return size * 1000 // elapsed if elapsed > 0 else size * 1000
+
+
+def send_file(uart, path, chunk=CHUNK, rate=RATE):
+    """
+    Write a file to the modem. Cntrl Z is left to the caller
+    :param uart: the modem UART
+    :param path: file to send
+    :param chunk: bytes per write
+    :param rate: optional bytes per second limit
+    :return: size, bytes per second
+    """
+    buf = bytearray(chunk)
+    view = memoryview(buf)
+    size = 0
+    start = time.ticks_ms()
+    with open(path, 'rb') as f:
+        while count := f.readinto(buf):
+            size += uart.write(view[:count])
+            while not uart.txdone():
+                pass
+
+            wait = pause(size, start, rate)
+            if wait > 0:
+                time.sleep_ms(wait)
+
+    bps = speed(size, start)
+    print(f"wrote {size} bytes of {path} at {bps} bytes/s")
+    return size, bps
+
+
+async def upload(uart, path, chunk=CHUNK, rate=RATE):
+    """
+    send_file() as a coroutine, it gives up the CPU while the UART drains
+    :param uart: the modem UART
+    :param path: file to send
+    :param chunk: bytes per write
+    :param rate: optional bytes per second limit
+    :return: size, bytes per second
+    """
+    import uasyncio as asyncio
+
+    buf = bytearray(chunk)
+    view = memoryview(buf)
+    size = 0
+    start = time.ticks_ms()
+    with open(path, 'rb') as f:
+        while count := f.readinto(buf):
+            size += uart.write(view[:count])
+            while not uart.txdone():
+                await asyncio.sleep_ms(1)
+
+            wait = pause(size, start, rate)
+            await asyncio.sleep_ms(wait if wait > 0 else 0)
+
+    bps = speed(size, start)
+    print(f"wrote {size} bytes of {path} at {bps} bytes/s")
+    return size, bps
+
+
+def digest(path, chunk=CHUNK):
+    """
+    sha256 of a file
+    :param path: file name
+    :param chunk: bytes to read at a time
+    :return: str: hex digest
+    """
+    h = hashlib.sha256()
+    buf = bytearray(chunk)
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while count := f.readinto(buf):
+            h.update(view[:count])
+    return binascii.hexlify(h.digest()).decode()
+
+
+class Provisioned:
+    """
+    What certs the modem has. Each slot e.g. 'cacert' is remembered with the digest of the file sent to it.
+
+        if provisioned.needed('cacert', cacert):
+            ... send it ...
+            provisioned.sent('cacert', cacert)
+    """
+
+    def __init__(self, store=STORE):
+        """
+        :param store: flash file to keep the digests in
+        """
+        self.store = store
+        self.files = {}
+        try:
+            with open(store) as f:
+                self.slots = json.load(f)
+        except (OSError, ValueError):
+            self.slots = {}
+
+    def digest(self, path):
+        if path not in self.files:
+            self.files[path] = digest(path)
+        return self.files[path]
+
+    def needed(self, slot, path):
+        """
+        Does the file need to be sent
+        :param slot: where it goes on the modem e.g. 'cacert'
+        :param path: the cert file
+        :return: True if the modem does not have this file in this slot
+        """
+        return self.slots.get(slot) != self.digest(path)
+
+    def sent(self, slot, path):
+        """
+        Remember the file was sent
+        :param slot: where it went on the modem
+        :param path: the cert file
+        :return: None
+        """
+        if self.slots.get(slot) != self.digest(path):
+            self.slots[slot] = self.digest(path)
+            self.save()
+
+    def forget(self):
+        """
+        Send everything again next time, e.g. after a TLS connection failed
+        :return: None
+        """
+        if self.slots:
+            self.slots = {}
+            self.save()
+
+    def save(self):
+        try:
+            with open(self.store, 'w') as f:
+                json.dump(self.slots, f)
+        except OSError as e:
+            print(f"Error:{e} saving {self.store}")
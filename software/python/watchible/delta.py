@@ -0,0 +1,100 @@
+"""
+Report only what changed since the last report that was published, with a full report every so often.
+
+The fields last published are kept in /delta.json. A number is sent again when it moved more than its
+deadband from the value last sent, anything else when it isn't equal. Every KEYFRAME reports, or when
+asked for, all the fields go out so the backend can't drift.
+
+    fields = delta.changes(bc66.fields())
+    ... publish fields ...
+    delta.sent()
+"""
+import json
+
+STORE = '/delta.json'
+
+# Every KEYFRAME reports are full, 1 makes them all full
+KEYFRAME = 8
+
+# How far a number can move before it's sent again
+DEADBANDS = {'temperature': 0.5, 'volts': 50, 'rsrp': 3, 'snr': 2}
+
+# Sent in every report, the ccid says who it's from
+ALWAYS = ('ccid', 'timestamp', 'alarm', 'samples', 'alarms')
+
+
+class Delta:
+    """
+    What the backend was last told
+    """
+
+    def __init__(self, store=STORE, keyframe=KEYFRAME, deadbands=DEADBANDS, always=ALWAYS):
+        """
+        :param store: flash file to keep the fields last sent in
+        :param keyframe: send all the fields every this many reports
+        :param deadbands: dict of field name to how far it can move
+        :param always: fields sent every time
+        """
+        self.store = store
+        self.keyframe = keyframe
+        self.deadbands = deadbands
+        self.always = always
+        self.pending = None
+        try:
+            with open(store) as f:
+                kept = json.load(f)
+            self.last = kept['last']
+            self.count = kept['count']
+        except (OSError, ValueError, KeyError):
+            self.last = {}
+            self.count = 0
+
+    def changed(self, name, value):
+        """
+        Has a field changed enough to send
+        :param name: field name
+        :param value: what it is now
+        :return: True to send it
+        """
+        if name not in self.last:
+            return True
+
+        last = self.last[name]
+        if name in self.deadbands:
+            try:
+                return abs(float(value) - float(last)) > self.deadbands[name]
+            except (TypeError, ValueError):
+                pass
+        return value != last
+
+    def changes(self, fields, full=False):
+        """
+        The fields to send
+        :param fields: dict of everything e.g. bc66.fields()
+        :param full: send all of them, e.g. after reports were missed
+        :return: dict
+        """
+        if full or not self.last or self.count + 1 >= self.keyframe:
+            self.pending = (dict(fields), True)
+        else:
+            self.pending = ({name: value for name, value in fields.items()
+                             if name in self.always or self.changed(name, value)}, False)
+        return self.pending[0]
+
+    def sent(self):
+        """
+        The last changes() were published, they are what the backend has now
+        :return: None
+        """
+        if self.pending is None:
+            return
+
+        fields, full = self.pending
+        self.pending = None
+        self.last.update({name: value for name, value in fields.items() if name not in self.always})
+        self.count = 0 if full else self.count + 1
+        try:
+            with open(self.store, 'w') as f:
+                json.dump({'last': self.last, 'count': self.count}, f)
+        except OSError as e:
+            print(f"Error:{e} saving {self.store}")
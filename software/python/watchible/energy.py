@@ -0,0 +1,136 @@
+"""
+Where the time goes in each wake, to see what a report costs.
+
+The profiler is hooked onto the modem methods, at(), wait(), wait_for() and the resets, and onto the
+Sequencer's, so the code calling them doesn't change. Each call switches the phase by what it sends, e.g.
+at('qmtopen=...') starts 'open', and the time from then to the next switch, read with ticks_us(), goes to that
+phase. A line of batched commands starts the phase of the first one, and Sequencer.begin() moves on to the
+next as each answers. start() opens a wake and end() closes it with the battery millivolts cbc read at the
+start and end of it. Calls outside a wake aren't timed.
+
+    profiler = Profiler()
+    profiler.wrap(BC66, 'at', command)
+    profiler.wrap(Sequencer, 'begin', lambda step: command(step.sent))
+    profiler.wrap(BC66, 'power_reset', lambda *args: 'reset')
+    profiler.start(bc66.battery)
+    ...
+    profiler.switch('psm')
+    summary = profiler.end(bc66.battery)
+"""
+import time
+
+# The phase a command starts, the first match wins
+PHASES = (('qmtopen', 'open'),
+          ('qmtconn', 'connect'),
+          ('qmtpub', 'publish'),
+          ('qmtclose', 'close'),
+          ('qsclk=1', 'psm'),
+          ('cereg', 'register'),
+          ('qsslcfg', 'certs'))
+
+# Anything else
+OTHER = 'commands'
+
+
+def command(text, *args, **kwargs):
+    """
+    The phase of an AT command, or of the first on a line of them
+    :param text: the command e.g. 'qmtopen=0,"54.196.22.131",1883' or 'qmtclose=0;+qsclk=1'
+    :return: phase name
+    """
+    if isinstance(text, (bytes, bytearray)):
+        return OTHER
+
+    text = text.split(';')[0].lower()
+    for name, phase in PHASES:
+        if name in text:
+            return phase
+    return OTHER
+
+
+class Profiler:
+    """
+    Time in each phase of a wake
+    """
+
+    def __init__(self):
+        self.phases = {}        # phase: microseconds
+        self.phase = None
+        self.since = None       # ticks_us() the phase started
+        self.battery = None     # millivolts at the start
+        self.last = None        # summary of the last wake
+
+    def start(self, battery=None):
+        """
+        Start a wake, one that didn't get to end() is ended first so two aren't counted as one
+        :param battery: millivolts as cbc read them
+        :return: None
+        """
+        if self.since is not None:
+            self.end()
+
+        self.phases = {}
+        self.phase = OTHER
+        self.since = time.ticks_us()
+        self.battery = battery
+
+    def switch(self, phase):
+        """
+        The time from now goes to phase, nothing happens outside a wake
+        :param phase: name
+        :return: None
+        """
+        if self.since is None:
+            return
+
+        if phase != self.phase:
+            now = time.ticks_us()
+            self.phases[self.phase] = self.phases.get(self.phase, 0) + time.ticks_diff(now, self.since)
+            self.phase = phase
+            self.since = now
+
+    def end(self, battery=None):
+        """
+        Close the wake
+        :param battery: millivolts as cbc read them
+        :return: dict of milliseconds in each phase, the total, and the millivolts at the start and end
+        """
+        if self.since is None:
+            return self.last
+
+        self.switch(None)
+        self.since = None
+        ms = {phase: us // 1000 for phase, us in self.phases.items() if phase}
+        self.last = {'ms': ms, 'total': sum(ms.values()), 'mv': [self.battery, battery]}
+        print(f"Energy: {self.last}")
+        return self.last
+
+    def wrap(self, cls, name, phase):
+        """
+        Switch the phase each time a method is called
+        :param cls: e.g. BC66
+        :param name: method name e.g. 'at'
+        :param phase: function of the method arguments that returns the phase
+        :return: None
+        """
+        method = getattr(cls, name)
+        profiler = self
+
+        def timed(self, *args, **kwargs):
+            profiler.switch(phase(*args, **kwargs))
+            return method(self, *args, **kwargs)
+
+        setattr(cls, name, timed)
+
+    def wrap_async(self, cls, name, phase):
+        """
+        wrap() for an async method e.g. MQTTClient.wait_for
+        """
+        method = getattr(cls, name)
+        profiler = self
+
+        async def timed(self, *args, **kwargs):
+            profiler.switch(phase(*args, **kwargs))
+            return await method(self, *args, **kwargs)
+
+        setattr(cls, name, timed)
@@ -0,0 +1,65 @@
+"""
+The ccid, imei and model of the modem kept in flash, so they aren't asked for again on every wake.
+
+The imei and model belong to the board and never change. The ccid belongs to the SIM, so it is read once
+each time the modem starts and compared with the one kept. A different SIM means asking for the rest again.
+
+    identity = Identity()
+    ... send qccid ...
+    if not identity.known(ccid):
+        ... send cgmm and cgsn=1 ...
+        identity.update(ccid, imei, model)
+"""
+import json
+
+STORE = '/identity.json'
+
+
+class Identity:
+    """
+    What the modem said it was the last time it was asked
+    """
+
+    def __init__(self, store=STORE):
+        """
+        :param store: flash file to keep the identity in
+        """
+        self.store = store
+        try:
+            with open(store) as f:
+                kept = json.load(f)
+        except (OSError, ValueError):
+            kept = {}
+
+        self.ccid = kept.get('ccid')
+        self.imei = kept.get('imei')
+        self.model = kept.get('model')
+
+    def known(self, ccid):
+        """
+        Can the imei and model kept be used
+        :param ccid: the ccid just read from the SIM
+        :return: True if it's the same SIM and nothing is missing
+        """
+        return ccid is not None and ccid == self.ccid and self.imei is not None and self.model is not None
+
+    def update(self, ccid, imei, model):
+        """
+        Keep what the modem answered, flash is only written if something changed
+        :param ccid: SIM ccid
+        :param imei: modem imei
+        :param model: modem model e.g. Quectel_BC66
+        :return: None
+        """
+        if (ccid, imei, model) != (self.ccid, self.imei, self.model):
+            self.ccid = ccid
+            self.imei = imei
+            self.model = model
+            self.save()
+
+    def save(self):
+        try:
+            with open(self.store, 'w') as f:
+                json.dump({'ccid': self.ccid, 'imei': self.imei, 'model': self.model}, f)
+        except OSError as e:
+            print(f"Error:{e} saving {self.store}")
@@ -0,0 +1,202 @@
+"""
+Messages from subscribed topics. parse() reads a +QMTRECV line and Router hands the payload to the callbacks
+for the topic, both straight from the line read off the UART.
+
+A +QMTRECV comes three ways:
+
+    +QMTRECV: 0,3,"device/update","{"led":1,"at":"12:00"}"    a message, pushed or read out with qmtrecv=0,<id>
+    +QMTRECV: 0,2                                              the BC660K-GL buffered it in <recv_id> 2
+    +QMTRECV: 0,1,0,0,0,0                                      qmtrecv? says which of the 5 buffers hold one
+
+The payload is everything after the topic, so commas and quotes in it don't matter. With qmtcfg="recv/mode"
+set to send the length, say so with length=True and it is taken from that. Topics and payloads are memoryview
+slices of the line, only good until the next line is read; copy with bytes() whatever is kept.
+
+    router = Router()
+    router.route('device/+/led', on_led)           # on_led(topic, payload)
+    router.route('device/#', on_anything)
+"""
+from watchible import urc
+
+SLASH = 47
+PLUS = b'+'
+HASH = b'#'
+DOLLAR = 36
+
+# What parse() found
+MESSAGE = 1
+STORED = 2
+STATUS = 3
+
+# The BC660K-GL buffers up to this many messages
+BUFFERS = 5
+
+
+def strip(buf, start, stop):
+    """
+    Trim spaces, the line end and one pair of quotes
+    :return: start, stop
+    """
+    while start < stop and buf[start] <= 32:
+        start += 1
+    while stop > start and buf[stop - 1] <= 32:
+        stop -= 1
+    if stop - start >= 2 and buf[start] == urc.QUOTE and buf[stop - 1] == urc.QUOTE:
+        start += 1
+        stop -= 1
+    return start, stop
+
+
+def parse(result, length=False):
+    """
+    Read a +QMTRECV
+    :param result: bytes or memoryview after the colon
+    :param length: the message has <payload_len> before the payload
+    :return: (MESSAGE, msg_id, topic, payload), (STORED, recv_id, None, None) or
+             (STATUS, stored, None, None) where bit n of stored is set if buffer n holds a message
+    """
+    first = urc.find(result, urc.COMMA)
+    if first < 0:
+        raise ValueError("no fields")
+
+    second = urc.find(result, urc.COMMA, first + 1)
+    if second < 0:
+        return STORED, urc.number(result, 1), None, None
+
+    start = second + 1
+    while start < len(result) and result[start] <= 32:
+        start += 1
+
+    # The topic is always quoted, the store status is all numbers
+    if start == len(result) or result[start] != urc.QUOTE:
+        stored = 0
+        for n in range(BUFFERS):
+            if urc.number(result, n + 1):
+                stored |= 1 << n
+        return STATUS, stored, None, None
+
+    close = urc.find(result, urc.QUOTE, start + 1)
+    if close < 0:
+        raise ValueError("topic isn't closed")
+    topic = result[start + 1:close]
+
+    after = urc.find(result, urc.COMMA, close)
+    if after < 0:
+        raise ValueError("no payload")
+
+    if length:
+        comma = urc.find(result, urc.COMMA, after + 1)
+        if comma < 0:
+            raise ValueError("no payload")
+        size = urc.number(result, 3)
+        start, stop = strip(result, comma + 1, len(result))
+        payload = result[start:start + size]
+    else:
+        start, stop = strip(result, after + 1, len(result))
+        payload = result[start:stop]
+
+    return MESSAGE, urc.number(result, 1), topic, payload
+
+
+def same(buf, start, stop, key):
+    """
+    buf[start:stop] == key without slicing
+    """
+    if stop - start != len(key):
+        return False
+    for i in range(len(key)):
+        if buf[start + i] != key[i]:
+            return False
+    return True
+
+
+class Node:
+    """
+    A level of the topic filters
+    """
+
+    def __init__(self):
+        self.keys = []              # The levels under this one, and their nodes
+        self.nodes = []
+        self.plus = None            # The node for a + here
+        self.hash = []              # Callbacks for a # here
+        self.callbacks = []         # Callbacks for a filter that ends here
+
+
+class Router:
+    """
+    Callbacks for topic filters with MQTT's + and # wildcards, in a tree of the levels. Finding them walks the
+    topic in place, so a message costs no more than the callbacks do.
+    """
+
+    def __init__(self):
+        self.root = Node()
+
+    def route(self, topic, callback):
+        """
+        Call callback(topic, payload) for messages on topics that match
+        :param topic: filter e.g. 'device/+/led' or 'device/#'
+        :param callback: function(topic, payload) with memoryviews
+        :return: None
+        """
+        node = self.root
+        levels = topic.encode().split(b'/') if isinstance(topic, str) else topic.split(b'/')
+        for level in levels:
+            if level == HASH:
+                node.hash.append(callback)
+                return
+
+            if level == PLUS:
+                if node.plus is None:
+                    node.plus = Node()
+                node = node.plus
+                continue
+
+            if level not in node.keys:
+                node.keys.append(level)
+                node.nodes.append(Node())
+            node = node.nodes[node.keys.index(level)]
+        node.callbacks.append(callback)
+
+    def dispatch(self, topic, payload):
+        """
+        Call the callbacks for the topic
+        :param topic: bytes or memoryview e.g. b'device/update'
+        :param payload: bytes or memoryview
+        :return: int: how many were called
+        """
+        # Wildcards at the first level don't match topics like $SYS
+        return self.walk(self.root, topic, 0, payload, not (len(topic) and topic[0] == DOLLAR))
+
+    def walk(self, node, topic, start, payload, wild=True):
+        """
+        Call the callbacks under node for the topic from start on
+        :param node: where the levels before start led
+        :param start: first byte of the next level, past the end once there are none
+        :param wild: whether + and # match here
+        :return: int: how many were called
+        """
+        called = 0
+        end = len(topic)
+        if wild:
+            for callback in node.hash:
+                callback(topic, payload)
+                called += 1
+
+        if start > end:
+            for callback in node.callbacks:
+                callback(topic, payload)
+                called += 1
+            return called
+
+        stop = urc.find(topic, SLASH, start)
+        if stop < 0:
+            stop = end
+
+        for i in range(len(node.keys)):
+            if same(topic, start, stop, node.keys[i]):
+                called += self.walk(node.nodes[i], topic, stop + 1, payload)
+
+        if wild and node.plus is not None:
+            called += self.walk(node.plus, topic, stop + 1, payload)
+        return called
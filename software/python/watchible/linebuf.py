@@ -0,0 +1,129 @@
+"""
+Line framing for the modem UART without a new bytes object per line.
+Everything read from the UART goes into one bytearray allocated at start up, and complete lines are
+handed out as memoryview slices of it. A partial line stays in the buffer until the rest arrives.
+"""
+
+NEWLINE = 10
+PROMPT = 62
+
+
+class LineFramer:
+    """
+    Use in place of modem.readline():
+
+        rx = LineFramer(modem)
+        while (line := rx.readline()) is not None:
+            ...
+
+    A line is only good until the next call, copy it with bytes(line) to keep it.
+    """
+
+    def __init__(self, uart, size=1024):
+        """
+        :param uart: the modem UART, or anything with any() and readinto()
+        :param size: the longest line that can be framed, longer ones are cut
+        """
+        self.uart = uart
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.start = 0      # First byte not handed out yet
+        self.scan = 0       # Where to carry on looking for a new line
+        self.end = 0        # End of what has been read
+
+    def readline(self):
+        """
+        The next complete line, reading the UART if there is none in the buffer. The > prompt the modem
+        sends before taking data has no new line, it is returned on its own.
+        :return: memoryview of the line including the \r\n, None if there is no line yet
+        """
+        line = self.next()
+        if line is None and self.fill():
+            line = self.next()
+        return line
+
+    def lines(self):
+        """
+        Generator of all the complete lines read so far
+        :return: memoryview of each line
+        """
+        while True:
+            line = self.readline()
+            if line is None:
+                return
+            yield line
+
+    def fill(self):
+        """
+        Read what the UART has into the buffer, without waiting
+        :return: int: bytes read
+        """
+        count = self.uart.any()
+        if not count:
+            return 0
+
+        space = self.space()
+        count = self.uart.readinto(space[:count] if count < len(space) else space) or 0
+        self.end += count
+        return count
+
+    def space(self, size=0):
+        """
+        Free part of the buffer, to read into from outside e.g. from a StreamReader. Call commit() after.
+        :param size: how much of it, 0 for all
+        :return: memoryview
+        """
+        self.compact()
+        if size:
+            return self.mv[self.end:self.end + size]
+        return self.mv[self.end:]
+
+    def commit(self, count):
+        """
+        Add bytes read into space() to the buffer
+        :param count: number of bytes read
+        :return: None
+        """
+        self.end += count or 0
+
+    def next(self):
+        """
+        Hand out the next line from the buffer without reading the UART
+        :return: memoryview or None
+        """
+        buf = self.buf
+        for i in range(self.scan, self.end):
+            if buf[i] == NEWLINE:
+                return self.take(i + 1)
+        self.scan = self.end
+
+        if self.start < self.end:
+            # The buffer is full and there is no new line, hand it out rather than get stuck
+            if self.start == 0 and self.end == len(buf):
+                return self.take(self.end)
+
+            if buf[self.start] == PROMPT:
+                return self.take(self.end)
+        return None
+
+    def take(self, stop):
+        line = self.mv[self.start:stop]
+        self.start = self.scan = stop
+        return line
+
+    def compact(self):
+        """
+        Move a partial line to the front of the buffer to make room after it
+        :return: None
+        """
+        if self.start == self.end:
+            self.start = self.scan = self.end = 0
+
+        elif self.start and self.end == len(self.buf):
+            buf = self.buf
+            count = self.end - self.start
+            for i in range(count):
+                buf[i] = buf[self.start + i]
+            self.scan -= self.start
+            self.start = 0
+            self.end = count
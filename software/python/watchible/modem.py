@@ -0,0 +1,399 @@
+"""
+The BC66 and BC660K-GL driver the mains share, instead of a copy of the class in each one.
+
+Modem sends AT commands, reads and frames what comes back and keeps what the URC handlers find:
+registered, the MQTT state, ccid, imei, battery, clock and so on. What differs between the two models
+is in MODELS and read with capability(). A main subclasses Modem for its own report and anything else
+it does on a URC, and decorates the subclass with urc.handlers again if it overrides a handler.
+
+    @urc.handlers
+    class BC66(Modem):
+        def report(self):
+            ...
+
+    bc66 = BC66(uart, reset, pwr_reset, sync=sync)
+    bc66.power_reset()
+    bc66.ready()
+"""
+import time
+
+from watchible import urc, inbox
+from watchible.linebuf import LineFramer
+
+# States
+RESTART          = 1
+RESET            = 2
+MQTTOPENED       = 3
+MQTTNOTOPENED    = 4
+MQTTCLOSED       = 5
+MQTTCONNECTING   = 6
+MQTTCONNECTED    = 7
+MQTTNOTCONNECTED = 8
+
+# States that mean an MQTT step will not happen
+MQTTFAILED = (MQTTNOTOPENED, MQTTCLOSED, MQTTNOTCONNECTED)
+
+# What each model does differently. tcp is the MQTT connect id used, ledmode if it has qledmode,
+# prompt if a publish sends the message after the > prompt instead of on the command line, and apn the
+# command that sets the APN
+MODELS = {'Quectel_BC66':      {'tcp': 0, 'ledmode': False, 'prompt': False, 'apn': 'cgdcont=1,"IP","{}"'},
+          'Quectel_BC660K-GL': {'tcp': 1, 'ledmode': True,  'prompt': True,  'apn': 'qcgdefcont="IPV4V6","{}"'}}
+
+# When the model isn't known yet
+DEFAULT = 'Quectel_BC66'
+
+
+def delivered(result):
+    """
+    The check for a qmtpub Step, +QMTPUB: <TCP_connectID>,<msgID>,<result> with 0 sent, 1 sending again, 2 failed
+    :param result: bytes after the colon
+    :return: 'ok', 'error' or None while it's being sent again
+    """
+    try:
+        code = urc.number(result, 2)
+    except (ValueError, IndexError):
+        return 'error'
+
+    if code == 0:
+        return 'ok'
+    if code == 1:
+        return None
+    return 'error'
+
+
+def connection(result):
+    """
+    Read either form of +QMTCONN, the result of qmtconn <TCP_connectID>,<result>,<ret_code> with 0,0 for
+    connected, or the state qmtconn? asks for <TCP_connectID>,<state> with 3 for connected and 1, 2 connecting
+    :param result: bytes after the colon
+    :return: (connected, connecting)
+    """
+    code = urc.number(result, 1)
+    if urc.count(result) >= 3:
+        return code == 0 and urc.number(result, 2) == 0, False
+    return code == 3, code in (1, 2)
+
+
+@urc.handlers
+class Modem:
+    psm = False
+    brom = False
+    registered = False
+
+    ccid = None
+    imei = None
+    battery = None
+    clock = None
+    ip_address = None
+    last_command = None
+    state = None
+    modem_model = None
+
+    # A watchible.inbox.Router for messages on subscribed topics, they're printed without one
+    router = None
+
+    # Print each line read to debug, it copies every line out of the LineFramer
+    echo = False
+
+    def __init__(self, uart, reset, pwr_reset, sync=None, radio=None, recorder=None):
+        """
+        :param uart: the modem UART
+        :param reset: pin that resets the modem
+        :param pwr_reset: pin that powers it down and up
+        :param sync: watchible.sleepsync.SleepSync told when PSM starts and ends
+        :param radio: watchible.radio.Radio that keeps the signal
+        :param recorder: watchible.transcript.Recorder that keeps every line read
+        """
+        self.uart = uart
+        self.rx = LineFramer(uart)
+        self.reset_pin = reset
+        self.power_pin = pwr_reset
+        self.sync = sync
+        self.radio = radio
+        self.recorder = recorder
+
+    def capability(self, name):
+        """
+        What this model does, see MODELS
+        :param name: e.g. 'prompt'
+        :return: the value for the model, or for DEFAULT if the model isn't known
+        """
+        return MODELS.get(self.modem_model, MODELS[DEFAULT])[name]
+
+    def power_reset(self):
+        """
+        Power the modem down and up
+        """
+        self.power_pin.value(0)
+        time.sleep_ms(500)
+        self.power_pin.value(1)
+        time.sleep_ms(500)
+        self.power_pin.value(0)
+        self.reset_pin.value(0)
+        self.state = RESET
+
+    def reset(self):
+        """
+        Reset the modem without powering down
+        """
+        self.reset_pin.value(1)
+        time.sleep_ms(100)
+        self.reset_pin.value(0)
+        self.state = RESET
+
+    def ready(self, timeout=10000):
+        """
+        Read until the modem says RDY after a reset, so the reboot that was asked for isn't taken
+        for a crash later on
+        :param timeout: milliseconds to wait for it
+        :return: True if it came
+        """
+        start = time.ticks_ms()
+        while not self.brom and time.ticks_diff(time.ticks_ms(), start) < timeout:
+            self.reader()
+
+        ready, self.brom = self.brom, False
+        return ready
+
+    def at(self, command):
+        """
+        Send a formatted AT command
+        :param command: the command to send
+        :return: None
+        """
+        if not command.startswith('at'):
+            command = 'at+' + command
+        command = command + '\r\n'
+        self.uart.write(bytes(command, 'utf-8'))
+        self.last_command = command
+
+    def reader(self):
+        """
+        Read anything on the modem port
+        :return: memoryview of the line read, or None
+        """
+        data = self.rx.readline()
+        if data is None:
+            return None
+
+        if self.echo:
+            print(bytes(data))
+        if self.recorder:
+            self.recorder.record(data)
+
+        # The +XXX: lines go to their handlers first, so what's in a payload isn't taken for a result or a reboot
+        if urc.error(data) or urc.equals(data, b'OK'):
+            self.last_command = None
+
+        elif urc.startswith(data, b'+'):
+            urc.dispatch(self, data)
+
+        # A reboot occurred
+        elif urc.equals(data, b'RDY') or urc.contains(data, b'BROM'):
+            self.state = RESTART
+            self.brom = True
+
+        elif urc.contains(data, b'Quectel'):
+            self.modem_model = urc.text(data)
+        return data
+
+    def query(self, command, timeout=5000):
+        """
+        Send a command and read until the modem answers OK or ERROR
+        :param command: the command to send
+        :param timeout: milliseconds to wait for the answer
+        :return: True if it answered
+        """
+        self.at(command)
+        start = time.ticks_ms()
+        while self.last_command:
+            self.reader()
+            if time.ticks_diff(time.ticks_ms(), start) > timeout:
+                return False
+        return True
+
+    def wait(self, command):
+        """
+        Send a command and read until a line comes back
+        :param command: the command to send
+        :return: None
+        """
+        self.at(command)
+        while not self.reader():
+            pass
+
+    def CEREG(self, result):
+        """
+        Network registration eg +CEREG: 1,5 when asked with cereg?, +CEREG: 5 when it changes
+        :param result: bytes after the colon
+        """
+        try:
+            # If it's an unsolicited response it will be 1 element <stat>, asked for it's <n><stat>
+            fields = urc.count(result)
+            if fields == 1:
+                self.registered = urc.number(result, 0) in (1, 5)
+            elif fields >= 2:
+                self.registered = urc.number(result, 1) in (1, 5)
+
+        except ValueError as e:
+            print(f"ValueError:{e} for CEREG:{bytes(result)}")
+
+    def QCCID(self, result):
+        """
+        The ccid eg. +QCCID: 8988228066602759536
+        """
+        self.ccid = urc.text(result)
+
+    def CGSN(self, result):
+        """
+        The imei eg. +CGSN: 867997035586592
+        """
+        self.imei = urc.text(result)
+
+    def QMTOPEN(self, result):
+        """
+        Result of opening the MQTT channel eg. +QMTOPEN: 0,0
+        :param result: bytes after the colon
+        """
+        try:
+            if urc.number(result, 1) == 0:
+                self.state = MQTTOPENED
+            else:
+                self.state = MQTTNOTOPENED
+                print("Failed to open MQTT")
+
+        except ValueError as e:
+            print(f"ValueError:{e} for QMTOPEN:{bytes(result)}")
+
+    def QMTSTAT(self, result):
+        """
+        The MQTT connection changed eg. +QMTSTAT: <TCP_connectID>,<err_code> 1 to 6 means it's closed
+        :param result: bytes after the colon
+        """
+        try:
+            if urc.number(result, 1) > 0:
+                self.state = MQTTCLOSED
+
+        except ValueError as e:
+            print(f"ValueError:{e} for QMTSTAT:{bytes(result)}")
+
+    def QMTCLOSE(self, result):
+        """
+        Closed the MQTT connection (you can't go in PSM with it open) eg. +QMTCLOSE: 0,0
+        :param result: bytes after the colon
+        """
+        try:
+            if urc.number(result, 1) == 0:
+                self.state = MQTTCLOSED
+
+        except ValueError as e:
+            print(f"ValueError:{e} for QMTCLOSE:{bytes(result)}")
+
+    def QMTCONN(self, result):
+        """
+        The result of qmtconn, +QMTCONN: <TCP_connectID>,<result>,<ret_code> with 0 for connected,
+        or the state when asked with qmtconn?, +QMTCONN: <TCP_connectID>,<state> with 3 for connected
+        :param result: bytes after the colon
+        """
+        try:
+            connected, connecting = connection(result)
+            if connected:
+                self.state = MQTTCONNECTED
+            elif connecting:
+                self.state = MQTTCONNECTING
+            else:
+                self.state = MQTTNOTCONNECTED
+                print(f"Failed to connect: {bytes(result)}")
+
+        except ValueError as e:
+            print(f"ValueError:{e} for QMTCONN:{bytes(result)}")
+
+    def QMTRECV(self, result):
+        """
+        A message on a subscribed topic eg. +QMTRECV: 0,0,"device/status","it works"
+        If PSM sleeping this will not happen
+        :param result: bytes after the colon
+        """
+        try:
+            found, _, topic, payload = inbox.parse(result)
+        except (ValueError, IndexError) as e:
+            print(f"ValueError:{e} for QMTRECV:{bytes(result)}")
+            return
+
+        if found != inbox.MESSAGE:
+            return
+        if self.router:
+            self.router.dispatch(topic, payload)
+        else:
+            print(bytes(payload))
+
+    def CBC(self, result):
+        """
+        The battery level eg. +CBC: 0,0,3275
+        :param result: bytes after the colon
+        """
+        try:
+            self.battery = urc.text(result, 2)
+        except IndexError:
+            self.battery = urc.text(result, 0)
+
+    def CCLK(self, result):
+        """
+        The clock from the network eg. +CCLK: 2023/03/09,14:02:31GMT-5
+        """
+        self.clock = urc.text(result)
+
+    def CSQ(self, result):
+        """
+        Signal strength eg. +CSQ: 24,99
+        """
+        if self.radio:
+            self.radio.csq(result)
+
+    def CESQ(self, result):
+        """
+        Extended signal quality eg. +CESQ: 99,99,255,255,20,45
+        """
+        if self.radio:
+            self.radio.cesq(result)
+
+    def QENG(self, result):
+        """
+        Serving cell eg. +QENG: 0,2506,2,65,"0D43E68",-67,-4,-63,20,5,"3A98",0,,2
+        """
+        if self.radio:
+            self.radio.qeng(result)
+
+    def QNBIOTEVENT(self, result):
+        """
+        PSM events, +QNBIOTEVENT: "ENTER PSM" or "EXIT PSM"
+        """
+        if urc.contains(result, b'ENTER PSM'):
+            self.psm = True
+            if self.sync:
+                self.sync.enter()
+
+        elif urc.contains(result, b'EXIT PSM'):
+            self.psm = False
+            if self.sync:
+                self.sync.exit()
+
+    def IP(self, result):
+        """
+        IP address eg. +IP: 10.214.117.36
+        """
+        ip_address = urc.text(result)
+        if len(ip_address.split('.')) == 4:
+            self.ip_address = ip_address
+
+    def CGDCONT(self, result):
+        """
+        PDP context eg. +CGDCONT: 1,"IPV4V6","iot.nb","30.2.17.172",0,0,0,,,,,,0,,0
+        :param result: bytes after the colon
+        """
+        try:
+            ip_address = urc.text(result, 3)
+            if len(ip_address.split('.')) == 4:
+                self.ip_address = ip_address
+        except IndexError:
+            pass
@@ -0,0 +1,119 @@
+"""
+Reports that haven't been published yet, kept in flash so they survive a failed connect or a reboot.
+
+Each report is appended as one line to /outbox.txt, and how far it has been published is kept in
+/outbox.pos. Nothing already written is rewritten until the file would grow past LIMIT, then the
+published lines and, if need be, the oldest are dropped. Once everything is published both files are removed.
+
+    outbox.put(report)
+    for end, message in outbox.pending():
+        ... publish message ...
+    outbox.sent(end)
+"""
+import os
+
+PATH = '/outbox.txt'
+MARK = '/outbox.pos'
+
+# Most bytes of reports to keep
+LIMIT = 8 * 1024
+
+
+class Outbox:
+    """
+    A queue of messages on flash
+    """
+
+    def __init__(self, path=PATH, mark=MARK, limit=LIMIT):
+        """
+        :param path: flash file the messages are appended to
+        :param mark: flash file that keeps the offset of the first message not sent
+        :param limit: most bytes to keep
+        """
+        self.path = path
+        self.mark = mark
+        self.limit = limit
+        try:
+            with open(mark) as f:
+                self.head = int(f.read())
+        except (OSError, ValueError):
+            self.head = 0
+
+    def size(self):
+        try:
+            return os.stat(self.path)[6]
+        except OSError:
+            return 0
+
+    def put(self, message):
+        """
+        Add a message to the end
+        :param message: str without a new line e.g. report()
+        :return: None
+        """
+        line = bytes(message, 'utf-8') + b'\n'
+        if self.size() + len(line) > self.limit:
+            self.compact(len(line))
+
+        with open(self.path, 'ab') as f:
+            f.write(line)
+
+    def pending(self):
+        """
+        The messages not sent yet, oldest first
+        :return: generator of (offset after the message, message)
+        """
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return
+
+        with f:
+            f.seek(self.head)
+            end = self.head
+            while line := f.readline():
+                end += len(line)
+                yield end, str(line[:-1], 'utf-8')
+
+    def sent(self, end):
+        """
+        Messages up to end were published
+        :param end: offset from pending()
+        :return: None
+        """
+        if end >= self.size():
+            self.clear()
+            return
+
+        self.head = end
+        with open(self.mark, 'w') as f:
+            f.write(str(end))
+
+    def clear(self):
+        for path in (self.path, self.mark):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.head = 0
+
+    def compact(self, room):
+        """
+        Rewrite the file with only the messages not sent, dropping the oldest until there is room
+        :param room: bytes needed for the next message
+        :return: None
+        """
+        lines = [bytes(message, 'utf-8') + b'\n' for _, message in self.pending()]
+        size = sum([len(line) for line in lines])
+        dropped = 0
+        while lines and size + room > self.limit:
+            size -= len(lines.pop(0))
+            dropped += 1
+
+        if dropped:
+            print(f"Outbox full, dropped {dropped} reports")
+
+        self.clear()
+        with open(self.path, 'wb') as f:
+            for line in lines:
+                f.write(line)
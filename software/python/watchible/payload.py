@@ -0,0 +1,310 @@
+"""
+A packed report, a few dozen bytes in place of the json text, for when every byte on the uplink costs.
+
+The first byte is the schema version and the next two a mask of the fields that follow, in FIELDS order,
+so a field that is None is left out. Numbers are big endian:
+
+    ccid, imei      B count of digits, then the digits two to a byte ( F pads an odd count )
+    timestamp       I seconds since 2000-01-01 from the modem clock, the zone is dropped
+    temperature     h hundredths of a degree C
+    volts           H battery millivolts as cbc reads it
+    alarm           B 1 if the water alarm is on
+    modem           B index in MODELS, 255 for one not in the list
+    samples         B count, then HhHB for each: minutes before it was packed, temperature, volts, alarm
+    alarms          HHHI times it went wet, minutes before the first and last time, seconds wet
+    rsrp            h dBm of the serving cell
+    snr             b dB
+    ecl             B coverage class, 0 to 2
+    energy          B count, then BI for each phase: index in PHASES, milliseconds, then HH millivolts at
+                    the start and end of the wake. The total is the sum, a phase not in PHASES is left out
+
+Schema 1 had a one byte mask and no alarms, unpack() still reads it. Schema 3 added energy, what the
+profiler in watchible.energy found. Fields are only ever added at the end, so a new one fits in the
+same mask and older reports unpack the same.
+
+The packed bytes go out as base64 text, it has no quotes for qmtpub and no Cntrl Z for the > prompt.
+unpack() and parse() are the other way, and run on a PC for the backend.
+"""
+import struct
+import binascii
+
+SCHEMA = 3
+
+# The mask for each schema
+MASKS = {1: 'B', 2: '>H', 3: '>H'}
+
+FIELDS = ('ccid', 'imei', 'timestamp', 'temperature', 'volts', 'alarm', 'modem', 'samples', 'alarms',
+          'rsrp', 'snr', 'ecl', 'energy')
+
+# The phases of watchible.energy, in the order they're packed as
+PHASES = ('commands', 'reset', 'register', 'open', 'connect', 'publish', 'close', 'psm', 'certs')
+
+MODELS = ('Quectel_BC66', 'Quectel_BC660K-GL')
+OTHER = 255
+
+# What a sample temperature or volts that was None packs as
+NO_TEMPERATURE = -32768
+NO_VOLTS = 0
+NO_TIME = 65535
+
+SAMPLE = '>HhHB'
+ALARMS = '>HHHI'
+PHASE = '>BI'
+
+
+def days(year, month, day):
+    """
+    Days since 2000-01-01
+    """
+    year -= month <= 2
+    era = year // 400
+    years = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    return era * 146097 + years * 365 + years // 4 - years // 100 + day_of_year - 730425
+
+
+def seconds(clock):
+    """
+    Seconds since 2000-01-01 from a clock str
+    :param clock: e.g. 2023/03/09,14:02:31GMT-5 from cclk, or 2023-03-09 14:02:31 from time_str()
+    :return: int, or None if it isn't a time
+    """
+    numbers = []
+    digits = ''
+    for c in clock + ' ':
+        if '0' <= c <= '9':
+            digits += c
+        elif digits:
+            numbers.append(int(digits))
+            digits = ''
+            if len(numbers) == 6:
+                break
+
+    if len(numbers) < 6:
+        return None
+
+    year, month, day, hour, minute, second = numbers
+    if year < 100:
+        year += 2000
+    return days(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+
+
+def centi(value, none):
+    """
+    A number, or a str of one, in hundredths
+    """
+    try:
+        return int(round(float(value) * 100))
+    except (TypeError, ValueError):
+        return none
+
+
+def milli(value, none):
+    """
+    Battery millivolts, as the str cbc reads
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return none
+
+
+def minutes(now, when):
+    """
+    Minutes from when to now, as an H
+    """
+    if when is None:
+        return NO_TIME
+    return min(int(max(now - when, 0) // 60), NO_TIME - 1)
+
+
+def pack(fields, now):
+    """
+    Pack a report
+    :param fields: dict with any of FIELDS, e.g. what goes to json.dumps
+    :param now: utime.time() when packed, the samples are timed back from it
+    :return: bytes
+    """
+    mask = 0
+    data = b''
+    for bit, name in enumerate(FIELDS):
+        value = fields.get(name)
+        if value is None:
+            continue
+
+        try:
+            if name in ('ccid', 'imei'):
+                text = value if len(value) % 2 == 0 else value + 'F'
+                packed = bytes([len(value)]) + binascii.unhexlify(text)
+
+            elif name == 'timestamp':
+                value = seconds(value)
+                if value is None:
+                    continue
+                packed = struct.pack('>I', value)
+
+            elif name == 'temperature':
+                packed = struct.pack('>h', centi(value, NO_TEMPERATURE))
+
+            elif name == 'volts':
+                value = milli(value, None)
+                if value is None:
+                    continue
+                packed = struct.pack('>H', value)
+
+            elif name == 'alarm':
+                packed = bytes([1 if value else 0])
+
+            elif name == 'modem':
+                packed = bytes([MODELS.index(value) if value in MODELS else OTHER])
+
+            elif name == 'alarms':
+                packed = struct.pack(ALARMS,
+                                     min(value['count'], 65535),
+                                     minutes(now, value['first']),
+                                     minutes(now, value['last']),
+                                     value['wet'])
+
+            elif name == 'rsrp':
+                packed = struct.pack('>h', value)
+
+            elif name == 'snr':
+                packed = struct.pack('b', max(min(value, 127), -128))
+
+            elif name == 'ecl':
+                packed = bytes([value])
+
+            elif name == 'energy':
+                phases = [(PHASES.index(phase), ms) for phase, ms in value['ms'].items() if phase in PHASES]
+                packed = bytes([len(phases)])
+                for phase, ms in phases:
+                    packed += struct.pack(PHASE, phase, ms)
+                start, end = value['mv']
+                packed += struct.pack('>HH', milli(start, NO_VOLTS), milli(end, NO_VOLTS))
+
+            else:
+                packed = bytes([min(len(value), 255)])
+                for when, temperature, volts, alarm in value[-255:]:
+                    packed += struct.pack(SAMPLE,
+                                          minutes(now, when),
+                                          centi(temperature, NO_TEMPERATURE),
+                                          milli(volts, NO_VOLTS),
+                                          1 if alarm else 0)
+
+        except (ValueError, KeyError, struct.error) as e:
+            print(f"ValueError:{e} packing {name}:{value}")
+            continue
+
+        mask |= 1 << bit
+        data += packed
+
+    return bytes([SCHEMA]) + struct.pack(MASKS[SCHEMA], mask) + data
+
+
+def text(data):
+    """
+    Packed bytes as base64 text for qmtpub
+    """
+    return str(binascii.b2a_base64(data), 'utf-8').strip()
+
+
+def unpack(data):
+    """
+    Unpack a report
+    :param data: bytes from pack()
+    :return: dict of the fields sent. timestamp is seconds since 2000-01-01, temperature and volts
+             are numbers, each sample is [minutes before, temperature, volts, alarm] and the alarms
+             first and last are minutes before
+    """
+    if data[0] not in MASKS:
+        raise ValueError(f"schema {data[0]} is not one of {list(MASKS)}")
+
+    mask = struct.unpack_from(MASKS[data[0]], data, 1)[0]
+    index = 1 + struct.calcsize(MASKS[data[0]])
+    fields = {}
+    for bit, name in enumerate(FIELDS):
+        if not mask & (1 << bit):
+            continue
+
+        if name in ('ccid', 'imei'):
+            count = data[index]
+            size = (count + 1) // 2
+            value = str(binascii.hexlify(data[index + 1:index + 1 + size]), 'utf-8').upper()[:count]
+            index += 1 + size
+
+        elif name == 'timestamp':
+            value = struct.unpack_from('>I', data, index)[0]
+            index += 4
+
+        elif name == 'temperature':
+            value = struct.unpack_from('>h', data, index)[0]
+            value = None if value == NO_TEMPERATURE else value / 100
+            index += 2
+
+        elif name == 'volts':
+            value = struct.unpack_from('>H', data, index)[0]
+            index += 2
+
+        elif name == 'alarm':
+            value = bool(data[index])
+            index += 1
+
+        elif name == 'modem':
+            value = MODELS[data[index]] if data[index] < len(MODELS) else None
+            index += 1
+
+        elif name == 'alarms':
+            count, first, last, wet = struct.unpack_from(ALARMS, data, index)
+            value = {'count': count,
+                     'first': None if first == NO_TIME else first,
+                     'last': None if last == NO_TIME else last,
+                     'wet': wet}
+            index += struct.calcsize(ALARMS)
+
+        elif name == 'rsrp':
+            value = struct.unpack_from('>h', data, index)[0]
+            index += 2
+
+        elif name == 'snr':
+            value = struct.unpack_from('b', data, index)[0]
+            index += 1
+
+        elif name == 'ecl':
+            value = data[index]
+            index += 1
+
+        elif name == 'energy':
+            ms = {}
+            size = struct.calcsize(PHASE)
+            for _ in range(data[index]):
+                phase, took = struct.unpack_from(PHASE, data, index + 1)
+                ms[PHASES[phase] if phase < len(PHASES) else str(phase)] = took
+                index += size
+            start, end = struct.unpack_from('>HH', data, index + 1)
+            value = {'ms': ms, 'total': sum(ms.values()),
+                     'mv': [None if start == NO_VOLTS else start, None if end == NO_VOLTS else end]}
+            index += 5
+
+        else:
+            value = []
+            size = struct.calcsize(SAMPLE)
+            for _ in range(data[index]):
+                minutes, temperature, volts, alarm = struct.unpack_from(SAMPLE, data, index + 1)
+                value.append([minutes,
+                              None if temperature == NO_TEMPERATURE else temperature / 100,
+                              None if volts == NO_VOLTS else volts,
+                              bool(alarm)])
+                index += size
+            index += 1
+
+        fields[name] = value
+    return fields
+
+
+def parse(message):
+    """
+    Unpack a report as it came off the broker
+    :param message: the base64 text, str or bytes
+    :return: dict, see unpack()
+    """
+    return unpack(binascii.a2b_base64(message))
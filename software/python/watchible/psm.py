@@ -0,0 +1,114 @@
+"""
+Pick the PSM timers each round instead of hard coding the cpsms bit strings.
+
+T3412 is how long the modem sleeps between reports and T3324 how long it stays reachable after one.
+Both go to cpsms as 8 bit strings, 3 bits of unit then 5 bits of value (3GPP 24.008 GPRS timer 3 and 2).
+The sleep is the SLA when the site is quiet or the battery is low, and shorter the more alarms there
+were in the last ROUNDS rounds, down to BUSY. The Pico sleeps for the same period so they stay in step.
+
+    schedule = Schedule()
+    schedule.update(bc66.battery, alarms)
+    bc66.at(schedule.cpsms())
+    ... lightsleep until schedule.period ...
+"""
+
+# Longest time between reports, seconds
+SLA = 12 * 3600
+
+# Shortest time between reports when the alarm keeps going off
+BUSY = 3600
+
+# How long the modem stays reachable after a report, seconds
+ACTIVE = 60
+
+# Battery millivolts below which reports aren't sped up
+LOW_BATTERY = 3300
+
+# Rounds of alarms to remember
+ROUNDS = 4
+
+# T3412 units, bits 8-6 and seconds for each
+T3412 = ((0b011, 2), (0b100, 30), (0b101, 60), (0b000, 600), (0b001, 3600), (0b010, 36000), (0b110, 1152000))
+
+# T3324 units
+T3324 = ((0b000, 2), (0b001, 60), (0b010, 360))
+
+
+def encode(seconds, units):
+    """
+    The timer closest to seconds without going over
+    :param seconds: wanted
+    :param units: T3412 or T3324
+    :return: (bit string e.g. '00101100', seconds it is)
+    """
+    best = (units[0][0], 1, units[0][1])
+    for unit, size in units:
+        value = min(seconds // size, 31)
+        if value and value * size >= best[1] * best[2]:
+            best = (unit, value, size)
+
+    unit, value, size = best
+    return '{:03b}{:05b}'.format(unit, value), value * size
+
+
+def decode(bits, units):
+    """
+    Seconds in a timer bit string
+    :param bits: e.g. '00101100'
+    :param units: T3412 or T3324
+    :return: seconds, or None if deactivated
+    """
+    unit = int(bits[:3], 2)
+    for code, size in units:
+        if code == unit:
+            return int(bits[3:], 2) * size
+    return None
+
+
+class Schedule:
+    """
+    The PSM timers for the next sleep
+    """
+
+    def __init__(self, sla=SLA, busy=BUSY, active=ACTIVE, low_battery=LOW_BATTERY, rounds=ROUNDS):
+        """
+        :param sla: longest seconds between reports
+        :param busy: shortest seconds between reports
+        :param active: seconds to stay reachable after a report
+        :param low_battery: millivolts below which reports aren't sped up
+        :param rounds: rounds of alarms to remember
+        """
+        self.sla = sla
+        self.busy = busy
+        self.active = active
+        self.low_battery = low_battery
+        self.rounds = rounds
+        self.alarms = []
+        self.update(None, 0)
+
+    def update(self, battery, alarms):
+        """
+        Work out the timers for this round
+        :param battery: millivolts as cbc reads it, str or int
+        :param alarms: times the alarm went off since the last round
+        :return: None
+        """
+        self.alarms = (self.alarms + [alarms])[-self.rounds:]
+
+        try:
+            low = int(battery) < self.low_battery
+        except (TypeError, ValueError):
+            low = False
+
+        wanted = self.sla
+        if not low and sum(self.alarms):
+            wanted = max(self.busy, self.sla // (1 + sum(self.alarms)))
+
+        self.t3412, self.period = encode(wanted, T3412)
+        self.t3324, self.awake = encode(self.active, T3324)
+
+    def cpsms(self):
+        """
+        The command to set the timers
+        """
+        return f'cpsms=1,,,"{self.t3412}","{self.t3324}"'
@@ -0,0 +1,126 @@
+"""
+How good the signal is, from +CSQ, +CESQ and +QENG, and whether a report should wait for a better one.
+
+At the edge of coverage the modem moves to ECL 1 or 2 and repeats everything it sends, up to many
+times, so a report costs many times the energy. defer() says to put a report off while RSRP, SNR or
+the coverage class are past the limits below, unless it's an alarm or DEFER_MAX have been put off already.
+
+    bc66.at('qeng=0')          -> QENG(self, result): radio.qeng(result)
+    if radio.defer(alarm.set):
+        ... keep the report for next time ...
+"""
+from watchible import urc
+
+# Reports wait for better than these, alarms never wait
+RSRP_MIN = -115     # dBm
+SNR_MIN = -3        # dB
+ECL_MAX = 1         # Coverage class, 2 is the most repetitions
+
+# Reports put off in a row before one goes anyway
+DEFER_MAX = 3
+
+# What CSQ, CESQ and QENG fields say when they don't know
+UNKNOWN = (99, 255)
+
+
+class Radio:
+    """
+    The last signal the modem reported
+    """
+
+    def __init__(self, rsrp_min=RSRP_MIN, snr_min=SNR_MIN, ecl_max=ECL_MAX, defer_max=DEFER_MAX):
+        """
+        :param rsrp_min: dBm below which reports wait
+        :param snr_min: dB below which reports wait
+        :param ecl_max: coverage class above which reports wait
+        :param defer_max: most reports to put off in a row
+        """
+        self.rsrp_min = rsrp_min
+        self.snr_min = snr_min
+        self.ecl_max = ecl_max
+        self.defer_max = defer_max
+        self.deferred = 0
+        self.clear()
+
+    def clear(self):
+        """
+        Forget the last reading, e.g. before asking for a new one
+        :return: None
+        """
+        self.rssi = None        # dBm
+        self.rsrp = None        # dBm
+        self.rsrq = None        # dB
+        self.snr = None         # dB
+        self.ecl = None         # 0, 1 or 2
+
+    def csq(self, result):
+        """
+        +CSQ: <rssi>,<ber> with rssi 0 to 31 for -113 to -51 dBm
+        :param result: bytes after the colon
+        :return: None
+        """
+        try:
+            rssi = urc.number(result, 0)
+            if rssi not in UNKNOWN:
+                self.rssi = -113 + 2 * rssi
+        except ValueError as e:
+            print(f"ValueError:{e} for CSQ:{bytes(result)}")
+
+    def cesq(self, result):
+        """
+        +CESQ: <rxlev>,<ber>,<rscp>,<ecno>,<rsrq>,<rsrp> with rsrq 0 to 34 for -20 to -3 dB
+        and rsrp 0 to 97 for -140 to -44 dBm
+        :param result: bytes after the colon
+        :return: None
+        """
+        try:
+            rsrq = urc.number(result, 4)
+            rsrp = urc.number(result, 5)
+            if rsrq not in UNKNOWN:
+                self.rsrq = -20 + rsrq // 2
+            if rsrp not in UNKNOWN:
+                self.rsrp = -141 + rsrp
+        except (ValueError, IndexError) as e:
+            print(f"ValueError:{e} for CESQ:{bytes(result)}")
+
+    def qeng(self, result):
+        """
+        +QENG: 0,<earfcn>,<offset>,<pci>,<cellID>,<rsrp>,<rsrq>,<rssi>,<sinr>,<band>,<tac>,<ecl>,...
+        in dBm and dB e.g. +QENG: 0,2506,2,65,"0D43E68",-67,-4,-63,20,5,"3A98",0,,2
+        Only the serving cell line, the one starting 0, is read
+        :param result: bytes after the colon
+        :return: None
+        """
+        try:
+            if urc.number(result, 0) != 0:
+                return
+
+            self.rsrp = urc.number(result, 5)
+            self.rsrq = urc.number(result, 6)
+            self.rssi = urc.number(result, 7)
+            self.snr = urc.number(result, 8)
+            self.ecl = urc.number(result, 11)
+        except (ValueError, IndexError) as e:
+            print(f"ValueError:{e} for QENG:{bytes(result)}")
+
+    def poor(self):
+        """
+        Is the signal past any of the limits, an unknown value is taken as good
+        :return: True if a report now would cost too much
+        """
+        return ((self.rsrp is not None and self.rsrp < self.rsrp_min) or
+                (self.snr is not None and self.snr < self.snr_min) or
+                (self.ecl is not None and self.ecl > self.ecl_max))
+
+    def defer(self, alarm=False):
+        """
+        Should the report wait for a better signal
+        :param alarm: alarms never wait
+        :return: True to put it off
+        """
+        if not alarm and self.poor() and self.deferred < self.defer_max:
+            self.deferred += 1
+            return True
+
+        self.deferred = 0
+        return False
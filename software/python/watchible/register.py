@@ -0,0 +1,58 @@
+"""
+Wait for the modem to register on the network from its +CEREG URCs instead of polling every few seconds.
+
+With cereg=1 the modem says when its registration changes. In between the UART is waited on with
+select.poll, so the Pico idles until a line comes. cereg? is sent once at the start, then again when
+nothing has said it's registered for POLL_MS in case a URC was missed, the wait doubling each time up to
+LONGEST_MS. After TIMEOUT_MS it gives up and the caller resets the modem.
+
+    bc66.at('cereg=1')
+    if not register.wait(bc66, modem):
+        ... reset the modem ...
+"""
+import time
+import uselect as select
+
+# Give up on registering after this
+TIMEOUT_MS = 600000
+
+# First quiet time before asking with cereg?, it doubles each time
+POLL_MS = 5000
+
+# Longest quiet time before asking
+LONGEST_MS = 60000
+
+
+def wait(bc66, uart, timeout_ms=TIMEOUT_MS, poll_ms=POLL_MS, longest_ms=LONGEST_MS):
+    """
+    Read the modem until it's registered
+    :param bc66: the modem, with registered, at(), reader() and brom
+    :param uart: the modem UART, to wait on
+    :param timeout_ms: give up after this
+    :param poll_ms: first quiet time before asking with cereg?
+    :param longest_ms: longest quiet time before asking
+    :return: True when registered, False if it timed out, None if the modem rebooted
+    """
+    poller = select.poll()
+    poller.register(uart, select.POLLIN)
+
+    start = time.ticks_ms()
+    ask = start
+    while not bc66.registered:
+        now = time.ticks_ms()
+        left = timeout_ms - time.ticks_diff(now, start)
+        if left <= 0:
+            print(f"Not registered after {timeout_ms} ms")
+            return False
+
+        if time.ticks_diff(ask, now) <= 0:
+            bc66.at('cereg?')
+            ask = time.ticks_add(now, poll_ms)
+            poll_ms = min(poll_ms * 2, longest_ms)
+
+        # Sleep until the modem says something or it's time to ask
+        poller.poll(min(time.ticks_diff(ask, now), left))
+        while bc66.reader() is not None:
+            if bc66.brom:
+                return None
+    return True
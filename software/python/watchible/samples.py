@@ -0,0 +1,53 @@
+"""
+Readings taken each time the Pico wakes from lightsleep, sent together in the next report.
+
+A connect costs the same with one reading or fifty, so the readings between connects go out as one
+list of [time, temperature, volts, alarm] rows instead of being lost.
+
+    samples = Samples()
+    samples.add(utime.time(), temperature(), battery(), alarm)
+    ... 'samples': samples.rows ...
+    samples.clear()
+"""
+
+# Most readings kept, the oldest is dropped after that
+SIZE = 24
+
+
+class Samples:
+    """
+    The readings since the last report
+    """
+
+    def __init__(self, size=SIZE):
+        """
+        :param size: most readings to keep
+        """
+        self.size = size
+        self.rows = []
+
+    def add(self, when, temperature, volts, alarm):
+        """
+        Keep a reading
+        :param when: seconds e.g. utime.time()
+        :param temperature: degrees C as a str or float
+        :param volts: battery millivolts read then, the modem is in PSM so not with cbc
+        :param alarm: True if the water alarm is on
+        :return: None
+        """
+        if len(self.rows) >= self.size:
+            self.rows.pop(0)
+
+        try:
+            temperature = round(float(temperature), 1)
+        except (TypeError, ValueError):
+            temperature = None
+
+        self.rows.append([when, temperature, volts, 1 if alarm else 0])
+
+    def clear(self):
+        """
+        The readings were reported
+        :return: None
+        """
+        self.rows = []
@@ -0,0 +1,304 @@
+"""
+Run a list of AT commands, declared as Steps, against a BC66 with at() and reader().
+
+Steps that don't depend on anything are sent together on one command line, AT+CCLK?;+QCCID;+CBC,
+so the modem answers them in one go with a single OK. A step that needs the modem in a state, e.g.
+qmtconn needs MQTTOPENED, waits for it while reading, and is skipped if a failure state comes instead.
+A step that expects a URC after the OK, e.g. +QMTPUB for qmtpub, is only 'ok' once that says so.
+The time each step took is kept so the slow ones can be found.
+"""
+import time
+
+from watchible import certs, urc
+
+# Longest command line to build when joining steps
+LINE = 256
+
+# Cntrl Z ends data written after the > prompt
+CTRL_Z = bytes([26])
+
+
+class Step:
+    """
+    One AT command in a sequence
+    """
+
+    def __init__(self, command, needs=None, fails=(), data=None, file=None, expect=None, check=None, alone=False,
+                 timeout=60000):
+        """
+        :param command: the command without the at+, or a function that returns it when it is sent
+        :param needs: state the modem has to be in before this is sent
+        :param fails: states that mean needs will not happen, the step is skipped
+        :param data: bytes or str to write at the > prompt, or a function that returns them
+        :param file: a file to send at the > prompt e.g. a cert
+        :param expect: a URC that has to follow the OK e.g. b'+QMTPUB'
+        :param check: function(bytes after the colon of expect) that returns 'ok', 'error' or None to keep waiting,
+                      any expect is 'ok' without it
+        :param alone: don't put it on a line with other commands, implied by all of the above
+        :param timeout: milliseconds to wait for needs and then for the answer
+        """
+        self.command = command
+        self.needs = needs
+        self.fails = fails
+        self.data = data
+        self.file = file
+        self.expect = expect
+        self.check = check
+        self.alone = (alone or callable(command) or needs is not None or data is not None or file is not None or
+                      expect is not None)
+        self.timeout = timeout
+
+        self.sent = None        # The command as it was sent
+        self.result = None      # 'ok', 'error', 'skipped' or 'timeout'
+        self.wait_ms = 0        # Time waiting for needs
+        self.ms = 0             # Time from sending to the answer
+
+    def text(self):
+        return self.command() if callable(self.command) else self.command
+
+    def answer(self):
+        """
+        The line the modem answers the command with when it has one, e.g. b'+CCLK:' for cclk?
+        :return: bytes, only good once sent
+        """
+        name = self.sent
+        for end in '=?':
+            name = name.split(end)[0]
+        return b'+' + name.upper().encode() + b':'
+
+    def query(self):
+        """
+        Whether it only asks, e.g. cclk? or cbc, so sending it again changes nothing
+        :return: bool, only good once sent
+        """
+        return self.expect is None and ('=' not in self.sent or self.sent.endswith('?'))
+
+    def reset(self):
+        """
+        Forget the last run
+        :return: None
+        """
+        self.sent = None
+        self.result = None
+        self.wait_ms = 0
+        self.ms = 0
+
+
+class Sequencer:
+    """
+    Runs the steps in order
+    """
+
+    def __init__(self, bc66, uart, steps):
+        """
+        :param bc66: the modem, with at(), reader(), state and brom
+        :param uart: the modem UART, to write prompt data to
+        :param steps: list of Step
+        """
+        self.bc66 = bc66
+        self.uart = uart
+        self.steps = steps
+
+    def run(self):
+        """
+        Send all the steps
+        :return: True when done, False if the modem rebooted part way
+        """
+        for step in self.steps:
+            step.reset()
+
+        index = 0
+        while index < len(self.steps):
+            batch = self.batch(index)
+            index += len(batch)
+
+            step = batch[0]
+            if step.needs is not None:
+                start = time.ticks_ms()
+                ready = self.wait(step)
+                step.wait_ms = time.ticks_diff(time.ticks_ms(), start)
+                if ready is None:
+                    return False
+
+                if not ready:
+                    step.result = 'skipped'
+                    continue
+
+            result = self.send(batch)
+            if result is None:
+                return False
+
+            if result == 'error' and len(batch) > 1 and self.retry(batch) is None:
+                return False
+        return True
+
+    def retry(self, batch):
+        """
+        Find the step on a batched line the modem stopped at with an error, and send the ones after it.
+        The first query that didn't answer is sent again alone, it changes nothing. If it fails again the
+        modem stopped there, so the steps before it ran. If not, it stopped at one of the steps before it,
+        and those go one at a time.
+        :param batch: list of Step sent together
+        :return: True, None if the modem rebooted
+        """
+        rest = [step for step in batch if step.result != 'ok']
+        for n, step in enumerate(rest):
+            if step.query():
+                result = self.send([step])
+                if result is None:
+                    return None
+
+                if result == 'error':
+                    for ran in rest[:n]:
+                        ran.result = 'ok'
+                    rest = rest[n + 1:]
+                else:
+                    rest = rest[:n] + rest[n + 1:]
+                break
+
+        for step in rest:
+            if self.send([step]) is None:
+                return None
+        return True
+
+    def batch(self, index):
+        """
+        The steps from index that can go on one command line
+        :param index: first step
+        :return: list of Step
+        """
+        batch = [self.steps[index]]
+        if batch[0].alone:
+            return batch
+
+        length = len(batch[0].command)
+        for step in self.steps[index + 1:]:
+            if step.alone:
+                break
+
+            length += len(step.command) + 2
+            if length > LINE:
+                break
+            batch.append(step)
+        return batch
+
+    def send(self, batch):
+        """
+        Send the steps on one line and wait for the answer. The modem stops at the first command that fails,
+        so on an error the steps before the last one that answered are 'ok' and the rest 'error'.
+        A step's time runs from begin() to its +NAME: answer, or to the OK for the step begun last. Steps on
+        the line that answer with nothing are in the time of the step after them, and take 0 ms.
+        :param batch: list of Step
+        :return: 'ok', 'error' or 'timeout', None if the modem rebooted
+        """
+        for step in batch:
+            step.sent = step.text()
+            step.ms = 0
+
+        step = batch[0]
+        start = time.ticks_ms()
+        since = start
+        ok = False
+        result = None
+        answered = 0
+        self.bc66.at(';+'.join([s.sent for s in batch]))
+        while time.ticks_diff(time.ticks_ms(), start) < step.timeout:
+            line = self.bc66.reader()
+            if self.bc66.brom:
+                return None
+
+            if line is None:
+                continue
+
+            if urc.startswith(line, b'>'):
+                self.prompt(step)
+
+            elif urc.error(line):
+                result = 'error'
+                break
+
+            elif urc.equals(line, b'OK'):
+                ok = True
+
+            elif step.expect and urc.startswith(line, step.expect):
+                after = line[len(step.expect) + 1:]
+                result = step.check(after) if step.check else 'ok'
+
+            elif len(batch) > 1 and urc.startswith(line, b'+'):
+                for n in range(answered, len(batch)):
+                    if urc.startswith(line, batch[n].answer()):
+                        now = time.ticks_ms()
+                        batch[n].ms = time.ticks_diff(now, since)
+                        since = now
+                        answered = n + 1
+                        if answered < len(batch):
+                            self.begin(batch[answered])
+                        break
+
+            # Done with the OK, and the URC that follows it if one is expected
+            if ok and (step.expect is None or result):
+                result = result or 'ok'
+                break
+        else:
+            result = 'timeout'
+
+        if answered < len(batch):
+            batch[answered].ms = time.ticks_diff(time.ticks_ms(), since)
+        for n, step in enumerate(batch):
+            step.result = 'ok' if result == 'error' and n < answered else result
+        return result
+
+    def begin(self, step):
+        """
+        The modem has answered the steps before this one on a batched line and is on to it. Nothing to do here,
+        it's where a profiler hooks on
+        :param step: Step
+        :return: None
+        """
+        pass
+
+    def prompt(self, step):
+        """
+        Write the data for a step at the > prompt, then Cntrl Z
+        :param step: Step
+        :return: None
+        """
+        if step.file:
+            certs.send_file(self.uart, step.file)
+
+        elif step.data is not None:
+            data = step.data() if callable(step.data) else step.data
+            self.uart.write(data)
+
+        self.uart.write(CTRL_Z)
+
+    def wait(self, step):
+        """
+        Read from the modem until the state a step needs
+        :param step: Step
+        :return: True if the state came, False if a failure state came or it timed out, None if the modem rebooted
+        """
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < step.timeout:
+            if self.bc66.state == step.needs:
+                return True
+
+            if self.bc66.state in step.fails:
+                return False
+
+            self.bc66.reader()
+            if self.bc66.brom:
+                return None
+        return False
+
+    def report(self):
+        """
+        Print how long each step took
+        :return: list of (command, wait ms, ms, result)
+        """
+        timings = []
+        for step in self.steps:
+            command = step.sent or (step.command if isinstance(step.command, str) else '')
+            timings.append((command, step.wait_ms, step.ms, step.result))
+            print(f"{step.result or 'not sent':8} wait {step.wait_ms:6} ms  took {step.ms:6} ms  {command[:48]}")
+        return timings
@@ -0,0 +1,94 @@
+"""
+Time the Pico's lightsleep from the modem's own PSM events instead of a fixed guess.
+
++QNBIOTEVENT: "ENTER PSM" is timed with ticks_ms(). The modem leaves PSM when T3412 runs out, which is
+T3412 - T3324 after it went in, by the network's clock. When "EXIT PSM" comes the time it really took
+is compared with that, and the ratio between the two clocks and how far off the guess was are both
+averaged over the rounds. remaining_ms() is then the time to sleep to wake GUARD_MS plus twice the usual
+error before the modem does.
+
+    sync.expect((t3412 - t3324) * 1000)
+    ... +QNBIOTEVENT: "ENTER PSM" -> sync.enter() ...
+    machine.lightsleep(sync.remaining_ms())
+    ... +QNBIOTEVENT: "EXIT PSM" -> sync.exit() ...
+"""
+import time
+
+# Least time to wake before the modem does
+GUARD_MS = 30000
+
+# How much each round moves the averages
+WEIGHT = 0.25
+
+# A round further off than this, e.g. the modem was woken by PSM_EINT, isn't learned from
+SANE = 0.2
+
+
+class SleepSync:
+    """
+    When the modem will leave PSM, by the Pico's clock
+    """
+
+    def __init__(self, guard_ms=GUARD_MS, weight=WEIGHT):
+        """
+        :param guard_ms: least milliseconds to wake before the modem
+        :param weight: 0 to 1, how much a new round counts
+        """
+        self.guard_ms = guard_ms
+        self.weight = weight
+        self.expected = None    # Modem ms from ENTER PSM to EXIT PSM
+        self.entered = None     # ticks_ms() of ENTER PSM
+        self.ratio = 1.0        # Pico ms for each network ms
+        self.error = 0          # Usual ms the guess was off by
+
+    def expect(self, ms):
+        """
+        How long the modem was asked to stay in PSM
+        :param ms: T3412 - T3324 in milliseconds
+        :return: None
+        """
+        self.expected = ms
+
+    def enter(self):
+        """
+        The modem said ENTER PSM
+        :return: None
+        """
+        self.entered = time.ticks_ms()
+
+    def exit(self):
+        """
+        The modem said EXIT PSM, learn how long it really was
+        :return: None
+        """
+        if self.entered is None or not self.expected:
+            return
+
+        took = time.ticks_diff(time.ticks_ms(), self.entered)
+        self.entered = None
+        guess = self.expected * self.ratio
+        if abs(took - guess) > guess * SANE:
+            print(f"PSM took {took} ms not {int(guess)}, not learned")
+            return
+
+        self.ratio += (took / self.expected - self.ratio) * self.weight
+        self.error += (abs(took - guess) - self.error) * self.weight
+        print(f"PSM took {took} ms, guessed {int(guess)}, ratio {self.ratio:.5f}")
+
+    def forget(self):
+        """
+        Don't learn from this round, e.g. the alarm woke the modem early
+        :return: None
+        """
+        self.entered = None
+
+    def remaining_ms(self):
+        """
+        How long to sleep to wake just before the modem leaves PSM
+        :return: milliseconds, None if the modem hasn't said it entered PSM
+        """
+        if self.entered is None or not self.expected:
+            return None
+
+        wake = self.expected * self.ratio - self.guard_ms - 2 * self.error
+        return max(int(wake) - time.ticks_diff(time.ticks_ms(), self.entered), 0)
@@ -0,0 +1,77 @@
+"""
+Keep every line the modem sends in flash with the ticks_us() it was read at, to replay on a PC.
+
+Each line is written as the microseconds then the bytes as python shows them, e.g.
+
+    10234567 b'+CEREG: 1,5\\r\\n'
+
+so python/host/replay.py can feed a field capture back through the handlers at full speed. Lines are
+kept in RAM and appended FLUSH at a time, call flush() before sleeping. Recording stops at LIMIT bytes
+so it can't fill the flash. ticks_us() wraps every 2**30 microseconds, the replay allows for it.
+
+    recorder = Recorder()
+    ... in reader() ...
+    recorder.record(line)
+"""
+import os
+import time
+
+PATH = '/transcript.log'
+
+# Most bytes to write
+LIMIT = 64 * 1024
+
+# Lines kept before they're written
+FLUSH = 16
+
+
+class Recorder:
+    """
+    Modem lines to a flash file
+    """
+
+    def __init__(self, path=PATH, limit=LIMIT, flush=FLUSH):
+        """
+        :param path: flash file, appended to
+        :param limit: stop recording when it's this big
+        :param flush: lines to keep before writing
+        """
+        self.path = path
+        self.limit = limit
+        self.every = flush
+        self.lines = []
+        try:
+            self.size = os.stat(path)[6]
+        except OSError:
+            self.size = 0
+
+    def record(self, line):
+        """
+        Keep a line
+        :param line: bytes or memoryview as read from the UART
+        :return: None
+        """
+        if self.size >= self.limit:
+            return
+
+        text = '%d %r\n' % (time.ticks_us(), bytes(line))
+        self.lines.append(text)
+        self.size += len(text)
+        if len(self.lines) >= self.every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the lines kept so far
+        :return: None
+        """
+        if not self.lines:
+            return
+
+        try:
+            with open(self.path, 'a') as f:
+                for text in self.lines:
+                    f.write(text)
+        except OSError as e:
+            print(f"Error:{e} saving {self.path}")
+        self.lines = []
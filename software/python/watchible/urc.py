@@ -0,0 +1,263 @@
+"""
+Dispatch and parsing of the +XXX: lines the modem sends, straight from the bytes read off the UART.
+Nothing is decoded to str, and fields are found by index instead of split(), so handling a line
+allocates close to nothing on the Pico's heap. On MicroPython find(), count() and number() run as viper
+code from _fastint.
+"""
+from array import array
+
+try:
+    from watchible import _fastint
+except ImportError:
+    _fastint = None
+
+COLON = 58
+COMMA = 44
+QUOTE = 34
+MINUS = 45
+
+# Where _fastint.number() puts the number, so it needn't allocate one
+_value = array('i', [0])
+
+
+def handlers(cls):
+    """
+    Class decorator. Builds cls.URC once, when the class is created, mapping b'+NAME' to each upper case
+    handler method e.g. b'+CEREG' to CEREG(self, result)
+    :param cls: the modem class
+    :return: cls
+    """
+    table = {}
+    for name in dir(cls):
+        func = getattr(cls, name)
+        if name.isupper() and callable(func):
+            table[b'+' + name.encode()] = func
+    cls.URC = table
+    return cls
+
+
+def dispatch(obj, line):
+    """
+    Call the handler for a +XXX: line with the bytes after the colon
+    :param obj: instance of a class decorated with handlers()
+    :param line: bytes or memoryview of the whole line
+    :return: bytes: the +XXX part of the line whether or not there was a handler, None without a colon
+    """
+    colon = find(line, COLON)
+    if colon < 0:
+        return None
+
+    key = bytes(line[:colon])
+    func = obj.URC.get(key)
+    if func is not None:
+        func(obj, line[colon + 1:])
+    return key
+
+
+def find(buf, char, start=0):
+    """
+    Index of a byte in a buffer, memoryview does not have find()
+    :param buf: bytes, bytearray or memoryview
+    :param char: int: the byte to look for
+    :param start: where to start looking
+    :return: int: the index or -1
+    """
+    if _fastint:
+        return _fastint.find(buf, char, start)
+
+    for i in range(start, len(buf)):
+        if buf[i] == char:
+            return i
+    return -1
+
+
+def bounds(buf, n):
+    """
+    Where the nth comma separated field is, with spaces, quotes and the line end trimmed.
+    Commas inside quotes do not split fields.
+    :param buf: bytes after the colon e.g. b' 0,"IPV4V6","iot.nb"\r\n'
+    :param n: field index
+    :return: start, stop
+    """
+    end = len(buf)
+    start = 0
+    field = 0
+    quoted = False
+    i = 0
+    while i < end:
+        c = buf[i]
+        if c == QUOTE:
+            quoted = not quoted
+        elif c == COMMA and not quoted:
+            if field == n:
+                break
+            field += 1
+            start = i + 1
+        i += 1
+
+    if field != n:
+        raise IndexError(f"no field {n}")
+
+    while start < i and (buf[start] <= 32 or buf[start] == QUOTE):
+        start += 1
+    while i > start and (buf[i - 1] <= 32 or buf[i - 1] == QUOTE):
+        i -= 1
+    return start, i
+
+
+def count(buf):
+    """
+    Number of comma separated fields
+    :param buf: bytes after the colon
+    :return: int
+    """
+    if _fastint:
+        return _fastint.count(buf)
+
+    n = 1
+    quoted = False
+    for i in range(len(buf)):
+        c = buf[i]
+        if c == QUOTE:
+            quoted = not quoted
+        elif c == COMMA and not quoted:
+            n += 1
+    return n
+
+
+def field(buf, n=0):
+    """
+    The nth field as a slice of buf
+    :param buf: bytes after the colon
+    :param n: field index
+    :return: bytes or memoryview, whatever buf is
+    """
+    start, stop = bounds(buf, n)
+    return buf[start:stop]
+
+
+def number(buf, n=0):
+    """
+    The nth field as an int, without making a string first
+    :param buf: bytes after the colon
+    :param n: field index
+    :return: int
+    """
+    if _fastint:
+        found = _fastint.number(buf, n, _value)
+        if found == _fastint.FOUND:
+            return _value[0]
+        if found == _fastint.NO_FIELD:
+            raise IndexError(f"no field {n}")
+        raise ValueError(f"field {n} is not a number")
+
+    start, stop = bounds(buf, n)
+    sign = 1
+    if start < stop and buf[start] == MINUS:
+        sign = -1
+        start += 1
+
+    if start == stop:
+        raise ValueError(f"field {n} is not a number")
+
+    value = 0
+    for i in range(start, stop):
+        c = buf[i] - 48
+        if c < 0 or c > 9:
+            raise ValueError(f"field {n} is not a number")
+        value = value * 10 + c
+    return sign * value
+
+
+def text(buf, n=None):
+    """
+    The nth field, or everything, decoded to a str. Only for values that are kept
+    :param buf: bytes after the colon
+    :param n: field index, None for the whole thing
+    :return: str
+    """
+    if n is None:
+        start, stop = 0, len(buf)
+        while start < stop and buf[start] <= 32:
+            start += 1
+        while stop > start and buf[stop - 1] <= 32:
+            stop -= 1
+    else:
+        start, stop = bounds(buf, n)
+    return bytes(buf[start:stop]).decode('utf-8', 'ignore')
+
+
+def fields(buf):
+    """
+    All the fields decoded to a list of str, the way split(',') used to hand them to callbacks
+    :param buf: bytes after the colon
+    :return: list of str
+    """
+    return [text(buf, n) for n in range(count(buf))]
+
+
+def startswith(buf, prefix, start=0):
+    """
+    bytes.startswith() that also works on a memoryview
+    :param buf: bytes, bytearray or memoryview
+    :param prefix: bytes
+    :param start: where in buf to compare
+    :return: bool
+    """
+    if len(buf) - start < len(prefix):
+        return False
+    for i in range(len(prefix)):
+        if buf[start + i] != prefix[i]:
+            return False
+    return True
+
+
+def equals(buf, word):
+    """
+    Whether the whole line is word, give or take the line end e.g. b'OK\r\n', and the space the > prompt
+    leaves in front of the next line. Unlike contains() a payload that has OK in it isn't taken for one
+    :param buf: bytes, bytearray or memoryview of the line
+    :param word: bytes
+    :return: bool
+    """
+    start = skip(buf)
+    stop = len(buf)
+    while stop > start and buf[stop - 1] <= 32:
+        stop -= 1
+    return stop - start == len(word) and startswith(buf, word, start)
+
+
+def skip(buf):
+    """
+    Index of the first byte that isn't a space
+    :param buf: bytes, bytearray or memoryview of the line
+    :return: int, len(buf) if it's all spaces
+    """
+    start = 0
+    while start < len(buf) and buf[start] <= 32:
+        start += 1
+    return start
+
+
+def error(buf):
+    """
+    Whether the line is a final ERROR, +CME ERROR: <err> or +CMS ERROR: <err>
+    :param buf: bytes, bytearray or memoryview of the line
+    :return: bool
+    """
+    start = skip(buf)
+    return equals(buf, b'ERROR') or startswith(buf, b'+CME ERROR', start) or startswith(buf, b'+CMS ERROR', start)
+
+
+def contains(buf, sub):
+    """
+    The in operator for a memoryview
+    :param buf: bytes, bytearray or memoryview
+    :param sub: bytes
+    :return: bool
+    """
+    first = sub[0]
+    for i in range(len(buf) - len(sub) + 1):
+        if buf[i] == first and startswith(buf, sub, i):
+            return True
+    return False